@@ -38,14 +38,9 @@ logger.setLevel(logging.INFO)
 
 class AnthropicClaude3ConversationalAgent(ConversationalAgent):  
         
-    def build_prompt(self, context: str, user_input: str) -> str:        
-        prompt = super().build_prompt(context, user_input)
-
+    def get_prompt_values(self) -> dict:
         # insert a randomized version of <instructions></instructions> tags
-        randomized = f'random{random.randint(10000,99999)}'
-        prompt = prompt.replace('{randomized}', randomized)
-        
-        return prompt        
+        return {'randomized': f'random{random.randint(10000,99999)}'}
 
     def post_process_response(self, response: str) -> str:
         response = super().post_process_response(response)
@@ -0,0 +1,192 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""HedgedConversationalAgent sends hedged requests and falls back along an ordered chain of agents
+
+The primary agent is invoked first. If it has not answered after the hedge delay, a second
+(hedged) request is sent to the next agent in the chain - the first fallback, or the primary
+model again when no fallbacks are configured. The first successful completion wins, and the
+remaining requests are cancelled if they have not started. Requests that have already started
+cannot be cancelled: they run to completion in the background, and their cost is still
+recorded against the turn that issued them (see metering.finish_turn). If an agent fails, the
+next agent in the chain is invoked immediately.
+
+The hedge delay is either fixed, or derived from the p95 latency observed for the primary model.
+The latency of every successful request is recorded when it completes, including the requests
+that lost the race, so slow primary requests keep counting towards the p95. Response cache hits
+and streams stopped early by max_sentences are not recorded: their invocation_time is not the
+latency of a full model invocation.
+
+The response documents include 'model_id' (the model that answered) and 'hedged' (whether
+more than one request was sent).
+"""
+
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from bedrock_utils.executor import get_executor, run_in_executor
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_HEDGE_DELAY_MS = 2000
+MIN_LATENCY_SAMPLES = 20
+
+class LatencyTracker(object):
+    def __init__(self, max_samples: int = 200) -> None:
+        self._samples = {}
+        self._max_samples = max_samples
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, latency_ms: int) -> None:
+        if latency_ms is None:
+            return
+        with self._lock:
+            self._samples.setdefault(model_id, deque(maxlen=self._max_samples)).append(latency_ms)
+
+    def percentile(self, model_id: str, percentile: float) -> int:
+        with self._lock:
+            samples = sorted(self._samples.get(model_id, []))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(percentile / 100 * len(samples)) - 1)]
+
+LATENCY_TRACKER = LatencyTracker()
+
+def record_latency(model_id: str, future) -> None:
+    # called when a request completes, whether it won the race or not
+    if future.cancelled() or future.exception() is not None:
+        return
+    response = future.result() or {}
+    if response.get('cache_hit') or response.get('stopped_early'):
+        return
+    LATENCY_TRACKER.record(model_id, response.get('invocation_time'))
+
+
+class HedgedConversationalAgent(object):
+    def __init__(
+        self,
+        primary_agent,
+        fallback_agents: list = None,
+        hedge_delay_ms: int = None,
+        hedge_percentile: float = 95
+    ) -> None:
+        self._primary_agent = primary_agent
+        self._fallback_agents = fallback_agents if fallback_agents else []
+        self._hedge_delay_ms = hedge_delay_ms
+        self._hedge_percentile = hedge_percentile
+
+    @property
+    def agent_chain(self) -> list:
+        if self._fallback_agents:
+            return [self._primary_agent] + self._fallback_agents
+        return [self._primary_agent, self._primary_agent]
+
+    def hedge_delay(self) -> float:
+        """Returns the hedge delay in seconds"""
+        if self._hedge_delay_ms is not None:
+            return self._hedge_delay_ms / 1000
+        model_id = self._primary_agent.model_instance.model_id
+        delay_ms = LATENCY_TRACKER.percentile(model_id, self._hedge_percentile)
+        return (delay_ms if delay_ms is not None else DEFAULT_HEDGE_DELAY_MS) / 1000
+
+    def _hedge(self, method_name: str, *args) -> dict:
+        agents = self.agent_chain
+        executor = get_executor('hedged-requests')
+        pending = {}
+        errors = []
+        next_index = 0
+        hedge_delay = self.hedge_delay()
+
+        def submit():
+            nonlocal next_index
+            agent = agents[next_index]
+            next_index += 1
+            context = contextvars.copy_context()
+            future = executor.submit(context.run, getattr(agent, method_name), *args)
+            future.add_done_callback(lambda future, model_id=agent.model_instance.model_id: record_latency(model_id, future))
+            pending[future] = agent
+            if next_index > 1:
+                logger.info(f'<<{method_name}>> hedged request #{next_index} to {agent.model_instance.model_instance_name}')
+
+        submit()
+        while pending:
+            timeout = hedge_delay if next_index < len(agents) else None
+            done, _ = wait(pending.keys(), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                submit()
+                continue
+
+            for future in done:
+                agent = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    logger.warning(f'<<{method_name}>> {agent.model_instance.model_instance_name} failed: {e}')
+                    errors.append(e)
+                    if next_index < len(agents):
+                        submit()
+                    continue
+
+                for loser in pending:
+                    loser.cancel()
+
+                response['model_id'] = agent.model_instance.model_id
+                response['hedged'] = next_index > 1
+                return response
+
+        raise errors[0]
+
+    def generate_response(self, context: str, user_input: str) -> dict:
+        return self._hedge('generate_response', context, user_input)
+
+    def evaluate_response(self, question: str, answer: str, ground_truth: str) -> dict:
+        return self._hedge('evaluate_response', question, answer, ground_truth)
+
+    def compare_responses(self, question: str, document: str, response_1: str, response_2: str) -> dict:
+        return self._hedge('compare_responses', question, document, response_1, response_2)
+
+    def detect_hallucinations(self, question: str, answer: str, document: str) -> dict:
+        return self._hedge('detect_hallucinations', question, answer, document)
+
+    async def generate_response_async(self, context: str, user_input: str) -> dict:
+        return await run_in_executor(self.generate_response, context, user_input)
+
+    async def evaluate_response_async(self, question: str, answer: str, ground_truth: str) -> dict:
+        return await run_in_executor(self.evaluate_response, question, answer, ground_truth)
+
+    async def compare_responses_async(self, question: str, document: str, response_1: str, response_2: str) -> dict:
+        return await run_in_executor(self.compare_responses, question, document, response_1, response_2)
+
+    async def detect_hallucinations_async(self, question: str, answer: str, document: str) -> dict:
+        return await run_in_executor(self.detect_hallucinations, question, answer, document)
+
+    def __getattr__(self, name):
+        # any other attributes (prompts, model_instance, etc.) come from the primary agent
+        return getattr(self._primary_agent, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            super().__setattr__(name, value)
+        else:
+            # per-turn settings (context, guardrails, max_sentences) apply to the whole chain
+            for agent in set(self.agent_chain):
+                setattr(agent, name, value)
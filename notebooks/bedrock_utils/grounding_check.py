@@ -0,0 +1,506 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Local grounding pre-check for hallucination detection
+
+GroundingChecker extracts the checkable claims from an answer - prices, dates, times,
+numbers and proper names - and looks each one up in the retrieved context, after
+normalizing both sides (e.g. '$1,200.00' and '1200 dollars', 'March 3rd' and '3 March 2024',
+'two' and '2', '7 pm' and '7:00 PM', 'noon' and '12 pm'). Claims that also appear in the
+question are not counted either way, and an amount that is not in the context but can be
+derived from it (a context amount times a number from the question or answer, e.g. a
+nightly rate times the number of nights, or the sum of two context amounts) is neither
+supported nor unsupported.
+
+A price, date, time or number only counts as supported when it is in the context clause
+that best matches the terms around it in the answer, so 'check-out is at 3 PM' is not
+supported by 'check-in is at 3 PM and check-out is at 11 AM': the value is 'misplaced'.
+A clause of the answer whose best matching context clauses all differ from it in negation
+('pets are allowed' against 'pets are not allowed') is a negation mismatch. The answer then
+gets one of three verdicts:
+ - HALLUCINATED: the unsupported claims weigh at least FAIL_SCORE (a price, date or time
+   that is not in the context, or two numbers or names)
+ - CORRECT:      every claim supported, weighing at least PASS_SCORE, no negation mismatch,
+                 and at least PASS_COVERAGE of the answer's other terms found in the context
+                 or question
+ - UNCERTAIN:    anything else (including misplaced, derived and negated claims)
+
+ConversationalAgent.detect_hallucinations runs the check first when the agent has a
+grounding_checker (see bedrock_helpers, GROUNDING_CHECK=cascade), and only skips the LLM
+for the checker's local_verdicts - by default CORRECT alone, since a claim that is phrased
+differently in the context (e.g. 'half past ten') is reported as unsupported, so a local
+HALLUCINATED verdict is always confirmed by the LLM. A sample of the local decisions
+(sample_rate) is also sent to the LLM, whose verdict is then returned.
+
+Checks, local decisions, escalations and the agreement between the LLM result and the
+local verdict (whenever both are available) are recorded per detection model, and printed
+as CloudWatch EMF records (GROUNDING_METRICS=0 disables the records); get_grounding_stats()
+reports the escalation and agreement rates, per local verdict.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_right
+
+from bedrock_utils import metering
+from bedrock_utils.lexical import STOPWORDS, terms
+from bedrock_utils.retrieved_context import NO_MATCH_TEXT
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+EMIT_METRICS = os.environ.get('GROUNDING_METRICS', '1') == '1'
+
+# claim weights: a single price, date or time is decisive, numbers and names count half
+CLAIM_WEIGHTS = {'price': 1.0, 'date': 1.0, 'time': 1.0, 'number': 0.5, 'name': 0.5}
+FAIL_SCORE = 1.0
+# derived amounts: the largest factor (e.g. a number of nights or guests), and the most
+# context amounts for which sums of two are tried
+MAX_FACTOR = 31
+MAX_SUM_AMOUNTS = 50
+PASS_SCORE = 1.0
+PASS_COVERAGE = 0.8
+# the fewest shared terms for a context clause to contradict an answer clause by negation
+NEGATION_MIN_TERMS = 2
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+MONTH = (r'(?P<month{n}>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+         r'|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?')
+ORDINAL = r'(?:st|nd|rd|th)?'
+AMOUNT = r'\d[\d,]*(?:\.\d+)?'
+
+DATE = re.compile(
+    r'\b' + MONTH.format(n=1) + r'\s+(?P<day1>\d{1,2})' + ORDINAL + r'\b(?:,?\s+(?P<year1>\d{4})\b)?'
+    r'|\b(?P<day2>\d{1,2})' + ORDINAL + r'\s+(?:of\s+)?' + MONTH.format(n=2) + r'(?:,?\s+(?P<year2>\d{4})\b)?'
+    r'|\b(?P<year3>\d{4})-(?P<month3>\d{2})-(?P<day3>\d{2})\b'
+    r'|\b(?P<month4>\d{1,2})/(?P<day4>\d{1,2})/(?P<year4>\d{2,4})\b',
+    re.IGNORECASE)
+TIME = re.compile(r'\b(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<meridiem>[ap])\.?\s?m\b'
+                  r'|\b(?P<hour24>[01]?\d|2[0-3]):(?P<minute24>[0-5]\d)\b'
+                  r'|\b(?P<named>noon|midday|midnight)\b', re.IGNORECASE)
+NAMED_TIMES = {'noon': '12:00', 'midday': '12:00', 'midnight': '00:00'}
+PRICE = re.compile(r'(?:[$€£]|\b(?:usd|eur|gbp)\s?)\s?(?P<amount1>' + AMOUNT + r')'
+                   r'|(?P<amount2>' + AMOUNT + r')\s?(?:usd|eur|gbp|dollars?|euros?|pounds?)\b',
+                   re.IGNORECASE)
+NUMBER = re.compile(r'(?<![\w.,/:-])(?P<amount>' + AMOUNT + r')%?(?![\w/:-])')
+NAME = re.compile(r"\b[A-Z][\w'’&.-]*(?:\s+(?:of|the|and|&|de|la)?\s*[A-Z][\w'’&.-]*)*")
+SENTENCE_ENDS = '.!?:;-*•\n'
+# clause boundaries: sentence ends, list items, and commas or conjunctions between statements
+# (a comma before a digit is kept, for '$1,200' and 'June 16, 2025')
+CLAUSE_BREAK = re.compile(r'[.!?](?=\s|$)|[;\n•*]|,(?=\s+\D)|\s(?:and|but|while|whereas|although)\s', re.IGNORECASE)
+NEGATION = re.compile(r"\b(?:not|no|never|none|nor|cannot|without)\b|n['’]t\b", re.IGNORECASE)
+# the terms of a clause, keeping compounds such as 'check-in' and 'check-out' apart
+ANCHOR_TERM = re.compile(r"[a-z][a-z0-9]*(?:[-'’][a-z0-9]+)*", re.IGNORECASE)
+
+WORD_NUMBERS = {
+    'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5', 'six': '6', 'seven': '7',
+    'eight': '8', 'nine': '9', 'ten': '10', 'eleven': '11', 'twelve': '12', 'fifteen': '15',
+    'twenty': '20', 'thirty': '30', 'forty': '40', 'fifty': '50', 'hundred': '100'
+}
+WORD_NUMBER = re.compile(r'\b(' + '|'.join(WORD_NUMBERS) + r')\b', re.IGNORECASE)
+
+# capitalized words that are not names on their own
+COMMON_WORDS = frozenset((
+    'i yes no not please note however also additionally unfortunately sorry thank thanks hello hi '
+    'monday tuesday wednesday thursday friday saturday sunday am pm').split()) | STOPWORDS
+
+def normalize_amount(amount: str) -> str:
+    amount = amount.replace(',', '')
+    if '.' in amount:
+        amount = amount.rstrip('0').rstrip('.')
+    return amount.lstrip('0') or '0'
+
+def normalize_text(text: str) -> str:
+    return ' '.join(terms(text))
+
+def mask(text: str, spans: list) -> str:
+    """Blanks out the (ordered, non-overlapping) spans, keeping the offsets of the rest of the text"""
+    if not spans:
+        return text
+    parts = []
+    position = 0
+    for start, end in spans:
+        parts.append(text[position:start])
+        parts.append(' ' * (end - start))
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+def clause_spans(text: str) -> list:
+    spans = []
+    start = 0
+    for match in CLAUSE_BREAK.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return [(start, end) for start, end in spans if text[start:end].strip()]
+
+def anchor_terms(text: str) -> set:
+    """The content terms of a clause, with a plural 's' removed, that tie its claims to a context clause
+
+    Capitalized words after the first are left out: names are checked as claims of their own,
+    and a list of names must not draw a claim away from the clause that states it.
+    """
+    anchors = set()
+    for position, term in enumerate(ANCHOR_TERM.findall(text)):
+        if position > 0 and term[0].isupper():
+            continue
+        term = term.lower()
+        if term in COMMON_WORDS or NEGATION.fullmatch(term):
+            continue
+        anchors.add(term[:-1] if len(term) > 3 and term.endswith('s') and not term.endswith('ss') else term)
+    return anchors
+
+def at_sentence_start(text: str, position: int) -> bool:
+    # only the few characters before the position are looked at, to keep the check linear
+    preceding = text[max(0, position - 8):position].rstrip(' \t')
+    return not preceding or preceding[-1] in SENTENCE_ENDS
+
+
+class Claims(object):
+    """The normalized claims in a text, by type: type -> {normalized value: text}
+
+    Each claim type is matched in the text left after masking the previous matches, so the
+    digits of a date, time or price are not counted again as numbers, nor the month of a
+    date as a name. Names are only extracted when names is set. The dates, times, prices and
+    numbers are also listed in text order as (offset, type, value, text) positions.
+    """
+    def __init__(self, text: str, names: bool = True) -> None:
+        self.values = {claim_type: {} for claim_type in CLAIM_WEIGHTS}
+        self.dates = []
+        self.positions = []
+        masked = text
+        spans = []
+
+        def add(claim_type: str, value, match) -> None:
+            self.values[claim_type].setdefault(value, match.group(0).strip())
+            self.positions.append((match.start(), claim_type, value, match.group(0).strip()))
+            spans.append(match.span())
+
+        for match in DATE.finditer(masked):
+            groups = match.groupdict()
+            month = next(groups[f'month{n}'] for n in range(1, 5) if groups[f'month{n}'])
+            month = int(month) if month.isdigit() else MONTHS[month.lower()[:3]]
+            day = int(next(groups[f'day{n}'] for n in range(1, 5) if groups[f'day{n}']))
+            year = next((groups[f'year{n}'] for n in range(1, 5) if groups[f'year{n}']), None)
+            if not (1 <= month <= 12 and 1 <= day <= 31):
+                continue
+            year = int(year) + (2000 if len(year) == 2 else 0) if year else None
+            self.dates.append((month, day, year))
+            add('date', (month, day, year), match)
+        masked, spans = mask(masked, spans), []
+
+        for match in TIME.finditer(masked):
+            if match.group('named'):
+                add('time', NAMED_TIMES[match.group('named').lower()], match)
+                continue
+            if match.group('hour24'):
+                hour, minute = int(match.group('hour24')), int(match.group('minute24'))
+            else:
+                hour, minute = int(match.group('hour')) % 12, int(match.group('minute') or 0)
+                hour += 12 if match.group('meridiem').lower() == 'p' else 0
+            add('time', f'{hour:02d}:{minute:02d}', match)
+        masked, spans = mask(masked, spans), []
+
+        for match in PRICE.finditer(masked):
+            add('price', normalize_amount(match.group('amount1') or match.group('amount2')), match)
+        # word numbers are replaced in place, padded to keep the offsets
+        masked = WORD_NUMBER.sub(lambda word: WORD_NUMBERS[word.group(0).lower()].ljust(len(word.group(0))),
+                                 mask(masked, spans))
+        spans = []
+
+        for match in NUMBER.finditer(masked):
+            add('number', normalize_amount(match.group('amount')), match)
+        masked = mask(masked, spans)
+        # the rest of the text, for the term coverage
+        self.text = masked
+
+        for match in NAME.finditer(masked if names else ''):
+            words = match.group(0).rstrip('.').split()
+            # a capitalized word at the start of a sentence is not necessarily a name
+            while words and words[0].lower() in COMMON_WORDS:
+                words = words[1:]
+            if not words or (len(words) == 1 and at_sentence_start(text, match.start())):
+                continue
+            if (value := normalize_text(' '.join(words))):
+                self.values['name'].setdefault(value, ' '.join(words))
+
+
+class Clause(object):
+    """One clause of a text: its (type, value, text) claims, its anchor terms and whether it is negated"""
+    def __init__(self, text: str, masked: str, claims: list) -> None:
+        self.text = text.strip()
+        self.claims = claims
+        self.dates = [value for claim_type, value, _ in claims if claim_type == 'date']
+        self.times = {value for claim_type, value, _ in claims if claim_type == 'time'}
+        # any amount supports a number or price claim (e.g. 'rooms from 120 per night')
+        self.amounts = {value for claim_type, value, _ in claims if claim_type in ('price', 'number')}
+        self.anchors = anchor_terms(masked)
+        self.negated = NEGATION.search(text) is not None
+
+    def contains(self, claim_type: str, value) -> bool:
+        if claim_type == 'date':
+            month, day, year = value
+            return any(month == other_month and day == other_day and (year is None or other_year is None or year == other_year)
+                       for other_month, other_day, other_year in self.dates)
+        if claim_type == 'time':
+            return value in self.times
+        return value in self.amounts
+
+def find_clauses(text: str, claims: Claims) -> list:
+    """The clauses of a text, each with the claims (found once in the whole text) that start in it"""
+    spans = clause_spans(text)
+    starts = [start for start, _ in spans]
+    clause_claims = [[] for _ in spans]
+    for position, claim_type, value, claim_text in claims.positions:
+        clause_claims[max(0, bisect_right(starts, position) - 1)].append((claim_type, value, claim_text))
+    return [Clause(text[start:end], claims.text[start:end], found) for (start, end), found in zip(spans, clause_claims)]
+
+
+class ContextIndex(object):
+    """The values a claim can be found under in the context, and the clauses they are in"""
+    def __init__(self, context: str) -> None:
+        self.clauses = find_clauses(context, Claims(context, names=False))
+        self.dates = [date for clause in self.clauses for date in clause.dates]
+        self.times = set().union(*(clause.times for clause in self.clauses))
+        self.amounts = set().union(*(clause.amounts for clause in self.clauses))
+        self.values = sorted(float(amount) for amount in self.amounts)
+        self.text = ' ' + normalize_text(context) + ' '
+        self.terms = set(self.text.split())
+
+    def supports(self, claim_type: str, value) -> bool:
+        """Whether the value is anywhere in the context"""
+        if claim_type == 'name':
+            # a name is supported when it appears as a phrase, or all of its words appear
+            return f' {value} ' in self.text or all(term in self.terms for term in value.split())
+        return any(clause.contains(claim_type, value) for clause in self.clauses)
+
+    def best_clauses(self, anchors: set) -> tuple:
+        """The context clauses sharing the most anchor terms, and the number of terms shared"""
+        best, best_shared = [], 0
+        for clause in self.clauses:
+            shared = len(anchors & clause.anchors)
+            if shared > best_shared:
+                best, best_shared = [clause], shared
+            elif shared == best_shared and shared > 0:
+                best.append(clause)
+        return best, best_shared
+
+    def locate(self, claim_type: str, value, anchors: set, negated: bool) -> str:
+        """The status of a claim: 'supported' when it is in a best matching clause of the same
+        polarity, 'negated' when only of the other polarity, 'misplaced' when it is only in other
+        clauses, and None when it is not in the context"""
+        if not self.supports(claim_type, value):
+            return None
+        best, _ = self.best_clauses(anchors)
+        matches = [clause for clause in best if clause.contains(claim_type, value)]
+        if not matches:
+            return 'misplaced'
+        return 'supported' if any(clause.negated == negated for clause in matches) else 'negated'
+
+    def contradicts(self, anchors: set, negated: bool) -> bool:
+        """Whether every best matching clause differs in negation from an answer clause"""
+        best, shared = self.best_clauses(anchors)
+        return shared >= NEGATION_MIN_TERMS and all(clause.negated != negated for clause in best)
+
+    def derives(self, value: str, factors: set) -> bool:
+        """Whether an amount is a context amount times one of the factors, or the sum of two context amounts"""
+        amount = float(value)
+        if any(abs(other * factor - amount) < 0.005 for other in self.values for factor in factors):
+            return True
+        # sums are only tried for contexts with few amounts
+        return len(self.values) <= MAX_SUM_AMOUNTS and any(
+            abs(first + second - amount) < 0.005 for i, first in enumerate(self.values) for second in self.values[i:])
+
+
+class GroundingChecker(object):
+    def __init__(
+        self,
+        fail_score: float = FAIL_SCORE,
+        pass_score: float = PASS_SCORE,
+        pass_coverage: float = PASS_COVERAGE,
+        sample_rate: float = 0.0,
+        local_verdicts: tuple = ('CORRECT',)
+    ) -> None:
+        self.fail_score = fail_score
+        self.pass_score = pass_score
+        self.pass_coverage = pass_coverage
+        self.sample_rate = sample_rate
+        self.local_verdicts = local_verdicts
+
+    def check(self, question: str, answer: str, context) -> dict:
+        """Returns the verdict ('CORRECT', 'HALLUCINATED' or 'UNCERTAIN'), rationale and checked claims"""
+        start_time = time.time()
+        context = str(context)
+        if not context.strip() or context.strip() == NO_MATCH_TEXT:
+            return self.result('UNCERTAIN', 'No context to check the answer against.', [], 0.0, start_time)
+
+        index = ContextIndex(context)
+        answer_claims = Claims(answer)
+        question_claims = Claims(question)
+
+        factors = {float(value) for claims in (answer_claims, question_claims) for value in claims.values['number']
+                   if 1 < float(value) <= MAX_FACTOR}
+
+        # dates, times and amounts are checked per answer clause, against the context clause
+        # that matches the clause's other terms (or the question's, for a clause like 'it is $25')
+        claims = []
+        negation_mismatches = []
+        question_anchors = anchor_terms(question_claims.text)
+        for clause in find_clauses(answer, answer_claims):
+            anchors = clause.anchors or question_anchors
+            if len(clause.anchors) >= NEGATION_MIN_TERMS and index.contradicts(clause.anchors, clause.negated):
+                negation_mismatches.append(clause.text)
+            seen = set()
+            for claim_type, value, text in clause.claims:
+                if value in question_claims.values[claim_type] or (claim_type, value) in seen:
+                    continue
+                seen.add((claim_type, value))
+                if not (status := index.locate(claim_type, value, anchors, clause.negated)):
+                    derived = claim_type in ('price', 'number') and index.derives(value, factors)
+                    status = 'derived' if derived else 'unsupported'
+                claims.append({'type': claim_type, 'text': text, 'status': status})
+
+        # names are looked up anywhere in the context
+        for value, text in answer_claims.values['name'].items():
+            if value not in question_claims.values['name']:
+                status = 'supported' if index.supports('name', value) else 'unsupported'
+                claims.append({'type': 'name', 'text': text, 'status': status})
+
+        # the claims are checked above, the coverage is of the other terms
+        answer_terms = set(terms(answer_claims.text))
+        question_terms = set(terms(question))
+        coverage = (sum(1 for term in answer_terms if term in index.terms or term in question_terms) / len(answer_terms)
+                    if answer_terms else 0.0)
+
+        supported = [claim for claim in claims if claim['status'] == 'supported']
+        supported_score = sum(CLAIM_WEIGHTS[claim['type']] for claim in supported)
+        unsupported = [claim for claim in claims if claim['status'] == 'unsupported']
+        unsupported_score = sum(CLAIM_WEIGHTS[claim['type']] for claim in unsupported)
+
+        if unsupported_score >= self.fail_score:
+            verdict = 'HALLUCINATED'
+            rationale = 'Not found in the context: {}.'.format(
+                ', '.join(f'{claim["text"]} ({claim["type"]})' for claim in unsupported))
+        elif (len(supported) == len(claims) and supported_score >= self.pass_score and coverage >= self.pass_coverage
+                and not negation_mismatches):
+            verdict = 'CORRECT'
+            rationale = 'Every checked claim is in the context: {}.'.format(', '.join(claim['text'] for claim in claims))
+        else:
+            verdict = 'UNCERTAIN'
+            rationale = f'{len(supported)} of {len(claims)} claims found, {coverage:.0%} term coverage.'
+            if (derived := [claim['text'] for claim in claims if claim['status'] == 'derived']):
+                rationale += ' Derived from the context amounts: {}.'.format(', '.join(derived))
+            if (misplaced := [claim['text'] for claim in claims if claim['status'] == 'misplaced']):
+                rationale += ' In the context, but not with the same terms: {}.'.format(', '.join(misplaced))
+            if (negated := [claim['text'] for claim in claims if claim['status'] == 'negated']):
+                rationale += ' In the context, but negated: {}.'.format(', '.join(negated))
+            if negation_mismatches:
+                rationale += ' Negation differs from the context: {}.'.format(' / '.join(negation_mismatches))
+
+        return self.result(verdict, rationale, claims, coverage, start_time)
+
+    def result(self, verdict: str, rationale: str, claims: list, coverage: float, start_time: float) -> dict:
+        return {
+            'verdict': verdict,
+            'rationale': rationale,
+            'claims': claims,
+            'coverage': round(coverage, 3),
+            'check_time': int((time.time() - start_time) * 1000)  # milliseconds
+        }
+
+    def decides(self, verdict: str) -> bool:
+        """Whether the verdict is returned without invoking the LLM"""
+        return verdict in self.local_verdicts
+
+    def sample(self) -> bool:
+        """Whether a local decision should also be checked by the LLM, to measure agreement"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def record_grounding_check(model_id: str, local_verdict: str, llm_result: str = None, sampled: bool = False) -> None:
+    """Records a cascaded detection: the local verdict, and the LLM result when it was invoked"""
+    local = llm_result is None
+    escalated = not local and not sampled
+    # the LLM result is compared with every local verdict it can confirm or contradict
+    compared = not local and local_verdict != 'UNCERTAIN'
+    agreed = compared and local_verdict == llm_result
+
+    with _stats_lock:
+        stats = _stats.setdefault(model_id, {
+            'checks': 0, 'local_passes': 0, 'local_failures': 0, 'escalations': 0, 'sampled': 0,
+            'compared': {}, 'agreements': {}
+        })
+        stats['checks'] += 1
+        stats['local_passes'] += local and local_verdict == 'CORRECT'
+        stats['local_failures'] += local and local_verdict == 'HALLUCINATED'
+        stats['escalations'] += escalated
+        stats['sampled'] += sampled
+        if compared:
+            stats['compared'][local_verdict] = stats['compared'].get(local_verdict, 0) + 1
+            stats['agreements'][local_verdict] = stats['agreements'].get(local_verdict, 0) + agreed
+
+    if compared and not agreed:
+        logger.warning(f'<<grounding_check>> [{model_id}] local verdict {local_verdict}, LLM result {llm_result}')
+
+    if EMIT_METRICS:
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': metering.METRICS_NAMESPACE,
+                    'Dimensions': [['ModelId'], ['ModelId', 'LocalVerdict']],
+                    'Metrics': [
+                        {'Name': 'GroundingChecks', 'Unit': 'Count'},
+                        {'Name': 'GroundingLocalDecisions', 'Unit': 'Count'},
+                        {'Name': 'GroundingEscalations', 'Unit': 'Count'},
+                        {'Name': 'GroundingSampled', 'Unit': 'Count'},
+                        {'Name': 'GroundingCompared', 'Unit': 'Count'},
+                        {'Name': 'GroundingAgreements', 'Unit': 'Count'}
+                    ]
+                }]
+            },
+            'ModelId': model_id,
+            'LocalVerdict': local_verdict,
+            'GroundingChecks': 1,
+            'GroundingLocalDecisions': int(local),
+            'GroundingEscalations': int(escalated),
+            'GroundingSampled': int(sampled),
+            'GroundingCompared': int(compared),
+            'GroundingAgreements': int(agreed)
+        }))
+
+def get_grounding_stats() -> dict:
+    """Cumulative counts per detection model, with the escalation rate and the local/LLM agreement rate per local verdict"""
+    with _stats_lock:
+        stats = {model_id: json.loads(json.dumps(counts)) for model_id, counts in _stats.items()}
+    for counts in stats.values():
+        counts['llm_calls_saved'] = counts['local_passes'] + counts['local_failures']
+        counts['escalation_rate'] = round(counts['escalations'] / counts['checks'], 4)
+        counts['agreement_rate'] = {verdict: round(counts['agreements'][verdict] / compared, 4)
+                                    for verdict, compared in counts['compared'].items()}
+    return stats
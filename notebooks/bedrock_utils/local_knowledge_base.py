@@ -0,0 +1,254 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""LocalKnowledgeBase - an in-process stand-in for a Bedrock knowledge base
+
+LocalKnowledgeBase has the same interface and return shapes as BedrockKnowledgeBase
+(it only replaces the Bedrock retrieve call), so it can be added to KNOWLEDGE_BASES to
+benchmark or regression-test retrieval without a live knowledge base.
+
+The index is built from a folder with one sub-folder per brand, laid out like the S3
+bucket (e.g. content/content-word or content/content-pdf). Word documents are read with
+the standard library; PDF documents need the optional pypdf package. Documents are chunked
+like infrastructure/bedrock-KB.yaml (fixed-size chunks of 600 tokens with 10% overlap),
+and the source URI of each chunk mirrors the S3 layout, so the 'startsWith' brand filter
+works unchanged:
+
+    s3://<s3_bucket>/seaside-resorts/Example Corp Seaside Resorts.docx
+
+build_index() writes the chunk embeddings as a float16 .npy matrix, plus the chunk texts,
+sources and BM25 postings as JSON. The matrix is memory-mapped when the index is loaded,
+so a cold load only reads the metadata.
+
+Search types:
+    SEMANTIC - cosine similarity of the query and chunk embeddings
+    HYBRID   - HYBRID_VECTOR_WEIGHT * cosine + (1 - HYBRID_VECTOR_WEIGHT) * BM25, with BM25
+               normalized to [0, 1] by the best BM25 score of the query
+"""
+
+import json
+import logging
+import os
+import re
+import time
+import zipfile
+from collections import Counter
+from xml.etree import ElementTree
+
+import numpy as np
+
+from bedrock_utils.embeddings import Embedder, HashingEmbedder
+from bedrock_utils.lexical import bm25_idf, bm25_term_score, terms
+from bedrock_utils.knowledge_base import BedrockKnowledgeBase
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CHUNK_TOKENS = 600
+OVERLAP_PERCENTAGE = 10
+HYBRID_VECTOR_WEIGHT = 0.5
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+METADATA_FILE = 'metadata.json'
+SOURCE_URI_KEY = 'x-amz-bedrock-kb-source-uri'
+
+TOKENS = re.compile(r'\w+|[^\w\s]')
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+def read_docx(path: str) -> str:
+    with zipfile.ZipFile(path) as document:
+        root = ElementTree.fromstring(document.read('word/document.xml'))
+    paragraphs = []
+    for paragraph in root.iter(WORD_NAMESPACE + 'p'):
+        text = ''.join(node.text or '' for node in paragraph.iter(WORD_NAMESPACE + 't'))
+        if text.strip():
+            paragraphs.append(text)
+    return '\n'.join(paragraphs)
+
+def read_pdf(path: str) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError('reading PDF documents requires the pypdf package')
+    return '\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+
+READERS = {'.docx': read_docx, '.pdf': read_pdf}
+
+def chunk_text(text: str, chunk_tokens: int = CHUNK_TOKENS, overlap_percentage: int = OVERLAP_PERCENTAGE) -> list:
+    spans = [match.span() for match in TOKENS.finditer(text)]
+    step = max(1, chunk_tokens - chunk_tokens * overlap_percentage // 100)
+    chunks = []
+    for start in range(0, len(spans), step):
+        end = min(start + chunk_tokens, len(spans))
+        chunks.append(text[spans[start][0]:spans[end - 1][1]])
+        if end == len(spans):
+            break
+    return chunks
+
+def embedding_text(text: str) -> str:
+    return ' '.join(terms(text))
+
+def build_index(
+    content_dir: str,
+    index_dir: str,
+    embedder: Embedder = None,
+    s3_bucket: str = 'local-kb',
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap_percentage: int = OVERLAP_PERCENTAGE
+) -> dict:
+    start_time = time.time()
+    embedder = embedder if embedder else HashingEmbedder()
+
+    chunks = []
+    for folder, _, files in sorted(os.walk(content_dir)):
+        for file_name in sorted(files):
+            if (reader := READERS.get(os.path.splitext(file_name)[1].lower())) is None:
+                continue
+            path = os.path.join(folder, file_name)
+            source = f's3://{s3_bucket}/' + os.path.relpath(path, content_dir).replace(os.sep, '/')
+            for text in chunk_text(reader(path), chunk_tokens, overlap_percentage):
+                chunks.append({'text': text, 'source': source})
+
+    if not chunks:
+        raise RuntimeError(f'no documents found in {content_dir}')
+
+    embeddings = np.stack([embedder.embed(embedding_text(chunk['text'])) for chunk in chunks]).astype(np.float16)
+
+    postings = {}
+    lengths = []
+    for chunk_id, chunk in enumerate(chunks):
+        chunk_terms = terms(chunk['text'])
+        lengths.append(len(chunk_terms))
+        for term, count in Counter(chunk_terms).items():
+            postings.setdefault(term, []).append([chunk_id, count])
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, EMBEDDINGS_FILE), embeddings)
+    metadata = {
+        'dimensions': embedder.dimensions,
+        'embedder': type(embedder).__name__,
+        'chunks': chunks,
+        'lengths': lengths,
+        'postings': postings
+    }
+    with open(os.path.join(index_dir, METADATA_FILE), 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+
+    logger.info(f'<<build_index>> indexed {len(chunks)} chunks from {content_dir} in {int((time.time() - start_time) * 1000)} ms')
+    return metadata
+
+def matches_filter(source: str, metadata_filter: dict) -> bool:
+    if not metadata_filter:
+        return True
+    if 'andAll' in metadata_filter:
+        return all(matches_filter(source, condition) for condition in metadata_filter['andAll'])
+    if 'orAll' in metadata_filter:
+        return any(matches_filter(source, condition) for condition in metadata_filter['orAll'])
+    for operator, condition in metadata_filter.items():
+        if condition.get('key') != SOURCE_URI_KEY:
+            raise RuntimeError(f'unsupported metadata filter key: {condition.get("key")}')
+        if operator == 'startsWith':
+            return source.startswith(condition.get('value'))
+        if operator == 'equals':
+            return source == condition.get('value')
+        if operator == 'notEquals':
+            return source != condition.get('value')
+        raise RuntimeError(f'unsupported metadata filter operator: {operator}')
+    return True
+
+
+class LocalKnowledgeBase(BedrockKnowledgeBase):
+    def __init__(
+        self,
+        index_dir: str,
+        content_dir: str = None,
+        embedder: Embedder = None,
+        kb_instance_name: str = None,
+        max_docs: int = 10,
+        threshold: float = 0.20,
+        metadata_filter: dict = None,
+        search_type: str = 'HYBRID',
+        s3_bucket: str = 'local-kb',
+        **kwargs
+    ) -> None:
+        super().__init__(
+            None,
+            kb_id='local:' + os.path.abspath(index_dir),
+            kb_instance_name=kb_instance_name if kb_instance_name else 'Local-KB',
+            max_docs=max_docs,
+            threshold=threshold,
+            metadata_filter=metadata_filter,
+            search_type=search_type,
+            s3_bucket=s3_bucket,
+            **kwargs
+        )
+        self._embedder = embedder if embedder else HashingEmbedder()
+
+        if not os.path.exists(os.path.join(index_dir, METADATA_FILE)):
+            if content_dir is None:
+                raise RuntimeError(f'no local index in {index_dir}, and no content_dir to build it from')
+            build_index(content_dir, index_dir, self._embedder, s3_bucket)
+
+        start_time = time.time()
+        with open(os.path.join(index_dir, METADATA_FILE)) as metadata_file:
+            metadata = json.load(metadata_file)
+        if metadata['dimensions'] != self._embedder.dimensions:
+            raise RuntimeError(f'index dimensions {metadata["dimensions"]} do not match the embedder ({self._embedder.dimensions})')
+
+        self._chunks = metadata['chunks']
+        self._postings = metadata['postings']
+        self._lengths = np.asarray(metadata['lengths'], dtype=np.float32)
+        self._average_length = float(self._lengths.mean())
+        self._embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        self._sources = [chunk['source'] for chunk in self._chunks]
+        logger.info(f'<<LocalKnowledgeBase>> loaded {len(self._chunks)} chunks in {int((time.time() - start_time) * 1000)} ms')
+
+    def vector_scores(self, query: str) -> np.ndarray:
+        query_vector = self._embedder.embed(embedding_text(query)).astype(np.float32)
+        return np.asarray(self._embeddings, dtype=np.float32) @ query_vector
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self._chunks), dtype=np.float32)
+        num_chunks = len(self._chunks)
+        for term in set(terms(query)):
+            if not (postings := self._postings.get(term)):
+                continue
+            idf = bm25_idf(num_chunks, len(postings))
+            for chunk_id, count in postings:
+                scores[chunk_id] += bm25_term_score(idf, count, self._lengths[chunk_id], self._average_length)
+        return scores
+
+    def invoke_retrieve(self, query: str, number_of_results: int, metadata_filter: dict, search_type: str) -> list:
+        candidates = np.asarray([matches_filter(source, metadata_filter) for source in self._sources])
+        if not candidates.any():
+            return []
+
+        scores = self.vector_scores(query)
+        if search_type == 'HYBRID':
+            bm25 = self.bm25_scores(query)
+            if (best := bm25[candidates].max()) > 0:
+                bm25 = bm25 / best
+            scores = HYBRID_VECTOR_WEIGHT * scores + (1 - HYBRID_VECTOR_WEIGHT) * bm25
+
+        scores = np.where(candidates, scores, -np.inf)
+        top = np.argsort(-scores)[:min(number_of_results, int(candidates.sum()))]
+
+        return [{
+            'content': {'text': self._chunks[chunk_id]['text']},
+            'location': {'type': 'S3', 's3Location': {'uri': self._sources[chunk_id]}},
+            'metadata': {SOURCE_URI_KEY: self._sources[chunk_id], 'x-amz-bedrock-kb-chunk-id': str(chunk_id)},
+            'score': float(scores[chunk_id])
+        } for chunk_id in top]
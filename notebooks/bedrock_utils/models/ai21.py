@@ -35,6 +35,9 @@ class AI21LabsJurassic2Model(BedrockModel):
         JURASSIC_2_MID: 'AI21 Labs Jurassic-2 Mid',
         JURASSIC_2_ULTRA: 'AI21 Labs Jurassic-2 Ultra'
     }
+    # Jurassic-2 models do not support invoke_model_with_response_stream
+    SUPPORTS_STREAMING = False
+    LEADING_CHARACTER = '\n'
     
     def __init__(
         self,
@@ -58,7 +61,7 @@ class AI21LabsJurassic2Model(BedrockModel):
         self.frequency_penalty = frequency_penalty
         super().__init__(bedrock_client, model_id, instance_name)
         
-    def invoke(self, 
+    def get_prompt_data(self, 
         prompt: str,
         temperature: float = None,
         top_p: float = None,
@@ -78,9 +81,26 @@ class AI21LabsJurassic2Model(BedrockModel):
             "presencePenalty": presence_penalty if presence_penalty is not None else self.presence_penalty,
             "frequencyPenalty": frequency_penalty if frequency_penalty is not None else self.frequency_penalty
         }
-        
+        return prompt_data
+
+    def get_prediction(self, full_response: dict) -> str:
+        return full_response['completions'][0]['data'].get('text')
+
+    def invoke(self, 
+        prompt: str,
+        temperature: float = None,
+        top_p: float = None,
+        max_tokens: int = None,
+        stop_sequences: list = None,
+        count_penalty: dict = None,
+        presence_penalty: dict = None,
+        frequency_penalty: dict = None
+    ) -> dict:
+        prompt_data = self.get_prompt_data(
+            prompt, temperature, top_p, max_tokens, stop_sequences, count_penalty, presence_penalty, frequency_penalty)
+
         response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)
-        response['prediction'] = response['full_response']['completions'][0]['data'].get('text')
+        response['prediction'] = self.get_prediction(response['full_response'])
 
         if not response['prediction']:
             response['error'] = 'no prediction returned'
@@ -100,6 +120,7 @@ class AI21LabsJambaModel(BedrockModel):
     MODEL_NAMES = {
         JAMBA_INSTRUCT: 'AI21 Labs Jamba Instruct'
     }
+    LEADING_CHARACTER = ' '
     
     def __init__(
         self,
@@ -118,7 +139,7 @@ class AI21LabsJambaModel(BedrockModel):
         self.stop_sequences = stop_sequences
         super().__init__(bedrock_client, model_id, instance_name)
         
-    def invoke(self, 
+    def get_prompt_data(self, 
         prompt: str,
         temperature: float = None,
         top_p: float = None,
@@ -156,13 +177,32 @@ class AI21LabsJambaModel(BedrockModel):
         if assistant:
             prompt_data['messages'].append({"role": "assistant", "content": assistant.strip()})
 
-        response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)
-        
-        content = response['full_response'].get('choices',[])
+        return prompt_data
+
+    def get_stream_delta(self, chunk: dict) -> str:
+        choices = chunk.get('choices', [])
+        if len(choices) == 0:
+            return None
+        return choices[0].get('delta', {}).get('content')
+
+    def get_prediction(self, full_response: dict) -> str:
+        content = full_response.get('choices', [])
         if len(content) == 0:
-            response['prediction'] = None
-        else:
-            response['prediction'] = content[0].get('message', {}).get('content', None)
+            return None
+        return content[0].get('message', {}).get('content', None)
+
+    def invoke(self, 
+        prompt: str,
+        temperature: float = None,
+        top_p: float = None,
+        top_k: int = None,
+        max_tokens: int = None,
+        stop_sequences: list = None
+    ) -> dict:
+        prompt_data = self.get_prompt_data(prompt, temperature, top_p, top_k, max_tokens, stop_sequences)
+
+        response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)
+        response['prediction'] = self.get_prediction(response['full_response'])
 
         if not response['prediction']:
             response['error'] = 'no prediction returned'
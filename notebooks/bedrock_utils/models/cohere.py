@@ -39,6 +39,7 @@ class CohereCommandModel(BedrockModel):
         COHERE_COMMAND_R: 'Cohere Command R',
         COHERE_COMMAND_R_PLUS: 'Cohere Command R+'
     }
+    LEADING_CHARACTER = '\n'
     
     def __init__(
         self,
@@ -61,7 +62,7 @@ class CohereCommandModel(BedrockModel):
         self.return_likelihoods = return_likelihoods
         super().__init__(bedrock_client, model_id, instance_name)
         
-    def invoke(self,
+    def get_prompt_data(self,
         prompt: str,
         temperature: float = None,
         top_p: float = None,
@@ -90,13 +91,37 @@ class CohereCommandModel(BedrockModel):
                 "max_tokens": max_tokens if max_tokens is not None else self.max_tokens,
                 "stop_sequences": stop_sequences if stop_sequences is not None else self.stop_sequences
             }
+        return prompt_data
 
-        response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)  
+    def get_stream_delta(self, chunk: dict) -> str:
+        if self.model_id in [self.COHERE_COMMAND, self.COHERE_COMMAND_LIGHT]:
+            if chunk.get('is_finished'):
+                return None
+            return chunk.get('text')
+        elif chunk.get('event_type') == 'text-generation':
+            return chunk.get('text')
+        return None
 
+    def get_prediction(self, full_response: dict) -> str:
         if self.model_id in [self.COHERE_COMMAND, self.COHERE_COMMAND_LIGHT]:
-            response['prediction'] = response['full_response']['generations'][0].get('text')
-        else:
-            response['prediction'] = response['full_response'].get('text')
+            return full_response['generations'][0].get('text')
+        return full_response.get('text')
+
+    def invoke(self,
+        prompt: str,
+        temperature: float = None,
+        top_p: float = None,
+        top_k: int = None,
+        max_tokens: int = None,
+        stop_sequences: list = None,
+        return_likelihoods: str = None
+    ) -> dict:
+        prompt_data = self.get_prompt_data(
+            prompt, temperature, top_p, top_k, max_tokens, stop_sequences, return_likelihoods)
+
+        response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)  
+
+        response['prediction'] = self.get_prediction(response['full_response'])
 
         if not response['prediction']:
             response['error'] = 'no prediction returned'
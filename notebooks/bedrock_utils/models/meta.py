@@ -35,6 +35,7 @@ class Llama3Model(BedrockModel):
         LLAMA3_8B_INSTRUCT: 'Meta Llama 3 8B Instruct',
         LLAMA3_70B_INSTRUCT: 'Meta Llama 3 70B Instruct'
     }
+    LEADING_CHARACTER = '\n'
     
     def __init__(
         self,
@@ -51,7 +52,7 @@ class Llama3Model(BedrockModel):
         self.max_tokens = max_tokens
         super().__init__(bedrock_client, model_id, instance_name)
 
-    def invoke(self, 
+    def get_prompt_data(self, 
         prompt: str,
         temperature: float = None,
         top_p: float = None,
@@ -63,9 +64,24 @@ class Llama3Model(BedrockModel):
             "top_p": top_p if top_p is not None else self.top_p,
             "max_gen_len": max_tokens if max_tokens is not None else self.max_tokens
         }
-        
+        return prompt_data
+
+    def get_stream_delta(self, chunk: dict) -> str:
+        return chunk.get('generation')
+
+    def get_prediction(self, full_response: dict) -> str:
+        return full_response.get('generation')
+
+    def invoke(self, 
+        prompt: str,
+        temperature: float = None,
+        top_p: float = None,
+        max_tokens: int = None
+    ) -> dict:
+        prompt_data = self.get_prompt_data(prompt, temperature, top_p, max_tokens)
+
         response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)  
-        response['prediction'] = response['full_response'].get('generation')
+        response['prediction'] = self.get_prediction(response['full_response'])
 
         if not response['prediction']:
             response['error'] = 'no prediction returned'
@@ -0,0 +1,384 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Offline prompts as Bedrock batch inference (model invocation) jobs
+
+Batch inference runs a file of prompts asynchronously, at a lower price than on-demand
+invocations (see metering.BATCH_PRICE_FACTOR) and outside the on-demand quotas, which
+suits offline evaluation and ground truth generation.
+
+A BatchInferenceJob collects the prompts for one BedrockModel, each under a caller key
+(e.g. a test case row index):
+
+    job = BatchInferenceJob(model_instance, backend)
+    for index, row in qa_pairs.iterrows():
+        job.add(index, prompt_for(row))
+    results = job.run()   # key -> normalized response, as returned by model_instance.invoke
+
+run() writes the records as JSONL in the model invocation job format, one line per record:
+
+    {"recordId": "REC00000001", "modelInput": { <model specific request body> }}
+
+submits the job, polls until it finishes, then reads the output JSONL one record at a
+time and joins each record back to its key by recordId. Each response has the prediction,
+input_tokens, output_tokens, cost and record_id, or an error for records that failed or
+are missing from the output. Jobs smaller than BATCH_MIN_RECORDS (the Bedrock minimum) are
+invoked on demand instead.
+
+The job is run by a backend implementing the BatchBackend interface:
+ - BedrockBatchBackend - uploads the input to S3, and runs a Bedrock model invocation job
+                         (the service role must be able to read and write the S3 prefix)
+ - LocalBatchBackend   - a local stand-in that runs each record with invoke_model on the
+                         given client (which can be a fake) and writes the output JSONL,
+                         so the pipeline can be tested offline
+"""
+
+import datetime
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+
+from bedrock_utils import metering
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Bedrock quotas: records per job, and the 11 character record IDs
+BATCH_MIN_RECORDS = int(os.environ.get('BATCH_MIN_RECORDS', '100'))
+BATCH_MAX_RECORDS = 50000
+RECORD_ID_FORMAT = 'REC{:08d}'
+
+BATCH_POLL_INTERVAL = 60     # seconds
+BATCH_TIMEOUT_HOURS = 24
+
+FINISHED_STATUSES = ('Completed', 'PartiallyCompleted')
+FAILED_STATUSES = ('Failed', 'Stopped', 'Expired')
+
+INPUT_MIME_TYPE = 'application/json'
+RESPONSE_MIME_TYPE = 'application/json'
+
+JOB_NAME_CHARACTERS = re.compile(r'[^a-zA-Z0-9]+')
+
+def make_job_name(model_id: str) -> str:
+    model_name = JOB_NAME_CHARACTERS.sub('-', model_id.split('.')[-1]).strip('-')[:32]
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')
+    return f'{model_name}-{timestamp}-{uuid.uuid4().hex[:6]}'
+
+def parse_s3_uri(s3_uri: str) -> tuple:
+    bucket, _, key = s3_uri.removeprefix('s3://').partition('/')
+    return bucket, key
+
+def get_token_counts(model_output: dict) -> tuple:
+    """(input_tokens, output_tokens) from a model response body, or (None, None)"""
+    if (usage := model_output.get('usage')):
+        # Claude 3 Messages API, and OpenAI style chat completions (Jamba)
+        return (usage.get('input_tokens', usage.get('prompt_tokens')),
+                usage.get('output_tokens', usage.get('completion_tokens')))
+    if 'prompt_token_count' in model_output:
+        # Llama
+        return model_output.get('prompt_token_count'), model_output.get('generation_token_count')
+    if 'inputTextTokenCount' in model_output:
+        # Titan
+        return model_output.get('inputTextTokenCount'), sum(
+            result.get('tokenCount', 0) for result in model_output.get('results', []))
+    return None, None
+
+
+class BatchBackend(object):
+    def submit(self, job_name: str, model_id: str, input_path: str) -> str:
+        """Starts a job for the JSONL file at input_path; returns the job ID"""
+        pass
+
+    def get_status(self, job_id: str) -> tuple:
+        """(status, message), with the model invocation job status values"""
+        pass
+
+    def iter_output(self, job_id: str):
+        """Yields the output records of a finished job"""
+        pass
+
+    def stop(self, job_id: str) -> None:
+        pass
+
+
+class BedrockBatchBackend(BatchBackend):
+    def __init__(
+        self,
+        bedrock_client,
+        s3_client,
+        role_arn: str,
+        s3_uri: str,
+        timeout_hours: int = BATCH_TIMEOUT_HOURS
+    ) -> None:
+        # bedrock_client is the control plane ('bedrock') client, not 'bedrock-runtime'
+        self._bedrock_client = bedrock_client
+        self._s3_client = s3_client
+        self._role_arn = role_arn
+        self._bucket, prefix = parse_s3_uri(s3_uri)
+        self._prefix = prefix.rstrip('/') + '/' if prefix else ''
+        self._timeout_hours = timeout_hours
+
+    def submit(self, job_name: str, model_id: str, input_path: str) -> str:
+        input_key = f'{self._prefix}{job_name}/input/{os.path.basename(input_path)}'
+        self._s3_client.upload_file(input_path, self._bucket, input_key)
+
+        response = self._bedrock_client.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self._role_arn,
+            modelId=model_id,
+            inputDataConfig={'s3InputDataConfig': {
+                's3InputFormat': 'JSONL',
+                's3Uri': f's3://{self._bucket}/{input_key}'
+            }},
+            outputDataConfig={'s3OutputDataConfig': {
+                's3Uri': f's3://{self._bucket}/{self._prefix}{job_name}/output/'
+            }},
+            timeoutDurationInHours=self._timeout_hours
+        )
+        logger.info(f'<<batch_inference>> submitted {job_name}: {response["jobArn"]}')
+        return response['jobArn']
+
+    def get_status(self, job_id: str) -> tuple:
+        job = self._bedrock_client.get_model_invocation_job(jobIdentifier=job_id)
+        return job.get('status'), job.get('message')
+
+    def iter_output(self, job_id: str):
+        job = self._bedrock_client.get_model_invocation_job(jobIdentifier=job_id)
+        input_uri = job['inputDataConfig']['s3InputDataConfig']['s3Uri']
+        output_uri = job['outputDataConfig']['s3OutputDataConfig']['s3Uri']
+
+        # the output for input <name>.jsonl is written to <output uri>/<job id>/<name>.jsonl.out
+        bucket, output_prefix = parse_s3_uri(output_uri)
+        output_key = '{}/{}/{}.out'.format(
+            output_prefix.rstrip('/'), job_id.split('/')[-1], input_uri.split('/')[-1]).lstrip('/')
+
+        body = self._s3_client.get_object(Bucket=bucket, Key=output_key)['Body']
+        for line in body.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+    def stop(self, job_id: str) -> None:
+        self._bedrock_client.stop_model_invocation_job(jobIdentifier=job_id)
+
+
+class LocalBatchBackend(BatchBackend):
+    def __init__(self, bedrock_client, output_dir: str = None) -> None:
+        # bedrock_client only needs invoke_model: a 'bedrock-runtime' client, or a fake
+        self._bedrock_client = bedrock_client
+        self._output_dir = output_dir
+
+    def submit(self, job_name: str, model_id: str, input_path: str) -> str:
+        output_dir = self._output_dir or os.path.dirname(input_path)
+        output_path = os.path.join(output_dir, os.path.basename(input_path) + '.out')
+        start_time = time.time()
+        num_records = 0
+        num_errors = 0
+
+        with open(input_path) as input_file, open(output_path, 'w') as output_file:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                output = {'recordId': record['recordId'], 'modelInput': record['modelInput']}
+                try:
+                    bedrock_response = self._bedrock_client.invoke_model(
+                        body=json.dumps(record['modelInput']), modelId=model_id,
+                        accept=RESPONSE_MIME_TYPE, contentType=INPUT_MIME_TYPE
+                    )
+                    output['modelOutput'] = json.loads(bedrock_response.get('body').read())
+                except Exception as e:
+                    output['error'] = {'errorCode': 400, 'errorMessage': str(e)}
+                    num_errors += 1
+                output_file.write(json.dumps(output) + '\n')
+                num_records += 1
+
+        logger.info('<<batch_inference>> ran {} records locally ({} errors) in {} ms'.format(
+            num_records, num_errors, int((time.time() - start_time) * 1000)))
+        return output_path
+
+    def get_status(self, job_id: str) -> tuple:
+        return 'Completed', None
+
+    def iter_output(self, job_id: str):
+        with open(job_id) as output_file:
+            for line in output_file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class BatchInferenceJob(object):
+    def __init__(
+        self,
+        model_instance,
+        backend: BatchBackend,
+        job_name: str = None,
+        work_dir: str = None,
+        min_records: int = BATCH_MIN_RECORDS
+    ) -> None:
+        self._model_instance = model_instance
+        self._backend = backend
+        self._job_name = job_name if job_name else make_job_name(model_instance.model_id)
+        self._work_dir = work_dir
+        self._min_records = min_records
+        self._records = []
+        self._keys = {}
+        self._record_ids = {}
+        self._job_id = None
+        self._status = None
+
+    def add(self, key, prompt: str, **kwargs) -> str:
+        """Adds a prompt (with the model's invoke arguments) under key; returns its record ID"""
+        if key in self._record_ids:
+            raise RuntimeError(f'duplicate batch inference key: {key}')
+        record_id = RECORD_ID_FORMAT.format(len(self._records) + 1)
+        self._records.append((record_id, prompt, kwargs))
+        self._keys[record_id] = key
+        self._record_ids[key] = record_id
+        return record_id
+
+    def write_input(self, path: str) -> int:
+        with open(path, 'w') as input_file:
+            for record_id, prompt, kwargs in self._records:
+                model_input = self._model_instance.get_prompt_data(prompt, **kwargs)
+                input_file.write(json.dumps({'recordId': record_id, 'modelInput': model_input}) + '\n')
+        return len(self._records)
+
+    def submit(self) -> str:
+        if len(self._records) > BATCH_MAX_RECORDS:
+            raise RuntimeError(f'{len(self._records)} records exceed the batch job limit of {BATCH_MAX_RECORDS}')
+
+        work_dir = self._work_dir or tempfile.mkdtemp(prefix='batch-inference-')
+        input_path = os.path.join(work_dir, f'{self._job_name}.jsonl')
+        self.write_input(input_path)
+        logger.info(f'<<batch_inference>> [{self._model_instance.model_instance_name}] '
+                    f'{self._job_name}: {len(self._records)} records in {input_path}')
+
+        self._job_id = self._backend.submit(self._job_name, self._model_instance.model_id, input_path)
+        return self._job_id
+
+    def wait(self, poll_interval: float = BATCH_POLL_INTERVAL, timeout: float = None) -> str:
+        start_time = time.time()
+        while True:
+            status, message = self._backend.get_status(self._job_id)
+            if status != self._status:
+                logger.info(f'<<batch_inference>> {self._job_name}: {status}')
+                self._status = status
+            if status in FINISHED_STATUSES:
+                return status
+            if status in FAILED_STATUSES:
+                raise RuntimeError(f'batch inference job {self._job_name} {status.lower()}: {message}')
+            if timeout is not None and time.time() - start_time > timeout:
+                raise RuntimeError(f'batch inference job {self._job_name} still {status} after {int(timeout)} seconds')
+            time.sleep(poll_interval)
+
+    def stop(self) -> None:
+        if self._job_id is not None and self._status not in FINISHED_STATUSES + FAILED_STATUSES:
+            self._backend.stop(self._job_id)
+
+    def parse_record(self, record: dict) -> dict:
+        """The normalized response for an output record"""
+        model_output = record.get('modelOutput')
+        response = {'record_id': record.get('recordId'), 'full_response': model_output}
+
+        if (error := record.get('error')) or not model_output:
+            response['error'] = error.get('errorMessage', str(error)) if isinstance(error, dict) else 'no model output'
+            response['prediction'] = 'no response from LLM'
+            response['input_tokens'] = 0
+            response['output_tokens'] = 0
+            response['cost'] = 0.0
+            return response
+
+        prediction = self._model_instance.get_prediction(model_output)
+        if not prediction:
+            response['error'] = 'no prediction returned'
+            prediction = 'no response from LLM'
+        elif prediction[:1] == self._model_instance.LEADING_CHARACTER:
+            prediction = prediction[1:]
+        response['prediction'] = prediction
+
+        input_tokens, output_tokens = get_token_counts(model_output)
+        if input_tokens is None:
+            # not every model reports usage in the response body
+            input_tokens = len(json.dumps(record.get('modelInput', {}))) // 4
+            output_tokens = len(prediction) // 4
+        response['input_tokens'] = input_tokens
+        response['output_tokens'] = output_tokens
+        response['cost'] = metering.record_usage(
+            self._model_instance.model_id, input_tokens, output_tokens, batch=True)
+        return response
+
+    def iter_results(self):
+        """Yields (key, response) for each output record, in output order"""
+        for record in self._backend.iter_output(self._job_id):
+            if (key := self._keys.get(record.get('recordId'))) is None:
+                logger.warning(f'<<batch_inference>> {self._job_name}: unknown record {record.get("recordId")}')
+                continue
+            yield key, self.parse_record(record)
+
+    def run_on_demand(self) -> dict:
+        results = {}
+        for record_id, prompt, kwargs in self._records:
+            try:
+                response = self._model_instance.invoke(prompt, **kwargs)
+            except Exception as e:
+                response = {'error': str(e), 'prediction': 'no response from LLM', 'input_tokens': 0, 'output_tokens': 0}
+            response['record_id'] = record_id
+            results[self._keys[record_id]] = response
+        return results
+
+    def run(self, poll_interval: float = BATCH_POLL_INTERVAL, timeout: float = None) -> dict:
+        """Runs the job; returns key -> response for every record, in the order they were added"""
+        start_time = time.time()
+        if len(self._records) < self._min_records:
+            logger.info(f'<<batch_inference>> {self._job_name}: {len(self._records)} records, '
+                        f'fewer than {self._min_records}; invoking on demand')
+            return self.run_on_demand()
+
+        self.submit()
+        self.wait(poll_interval, timeout)
+        output = dict(self.iter_results())
+
+        results = {}
+        for record_id, _, _ in self._records:
+            key = self._keys[record_id]
+            if (response := output.get(key)) is None:
+                response = {'record_id': record_id, 'error': 'no output record', 'prediction': 'no response from LLM',
+                            'input_tokens': 0, 'output_tokens': 0, 'cost': 0.0}
+            results[key] = response
+
+        num_errors = sum(1 for response in results.values() if response.get('error'))
+        logger.info('<<batch_inference>> {}: {} records ({} errors) in {} s'.format(
+            self._job_name, len(results), num_errors, int(time.time() - start_time)))
+        return results
+
+    @property
+    def job_name(self) -> str:
+        return self._job_name
+
+    @property
+    def job_id(self) -> str:
+        return self._job_id
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    def __len__(self) -> int:
+        return len(self._records)
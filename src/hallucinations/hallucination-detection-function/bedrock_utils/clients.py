@@ -0,0 +1,162 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Shared boto3 client factory
+
+Clients are created once per (service, region) with a tuned botocore configuration:
+ - max_pool_connections sized for the bounded executors used by the *_async methods
+   and hedged requests (BOTO_MAX_POOL_CONNECTIONS)
+ - TCP keep-alive, so idle pooled connections survive between Lex turns
+ - connect/read timeouts sized to the Lex code hook budget (BOTO_CONNECT_TIMEOUT,
+   BOTO_READ_TIMEOUT); increase the read timeout for long offline generations
+ - standard retries (BOTO_MAX_ATTEMPTS), except for bedrock-runtime: model invocations
+   are retried by BedrockModel.call_with_retry, with the deadline-aware backoff of
+   bedrock_utils.rate_limiter, so botocore makes a single attempt per call
+
+prewarm_clients() opens pooled connections during Lambda init, so the first caller does
+not pay for TCP and TLS handshakes. It sends requests that are rejected by the service
+(for example an invalid model ID), which establish a connection without invoking a model.
+
+get_connection_stats() reports request and new connection counters, to confirm connections
+are being reused. They are collected with event hooks on the clients created here (no other
+boto3 client or botocore class is touched): before-send and response-received time each HTTP
+request, and a request during which the client's connection pools opened a connection counts
+as a new connection. The handshake time is estimated as the difference between the average
+time of the requests on new connections and on reused ones. urllib3 reopens a dropped
+keep-alive connection in place, which is not counted as a new connection.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_POOL_CONNECTIONS = int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', '25'))
+CONNECT_TIMEOUT = float(os.environ.get('BOTO_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('BOTO_READ_TIMEOUT', '28'))
+MAX_ATTEMPTS = int(os.environ.get('BOTO_MAX_ATTEMPTS', '2'))
+
+CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+    retries={'mode': 'standard', 'max_attempts': MAX_ATTEMPTS}
+)
+
+# services whose retries are handled by the caller
+SERVICE_CONFIGS = {
+    'bedrock-runtime': CLIENT_CONFIG.merge(Config(retries={'mode': 'standard', 'total_max_attempts': 1}))
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+_stats = {'requests': 0, 'new_connections': 0, 'new_connection_time_ms': 0, 'reused_connection_time_ms': 0}
+_stats_lock = threading.Lock()
+
+# the request in flight on this thread: (start time, connections opened by its client so far)
+_in_flight = threading.local()
+
+def _pool_connections(client) -> int:
+    # connections opened so far by the client's urllib3 pools
+    try:
+        manager = client._endpoint.http_session._manager
+        return sum(pool.num_connections for key in manager.pools.keys() if (pool := manager.pools.get(key)))
+    except AttributeError:
+        return 0
+
+def _instrument_client(client) -> None:
+    def before_send(**kwargs) -> None:
+        _in_flight.request = (time.time(), _pool_connections(client))
+
+    def response_received(**kwargs) -> None:
+        if (request := getattr(_in_flight, 'request', None)) is None:
+            return
+        _in_flight.request = None
+        start_time, connections = request
+        elapsed_ms = int((time.time() - start_time) * 1000)
+        new_connection = _pool_connections(client) > connections
+        with _stats_lock:
+            _stats['requests'] += 1
+            if new_connection:
+                _stats['new_connections'] += 1
+                _stats['new_connection_time_ms'] += elapsed_ms
+            else:
+                _stats['reused_connection_time_ms'] += elapsed_ms
+
+    client.meta.events.register('before-send', before_send)
+    client.meta.events.register('response-received', response_received)
+
+def get_client(service_name: str, region_name: str = None):
+    key = (service_name, region_name)
+    with _clients_lock:
+        if (client := _clients.get(key)) is None:
+            config = SERVICE_CONFIGS.get(service_name, CLIENT_CONFIG)
+            client = boto3.client(service_name, region_name=region_name, config=config)
+            _instrument_client(client)
+            _clients[key] = client
+        return client
+
+def get_connection_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['reused_connections'] = stats['requests'] - stats['new_connections']
+    new_ms = stats['new_connection_time_ms'] / stats['new_connections'] if stats['new_connections'] else None
+    reused_ms = stats['reused_connection_time_ms'] / stats['reused_connections'] if stats['reused_connections'] else None
+    stats['avg_new_connection_time_ms'] = int(new_ms) if new_ms is not None else None
+    stats['avg_reused_connection_time_ms'] = int(reused_ms) if reused_ms is not None else None
+    stats['est_handshake_time_ms'] = max(0, int(new_ms - reused_ms)) if new_ms is not None and reused_ms is not None else None
+    return stats
+
+PREWARM_REQUESTS = {
+    'bedrock-runtime': lambda client: client.invoke_model(modelId='prewarm', body=b'{}'),
+    'bedrock-agent-runtime': lambda client: client.retrieve(knowledgeBaseId='PREWARM000', retrievalQuery={'text': 'prewarm'}),
+    'sqs': lambda client: client.list_queues(MaxResults=1),
+}
+
+def prewarm_clients(connections_per_client: int = 1) -> None:
+    start_time = time.time()
+    threads = []
+
+    def prewarm(service_name, client):
+        try:
+            PREWARM_REQUESTS[service_name](client)
+        except Exception as e:
+            # expected - the request only needs to open the connection
+            logger.debug(f'<<prewarm_clients>> {service_name}: {e}')
+
+    with _clients_lock:
+        clients = [(service_name, client) for (service_name, _), client in _clients.items()]
+
+    for service_name, client in clients:
+        if service_name not in PREWARM_REQUESTS:
+            continue
+        for _ in range(connections_per_client):
+            thread = threading.Thread(target=prewarm, args=(service_name, client))
+            thread.start()
+            threads.append(thread)
+
+    for thread in threads:
+        thread.join(timeout=CONNECT_TIMEOUT + 1)
+
+    logger.info(f'<<prewarm_clients>> opened {len(threads)} connections in {int((time.time() - start_time) * 1000)} ms')
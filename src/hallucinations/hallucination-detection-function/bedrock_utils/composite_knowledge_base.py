@@ -0,0 +1,282 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""CompositeKnowledgeBase: fan-out retrieval across several knowledge bases
+
+Queries each backend knowledge base (e.g. KBs with different chunking strategies or
+embedding models) in parallel, and merges the results with reciprocal rank fusion:
+each result scores sum(1 / (rrf_k + rank)) over the backends that returned it, so a
+chunk found by several backends ranks above one found by a single backend. Identical
+chunks (and chunks contained in another chunk from the same source) are merged.
+
+Each fused result keeps the best relevance score reported by its backends in 'score',
+so the relevance threshold means the same as for a single knowledge base, and adds
+'fusion_score' and 'knowledge_bases' (the backends that returned it).
+
+Backends that have not answered within timeout_ms are left out of the turn, so one slow
+backend cannot hold up the response. Per-backend latency, result and contribution counts
+(results in the fused top max_docs), timeouts and errors are:
+ - returned per call in the retrieve_context response ('backends')
+ - accumulated for the container lifetime (stats)
+ - printed as CloudWatch EMF records, dimensioned by knowledge base
+
+Metadata filters on the composite's S3 bucket are rewritten to each backend's bucket.
+"""
+
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import wait
+from bedrock_utils.executor import get_executor
+from bedrock_utils.knowledge_base import BedrockKnowledgeBase
+from bedrock_utils import metering
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RRF_K = 60
+DEFAULT_TIMEOUT_MS = 1500
+
+# per-call backend report, read by retrieve_context after retrieve_results returns
+_fanout_report = contextvars.ContextVar('fanout_report', default=None)
+
+def normalize_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+class CompositeKnowledgeBase(BedrockKnowledgeBase):
+    def __init__(
+        self,
+        knowledge_bases: list,
+        kb_instance_name: str = None,
+        max_docs: int = 5,
+        threshold: float = 0.40,
+        timeout_ms: int = DEFAULT_TIMEOUT_MS,
+        rrf_k: int = RRF_K,
+        s3_bucket: str = None,
+        emit_metrics: bool = True,
+        **kwargs
+    ) -> None:
+        if not knowledge_bases:
+            raise RuntimeError('a composite knowledge base needs at least one knowledge base')
+        super().__init__(
+            None,
+            kb_id='+'.join(str(kb.kb_id) for kb in knowledge_bases),
+            kb_instance_name=kb_instance_name if kb_instance_name else 'Composite-KB',
+            max_docs=max_docs,
+            threshold=threshold,
+            s3_bucket=s3_bucket if s3_bucket else knowledge_bases[0].s3_bucket,
+            **kwargs
+        )
+        self._knowledge_bases = knowledge_bases
+        self._timeout_ms = timeout_ms
+        self._rrf_k = rrf_k
+        self._emit_metrics = emit_metrics
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            kb.kb_instance_name: {'requests': 0, 'timeouts': 0, 'errors': 0, 'results': 0, 'contributed': 0, 'latency_ms': 0}
+            for kb in knowledge_bases
+        }
+
+    def retrieve_context(self, query: str, *args, **kwargs) -> dict:
+        _fanout_report.set(None)
+        response = super().retrieve_context(query, *args, **kwargs)
+        response['backends'] = _fanout_report.get()
+        return response
+
+    def backend_filter(self, metadata_filter, kb: BedrockKnowledgeBase):
+        """metadata_filter with S3 URIs in the composite's bucket moved to kb's bucket"""
+        if not metadata_filter or not self._s3_bucket or not kb.s3_bucket or kb.s3_bucket == self._s3_bucket:
+            return metadata_filter
+        prefix = 's3://' + self._s3_bucket
+
+        def rewrite(value):
+            if isinstance(value, dict):
+                return {key: rewrite(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [rewrite(item) for item in value]
+            if isinstance(value, str) and value.startswith(prefix):
+                return 's3://' + kb.s3_bucket + value[len(prefix):]
+            return value
+        return rewrite(metadata_filter)
+
+    def retrieve_results(
+        self,
+        query: str,
+        max_docs: int = None,
+        metadata_filter: dict = None,
+        search_type: str = None
+    ) -> tuple:
+        number_of_results = max_docs if max_docs else self._max_docs
+        metadata_filter = metadata_filter if metadata_filter else self._metadata_filter
+        start_time = time.time()
+
+        # the fan-out runs on its own pool, since retrieve_context_many calls this from the retrieval pool
+        executor = get_executor('retrieval-fanout')
+        futures = {}
+        for kb in self._knowledge_bases:
+            context = contextvars.copy_context()
+            futures[executor.submit(
+                context.run, self.timed_retrieve, kb, query, number_of_results,
+                self.backend_filter(metadata_filter, kb), search_type)] = kb
+        done, not_done = wait(futures, timeout=self._timeout_ms / 1000)
+
+        report = {}
+        ranked_lists = []
+        cache_statuses = []
+        for future, kb in futures.items():
+            name = kb.kb_instance_name
+            if future in not_done:
+                future.cancel()
+                report[name] = {'status': 'TIMEOUT', 'latency': self._timeout_ms, 'results': 0, 'contributed': 0}
+                logger.warning(f'<<retrieve_results>> {name} did not respond within {self._timeout_ms} ms')
+                continue
+            try:
+                results, cache_status, latency = future.result()
+            except Exception as e:
+                report[name] = {'status': 'ERROR', 'latency': int((time.time() - start_time) * 1000),
+                                'results': 0, 'contributed': 0}
+                logger.error(f'<<retrieve_results>> {name} exception: {str(e)}')
+                continue
+            report[name] = {'status': 'OK', 'latency': latency, 'results': len(results), 'contributed': 0}
+            ranked_lists.append((name, results))
+            if cache_status:
+                cache_statuses.append(f'{name}={cache_status}')
+
+        fused = self.fuse(ranked_lists)[:number_of_results]
+        for result in fused:
+            for name in result['knowledge_bases']:
+                report[name]['contributed'] += 1
+
+        invocation_time = int((time.time() - start_time) * 1000)  # milliseconds
+        logger.info(f'<<retrieve_results>> fused {len(fused)} results from {len(ranked_lists)} of '
+                    f'{len(futures)} knowledge bases in {invocation_time} ms: {json.dumps(report)}')
+        self.record(report)
+        _fanout_report.set(report)
+        return fused, ' '.join(cache_statuses) if cache_statuses else None
+
+    def timed_retrieve(self, kb: BedrockKnowledgeBase, query: str, number_of_results: int,
+                       metadata_filter: dict, search_type: str) -> tuple:
+        start_time = time.time()
+        results, cache_status = kb.retrieve_results(query, number_of_results, metadata_filter, search_type)
+        return results, cache_status, int((time.time() - start_time) * 1000)
+
+    def fuse(self, ranked_lists: list) -> list:
+        """Reciprocal rank fusion of (kb name, results) lists, merging duplicate chunks"""
+        fused = []
+        for name, results in ranked_lists:
+            for rank, result in enumerate(results, start=1):
+                text = result.get('content', {}).get('text') or ''
+                normalized = normalize_text(text)
+                source = result.get('metadata', {}).get('x-amz-bedrock-kb-source-uri')
+                contribution = 1.0 / (self._rrf_k + rank)
+
+                for entry in fused:
+                    if entry['_source'] != source:
+                        continue
+                    if normalized in entry['_normalized'] or entry['_normalized'] in normalized:
+                        # keep the longer chunk, and the best relevance score
+                        if len(normalized) > len(entry['_normalized']):
+                            entry.update(result, score=max(entry['score'], result.get('score', 0.0)),
+                                         fusion_score=entry['fusion_score'], knowledge_bases=entry['knowledge_bases'])
+                            entry['_normalized'] = normalized
+                        entry['score'] = max(entry['score'], result.get('score', 0.0))
+                        entry['fusion_score'] += contribution
+                        if name not in entry['knowledge_bases']:
+                            entry['knowledge_bases'].append(name)
+                        break
+                else:
+                    fused.append(dict(result, score=result.get('score', 0.0), fusion_score=contribution,
+                                      knowledge_bases=[name], _source=source, _normalized=normalized))
+
+        fused.sort(key=lambda entry: entry['fusion_score'], reverse=True)
+        for entry in fused:
+            del entry['_source'], entry['_normalized']
+        return fused
+
+    def record(self, report: dict) -> None:
+        with self._stats_lock:
+            for name, backend in report.items():
+                stats = self._stats[name]
+                stats['requests'] += 1
+                stats['timeouts'] += backend['status'] == 'TIMEOUT'
+                stats['errors'] += backend['status'] == 'ERROR'
+                stats['results'] += backend['results']
+                stats['contributed'] += backend['contributed']
+                stats['latency_ms'] += backend['latency']
+
+        if self._emit_metrics:
+            timestamp = int(time.time() * 1000)
+            for name, backend in report.items():
+                print(json.dumps({
+                    '_aws': {
+                        'Timestamp': timestamp,
+                        'CloudWatchMetrics': [{
+                            'Namespace': metering.METRICS_NAMESPACE,
+                            'Dimensions': [['KnowledgeBase']],
+                            'Metrics': [
+                                {'Name': 'RetrievalLatency', 'Unit': 'Milliseconds'},
+                                {'Name': 'RetrievedResults', 'Unit': 'Count'},
+                                {'Name': 'ContributedResults', 'Unit': 'Count'},
+                                {'Name': 'RetrievalTimeouts', 'Unit': 'Count'},
+                                {'Name': 'RetrievalErrors', 'Unit': 'Count'}
+                            ]
+                        }]
+                    },
+                    'KnowledgeBase': name,
+                    'RetrievalLatency': backend['latency'],
+                    'RetrievedResults': backend['results'],
+                    'ContributedResults': backend['contributed'],
+                    'RetrievalTimeouts': int(backend['status'] == 'TIMEOUT'),
+                    'RetrievalErrors': int(backend['status'] == 'ERROR')
+                }))
+
+    def invoke_retrieve(self, query: str, number_of_results: int, metadata_filter: dict, search_type: str) -> list:
+        return self.retrieve_results(query, number_of_results, metadata_filter, search_type)[0]
+
+    def sync_data_version(self, bedrock_agent_client, data_source_id: str) -> str:
+        raise RuntimeError('sync the data version of each backend knowledge base instead')
+
+    @property
+    def data_version(self) -> str:
+        return '+'.join(str(kb.data_version) for kb in self._knowledge_bases)
+
+    @property
+    def knowledge_bases(self) -> list:
+        return self._knowledge_bases
+
+    @property
+    def timeout_ms(self) -> int:
+        return self._timeout_ms
+
+    @timeout_ms.setter
+    def timeout_ms(self, value: int):
+        self._timeout_ms = value
+
+    @property
+    def stats(self) -> dict:
+        """Cumulative per-backend counts, with the average latency and contribution rate"""
+        with self._stats_lock:
+            stats = {name: dict(backend) for name, backend in self._stats.items()}
+        for backend in stats.values():
+            answered = backend['requests'] - backend['timeouts'] - backend['errors']
+            backend['average_latency_ms'] = round(backend['latency_ms'] / backend['requests'], 1) if backend['requests'] else None
+            backend['contribution_rate'] = round(backend['contributed'] / backend['results'], 3) if backend['results'] else None
+            backend['answered'] = answered
+        return stats
@@ -0,0 +1,168 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Token-budgeted context packing for retrieved knowledge base chunks
+
+Fixed-size chunking with overlap (see infrastructure/bedrock-KB.yaml) means adjacent
+chunks retrieved from the same document repeat text. pack_context() sits between
+retrieval and ConversationalAgent.build_prompt, and:
+ - merges overlapping chunks from the same source URI into a single passage
+ - drops passages that are contained in, or near-duplicates of, a higher ranked passage
+ - adds passages in retrieval order until the model's context token budget is full
+
+Chunks are ranked by their input order, i.e. the order retrieve_context returns them in:
+the re-ranked order when a Reranker is set (see bedrock_utils.reranker), otherwise the
+service ranking. A merged passage takes the rank of its best ranked chunk.
+
+Passages are returned as RetrievedChunk objects in a RetrievedContext, so the source and
+score of each passage are preserved; a merged passage keeps the chunk IDs of its chunks,
+joined with '+'.
+
+The report includes the estimated tokens before and after packing, so the tokens saved
+per turn can be tracked. Token counts are estimated at 4 characters per token, the same
+estimate used for rate limiting.
+"""
+
+import logging
+import os
+import re
+from bedrock_utils.retrieved_context import RetrievedChunk, RetrievedContext
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MIN_OVERLAP = 20            # characters
+NEAR_DUPLICATE_JACCARD = 0.8
+SHINGLE_SIZE = 5            # words
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '3000'))
+
+# context token budgets for models with small context windows, by model ID prefix
+TOKEN_BUDGETS = {
+    'amazon.titan-text-lite': 1500,
+    'amazon.titan-text-express': 3000,
+    'ai21.j2': 3000,
+    'cohere.command-text': 1500,
+    'cohere.command-light': 1500,
+    'meta.llama3': 3000,
+}
+
+WORDS = re.compile(r'\w+')
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+def get_token_budget(model_id: str) -> int:
+    for prefix, budget in TOKEN_BUDGETS.items():
+        if model_id.startswith(prefix):
+            return min(budget, DEFAULT_TOKEN_BUDGET)
+    return DEFAULT_TOKEN_BUDGET
+
+def merge_overlap(first: str, second: str) -> str:
+    """Returns first and second joined on their overlap, or None if the suffix of first
+    does not overlap the prefix of second"""
+    probe = second[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return None
+    position = first.find(probe)
+    while position >= 0:
+        if second.startswith(first[position:]):
+            return first[:position] + second
+        position = first.find(probe, position + 1)
+    return None
+
+def shingles(text: str) -> set:
+    words = WORDS.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def is_near_duplicate(text: str, text_shingles: set, kept: list) -> bool:
+    for kept_text, kept_shingles in kept:
+        if text in kept_text:
+            return True
+        union = len(text_shingles | kept_shingles)
+        if union and len(text_shingles & kept_shingles) / union >= NEAR_DUPLICATE_JACCARD:
+            return True
+    return False
+
+def pack_context(chunks: list, token_budget: int = None, separator: str = '\n') -> dict:
+    """chunks is a list of RetrievedChunk objects"""
+    token_budget = token_budget if token_budget else DEFAULT_TOKEN_BUDGET
+    tokens_before = sum(estimate_tokens(chunk.text) for chunk in chunks)
+
+    # merge overlapping chunks from the same source
+    passages = []
+    for chunk in chunks:
+        text = chunk.text.strip()
+        for passage in passages:
+            if passage['source'] != chunk.source:
+                continue
+            merged = merge_overlap(passage['text'], text) or merge_overlap(text, passage['text'])
+            if merged:
+                passage['text'] = merged
+                passage['score'] = max(passage['score'], chunk.score)
+                passage['chunk_ids'].append(chunk.chunk_id)
+                passage['merged'] += 1
+                break
+        else:
+            passages.append({'text': text, 'source': chunk.source, 'score': chunk.score,
+                             'chunk_ids': [chunk.chunk_id], 'merged': 0})
+
+    # drop near-duplicates, and fill the token budget in rank order
+    kept = []
+    packed = []
+    tokens_after = 0
+    dropped_duplicates = 0
+    dropped_for_budget = 0
+    for passage in passages:
+        passage_shingles = shingles(passage['text'])
+        if is_near_duplicate(passage['text'], passage_shingles, kept):
+            dropped_duplicates += 1
+            continue
+        kept.append((passage['text'], passage_shingles))
+
+        passage_tokens = estimate_tokens(passage['text'])
+        if tokens_after + passage_tokens > token_budget:
+            if packed:
+                dropped_for_budget += 1
+                continue
+            # always keep the best passage, truncated to the budget
+            passage['text'] = passage['text'][:token_budget * 4]
+            passage_tokens = token_budget
+        tokens_after += passage_tokens
+        packed.append(passage)
+
+    report = {
+        'context': RetrievedContext([
+            RetrievedChunk(passage['text'], passage['source'], passage['score'], '+'.join(passage['chunk_ids']))
+            for passage in packed
+        ], separator),
+        'passages': packed,
+        'num_chunks': len(chunks),
+        'num_passages': len(packed),
+        'merged_chunks': sum(passage['merged'] for passage in passages),
+        'dropped_duplicates': dropped_duplicates,
+        'dropped_for_budget': dropped_for_budget,
+        'token_budget': token_budget,
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'tokens_saved': tokens_before - tokens_after
+    }
+    logger.info('<<pack_context>> {} chunks -> {} passages ({} merged, {} duplicates, {} over budget), '
+                '{} -> {} tokens'.format(len(chunks), len(packed), report['merged_chunks'], dropped_duplicates,
+                                         dropped_for_budget, tokens_before, tokens_after))
+    return report
@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Bounded executor used by the asyncio counterparts of the Bedrock wrapper classes
+
+boto3 clients are thread-safe but blocking, so the *_async methods run the synchronous
+calls on a shared, bounded thread pool. This lets callers overlap independent calls
+(for example evaluation and hallucination detection) with asyncio.gather, without
+opening more concurrent Bedrock connections than the pool allows.
+
+The pool size defaults to 10 (the default boto3 connection pool size), and can be
+changed with the BEDROCK_MAX_WORKERS environment variable.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_WORKERS = int(os.environ.get('BEDROCK_MAX_WORKERS', '10'))
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(name: str = 'bedrock') -> ThreadPoolExecutor:
+    # callers that wait on work submitted from inside a pool use a separately named pool,
+    # so a saturated pool cannot deadlock waiting on itself
+    with _executors_lock:
+        if (executor := _executors.get(name)) is None:
+            logger.info(f'<<get_executor>> creating {name} executor with max_workers = {MAX_WORKERS}')
+            executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix=name)
+            _executors[name] = executor
+        return executor
+
+async def run_in_executor(func, *args, **kwargs):
+    # copy the caller's context so context variables (e.g. the invocation priority) carry over
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
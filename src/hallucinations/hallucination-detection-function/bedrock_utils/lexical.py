@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Lexical scoring helpers shared by the local knowledge base and the re-ranking stage"""
+
+import math
+import re
+from collections import Counter
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TERMS = re.compile(r'\w+')
+STOPWORDS = frozenset((
+    'a an and are as at be but by can do does for from has have how i if in is it its me my '
+    'of on or our so that the their there these this to was we what when where which who will '
+    'with you your').split())
+
+def terms(text: str) -> list:
+    return [term for term in TERMS.findall(text.lower()) if term not in STOPWORDS]
+
+def bm25_idf(num_documents: int, document_frequency: int) -> float:
+    return math.log(1 + (num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+def bm25_term_score(idf: float, count: int, length: float, average_length: float) -> float:
+    length_norm = 1 - BM25_B + BM25_B * length / average_length
+    return idf * count * (BM25_K1 + 1) / (count + BM25_K1 * length_norm)
+
+def bm25_scores(query: str, documents: list) -> list:
+    """BM25 scores of query against a small in-memory list of document texts"""
+    document_terms = [Counter(terms(document)) for document in documents]
+    lengths = [sum(counts.values()) for counts in document_terms]
+    average_length = (sum(lengths) / len(lengths)) if lengths and sum(lengths) else 1.0
+
+    scores = [0.0] * len(documents)
+    for term in set(terms(query)):
+        document_frequency = sum(1 for counts in document_terms if term in counts)
+        if document_frequency == 0:
+            continue
+        idf = bm25_idf(len(documents), document_frequency)
+        for i, counts in enumerate(document_terms):
+            if (count := counts.get(term)):
+                scores[i] += bm25_term_score(idf, count, lengths[i], average_length)
+    return scores
+
+def phrase_overlap(query: str, document: str) -> float:
+    """Fraction of the query's adjacent term pairs (e.g. 'ev charging') found in the document"""
+    query_terms = terms(query)
+    pairs = {f'{a} {b}' for a, b in zip(query_terms, query_terms[1:])}
+    if not pairs:
+        return 0.0
+    document_text = ' '.join(terms(document))
+    return sum(1 for pair in pairs if pair in document_text) / len(pairs)
@@ -0,0 +1,319 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Token cost metering and budgets for Bedrock invocations
+
+Every Bedrock call made through the BedrockModel wrappers is priced from PRICES (USD per
+1,000 input and output tokens, on-demand) and recorded against:
+ - the current turn (a CostMeter started with start_turn(), carried in a context variable
+   so calls made on executor threads are attributed to the turn that issued them)
+ - per-model totals for this process
+ - the daily total used for the daily budget
+
+Prompt cache reads and writes (see AnthropicClaudeModel prompt caching) are priced at
+CACHE_READ_PRICE_FACTOR and CACHE_WRITE_PRICE_FACTOR times the input price, and the meter
+keeps the cache tokens and the net saving against sending the cached prefix uncached.
+Batch inference jobs (see bedrock_utils.batch_inference) are priced at BATCH_PRICE_FACTOR
+times the on-demand prices.
+
+finish_turn() adds the turn to the daily total and emits the turn as CloudWatch embedded
+metric format (EMF) records, one per model plus a turn total. Session totals are kept by
+the caller (in Lex session attributes), and checked with budget_exhausted().
+
+Calls that complete after their turn is finished (e.g. the losing requests of a hedged
+agent, which keep running in the background) are still recorded against the turn: each
+is added to the daily total and emitted as its own EMF records, with the turn's session
+and dimensions. They are not in the session total the caller read at finish_turn.
+
+Prices can be overridden or extended with the BEDROCK_PRICES environment variable, e.g.:
+
+    BEDROCK_PRICES='{"anthropic.claude-3-haiku-20240307-v1:0": [0.00025, 0.00125]}'
+
+Budgets (USD, 0 = unlimited) are set with SESSION_COST_BUDGET and DAILY_COST_BUDGET. The
+daily total is kept per process, unless COST_BUDGET_TABLE names a DynamoDB table (string
+partition key 'budget_date') that accumulates the daily total across all processes.
+"""
+
+import contextvars
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# USD per 1,000 tokens: (input, output)
+PRICES = {
+    'ai21.j2-mid-v1': (0.0125, 0.0125),
+    'ai21.j2-ultra-v1': (0.0188, 0.0188),
+    'ai21.jamba-instruct-v1:0': (0.0005, 0.0007),
+    'amazon.titan-text-lite-v1': (0.00015, 0.0002),
+    'amazon.titan-text-express-v1': (0.0002, 0.0006),
+    'amazon.titan-text-premier-v1:0': (0.0005, 0.0015),
+    'amazon.titan-embed-text-v2:0': (0.00002, 0.0),
+    'anthropic.claude-instant-v1': (0.0008, 0.0024),
+    'anthropic.claude-v2': (0.008, 0.024),
+    'anthropic.claude-v2:1': (0.008, 0.024),
+    'anthropic.claude-3-haiku-20240307-v1:0': (0.00025, 0.00125),
+    'anthropic.claude-3-sonnet-20240229-v1:0': (0.003, 0.015),
+    'anthropic.claude-3-5-sonnet-20240620-v1:0': (0.003, 0.015),
+    'anthropic.claude-3-5-haiku-20241022-v1:0': (0.0008, 0.004),
+    'anthropic.claude-3-opus-20240229-v1:0': (0.015, 0.075),
+    'cohere.command-text-v14': (0.0015, 0.002),
+    'cohere.command-light-text-v14': (0.0003, 0.0006),
+    'cohere.command-r-v1:0': (0.0005, 0.0015),
+    'cohere.command-r-plus-v1:0': (0.003, 0.015),
+    'meta.llama3-8b-instruct-v1:0': (0.0003, 0.0006),
+    'meta.llama3-70b-instruct-v1:0': (0.00265, 0.0035),
+    'mistral.mistral-7b-instruct-v0:2': (0.00015, 0.0002),
+    'mistral.mixtral-8x7b-instruct-v0:1': (0.00045, 0.0007),
+    'mistral.mistral-small-2402-v1:0': (0.001, 0.003),
+    'mistral.mistral-large-2402-v1:0': (0.004, 0.012),
+}
+if (price_overrides := os.environ.get('BEDROCK_PRICES')):
+    PRICES.update({model_id: tuple(prices) for model_id, prices in json.loads(price_overrides).items()})
+
+# prompt cache tokens, relative to the input token price
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+# batch inference, relative to the on-demand prices
+BATCH_PRICE_FACTOR = 0.5
+
+SESSION_BUDGET = float(os.environ.get('SESSION_COST_BUDGET', '0'))
+DAILY_BUDGET = float(os.environ.get('DAILY_COST_BUDGET', '0'))
+BUDGET_TABLE = os.environ.get('COST_BUDGET_TABLE')
+METRICS_NAMESPACE = os.environ.get('COST_METRICS_NAMESPACE', 'ContactCenterRAG')
+
+class CostMeter(object):
+    def __init__(self, session_id: str = None) -> None:
+        self.session_id = session_id
+        self.cost = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.cache_savings = 0.0
+        self.models = {}
+        self.finished = False
+        self.dimensions = None
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        model_id: str,
+        input_tokens: int,
+        output_tokens: int,
+        cost: float,
+        cache_read_tokens: int = 0,
+        cache_write_tokens: int = 0,
+        cache_savings: float = 0.0
+    ) -> bool:
+        """Records a call, and returns whether the turn was already finished"""
+        with self._lock:
+            self.cost += cost
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cache_read_tokens += cache_read_tokens
+            self.cache_write_tokens += cache_write_tokens
+            self.cache_savings += cache_savings
+            model = self.models.setdefault(model_id, {
+                'calls': 0, 'input_tokens': 0, 'output_tokens': 0,
+                'cache_read_tokens': 0, 'cache_write_tokens': 0, 'cache_savings': 0.0, 'cost': 0.0
+            })
+            model['calls'] += 1
+            model['input_tokens'] += input_tokens
+            model['output_tokens'] += output_tokens
+            model['cache_read_tokens'] += cache_read_tokens
+            model['cache_write_tokens'] += cache_write_tokens
+            model['cache_savings'] += cache_savings
+            model['cost'] += cost
+            return self.finished
+
+
+_current_turn = contextvars.ContextVar('bedrock_cost_meter', default=None)
+_model_totals = CostMeter()
+_daily_total = {'date': None, 'cost': 0.0}
+_daily_lock = threading.Lock()
+_unpriced_models = set()
+
+def price(
+    model_id: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+    batch: bool = False
+) -> float:
+    if (prices := PRICES.get(model_id)) is None:
+        if model_id not in _unpriced_models:
+            _unpriced_models.add(model_id)
+            logger.warning(f'<<metering>> no price configured for {model_id}, recording cost as 0')
+        return 0.0
+    input_price = (
+        input_tokens
+        + cache_read_tokens * CACHE_READ_PRICE_FACTOR
+        + cache_write_tokens * CACHE_WRITE_PRICE_FACTOR
+    ) * prices[0]
+    cost = (input_price + output_tokens * prices[1]) / 1000
+    return cost * BATCH_PRICE_FACTOR if batch else cost
+
+def cache_savings(model_id: str, cache_read_tokens: int, cache_write_tokens: int) -> float:
+    """The net saving of the cache reads and writes over sending the same tokens uncached"""
+    if (prices := PRICES.get(model_id)) is None:
+        return 0.0
+    return (
+        cache_read_tokens * (1 - CACHE_READ_PRICE_FACTOR)
+        - cache_write_tokens * (CACHE_WRITE_PRICE_FACTOR - 1)
+    ) * prices[0] / 1000
+
+def start_turn(session_id: str = None) -> CostMeter:
+    meter = CostMeter(session_id)
+    _current_turn.set(meter)
+    return meter
+
+def current_turn() -> CostMeter:
+    return _current_turn.get()
+
+def record_usage(
+    model_id: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+    batch: bool = False
+) -> float:
+    input_tokens = input_tokens or 0
+    output_tokens = output_tokens or 0
+    cache_read_tokens = cache_read_tokens or 0
+    cache_write_tokens = cache_write_tokens or 0
+    cost = price(model_id, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens, batch)
+    savings = cache_savings(model_id, cache_read_tokens, cache_write_tokens)
+
+    usage = (model_id, input_tokens, output_tokens, cost, cache_read_tokens, cache_write_tokens, savings)
+    _model_totals.record(*usage)
+    if (meter := _current_turn.get()) is not None and meter.record(*usage):
+        # a late call, e.g. a losing hedged request that completed after the turn was finished
+        late = CostMeter(meter.session_id)
+        late.record(*usage)
+        add_daily_cost(cost)
+        emit_metrics(late, meter.dimensions)
+    return cost
+
+def finish_turn(meter: CostMeter, dimensions: dict = None) -> None:
+    with meter._lock:
+        # calls recorded from now on are late calls
+        meter.finished = True
+        meter.dimensions = dimensions
+        emit_metrics(meter, dimensions)
+        cost = meter.cost
+    add_daily_cost(cost)
+
+def get_model_totals() -> dict:
+    with _model_totals._lock:
+        return json.loads(json.dumps(_model_totals.models))
+
+def today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')
+
+def add_daily_cost(cost: float) -> float:
+    date = today()
+    with _daily_lock:
+        if _daily_total['date'] != date:
+            _daily_total['date'] = date
+            _daily_total['cost'] = 0.0
+        _daily_total['cost'] += cost
+
+    if BUDGET_TABLE and cost > 0:
+        try:
+            from bedrock_utils import clients
+            response = clients.get_client('dynamodb').update_item(
+                TableName=BUDGET_TABLE,
+                Key={'budget_date': {'S': date}},
+                UpdateExpression='ADD cost :cost',
+                ExpressionAttributeValues={':cost': {'N': f'{cost:.8f}'}},
+                ReturnValues='UPDATED_NEW'
+            )
+            with _daily_lock:
+                _daily_total['cost'] = float(response['Attributes']['cost']['N'])
+        except Exception as e:
+            logger.warning(f'<<metering>> unable to update the daily cost table: {e}')
+
+    return _daily_total['cost']
+
+def daily_cost() -> float:
+    with _daily_lock:
+        return _daily_total['cost'] if _daily_total['date'] == today() else 0.0
+
+def budget_exhausted(session_cost: float = 0.0) -> bool:
+    if SESSION_BUDGET > 0 and session_cost >= SESSION_BUDGET:
+        logger.warning(f'<<metering>> session budget exhausted: ${session_cost:.6f} >= ${SESSION_BUDGET:.6f}')
+        return True
+    if DAILY_BUDGET > 0 and daily_cost() >= DAILY_BUDGET:
+        logger.warning(f'<<metering>> daily budget exhausted: ${daily_cost():.6f} >= ${DAILY_BUDGET:.6f}')
+        return True
+    return False
+
+def emit_metrics(meter: CostMeter, dimensions: dict = None) -> None:
+    """Prints the turn as CloudWatch EMF records (Lambda forwards stdout to CloudWatch Logs)"""
+    dimensions = dimensions if dimensions else {}
+    timestamp = int(time.time() * 1000)
+
+    def emf_record(values: dict, dimension_names: list) -> str:
+        record = {
+            '_aws': {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [dimension_names],
+                    'Metrics': [
+                        {'Name': 'Cost', 'Unit': 'None'},
+                        {'Name': 'InputTokens', 'Unit': 'Count'},
+                        {'Name': 'OutputTokens', 'Unit': 'Count'},
+                        {'Name': 'CacheReadTokens', 'Unit': 'Count'},
+                        {'Name': 'CacheWriteTokens', 'Unit': 'Count'},
+                        {'Name': 'CacheSavings', 'Unit': 'None'}
+                    ]
+                }]
+            },
+            'SessionId': meter.session_id
+        }
+        record.update(dimensions)
+        record.update(values)
+        return json.dumps(record)
+
+    for model_id, model in meter.models.items():
+        print(emf_record({
+            'ModelId': model_id,
+            'Cost': model['cost'],
+            'InputTokens': model['input_tokens'],
+            'OutputTokens': model['output_tokens'],
+            'CacheReadTokens': model['cache_read_tokens'],
+            'CacheWriteTokens': model['cache_write_tokens'],
+            'CacheSavings': model['cache_savings']
+        }, list(dimensions.keys()) + ['ModelId']))
+
+    print(emf_record({
+        'Cost': meter.cost,
+        'InputTokens': meter.input_tokens,
+        'OutputTokens': meter.output_tokens,
+        'CacheReadTokens': meter.cache_read_tokens,
+        'CacheWriteTokens': meter.cache_write_tokens,
+        'CacheSavings': meter.cache_savings
+    }, list(dimensions.keys())))
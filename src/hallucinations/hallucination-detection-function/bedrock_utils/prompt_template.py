@@ -0,0 +1,109 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Compiled prompt templates
+
+A PromptTemplate parses its text once into static segments and named {slots}, and renders
+with a single join, instead of one str.replace pass over the whole template per slot.
+Values are inserted in one pass, so text inside a value (e.g. a '{guardrails}' in the
+retrieved context) is never substituted. A slot with no value is left as written.
+
+partial() fills some slots and re-parses the result, so slots inside a partial value
+become slots of the new template (the Claude guardrails contain a {randomized} tag).
+compile_template() caches compiled templates, and their partials, by text.
+
+The static prefix (the text before the first slot) and prefix(**values) (the text up to
+the first slot without a value) let providers that support prompt caching mark the
+stable start of a prompt. current_date() formats today's date once per day.
+"""
+
+import datetime
+import functools
+import re
+import time
+
+SLOT = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)\}')
+DATE_FORMAT = '%B %-d, %Y'
+
+class PromptTemplate():
+    __slots__ = ('_text', '_parts', '_slots')
+
+    def __init__(self, text: str) -> None:
+        self._text = text
+        # static segments and slot placeholders alternate; a slot's placeholder is its literal
+        # text, which is rendered when no value is given
+        self._parts = []
+        self._slots = []
+        position = 0
+        for match in SLOT.finditer(text):
+            self._parts.append(text[position:match.start()])
+            self._slots.append((len(self._parts), match.group(1)))
+            self._parts.append(match.group(0))
+            position = match.end()
+        self._parts.append(text[position:])
+
+    def render(self, **values) -> str:
+        parts = self._parts.copy()
+        for index, name in self._slots:
+            if name in values:
+                parts[index] = values[name]
+        return ''.join(parts)
+
+    def partial(self, **values):
+        return PromptTemplate(self.render(**values))
+
+    def prefix(self, **values) -> str:
+        """The rendered text up to the first slot that has no value"""
+        parts = []
+        for index, part in enumerate(self._parts):
+            if index % 2:
+                name = self._slots[index // 2][1]
+                if name not in values:
+                    break
+                part = values[name]
+            parts.append(part)
+        return ''.join(parts)
+
+    @property
+    def static_prefix(self) -> str:
+        return self._parts[0]
+
+    @property
+    def slot_names(self) -> list:
+        return list(dict.fromkeys(name for _, name in self._slots))
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+@functools.lru_cache(maxsize=256)
+def compile_template(text: str, **partials) -> PromptTemplate:
+    template = PromptTemplate(text)
+    return template.partial(**partials) if partials else template
+
+_current_date = None
+_current_date_expires = 0.0
+
+def current_date() -> str:
+    """Today's date, as in the prompts (e.g. 'September 2, 2024'), formatted once per day"""
+    global _current_date, _current_date_expires
+    if time.time() >= _current_date_expires:
+        now = datetime.datetime.now()
+        midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+        _current_date = now.strftime(DATE_FORMAT)
+        _current_date_expires = midnight.timestamp()
+    return _current_date
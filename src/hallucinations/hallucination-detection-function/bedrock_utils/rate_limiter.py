@@ -0,0 +1,201 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Per-model rate limiting and throttling-aware retries for Bedrock invocations
+
+Each model_id has its own ModelRateLimiter, with optional requests-per-minute and
+tokens-per-minute budgets implemented as token buckets. Budgets are configured with
+set_rate_limit(), or with the BEDROCK_RATE_LIMITS environment variable, e.g.:
+
+    BEDROCK_RATE_LIMITS='{"anthropic.claude-3-haiku-20240307-v1:0": {"requests_per_minute": 500, "tokens_per_minute": 1000000}}'
+
+Models without a configured budget are not rate limited.
+
+Callers are assigned a priority class with set_invocation_context(). Test traffic
+(PRIORITY_TEST) waits while live callers (PRIORITY_LIVE) are queued for the same model,
+and may not draw a bucket below its reserved fraction, so tests can never starve live
+callers. The invocation context also carries the Lambda deadline, which bounds both
+rate-limit waits and the jittered exponential backoff used to retry ThrottlingException
+and ModelTimeoutException errors.
+
+Note: buckets are kept in memory, so budgets apply per process (Lambda execution
+environment or notebook kernel), not across the whole account.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PRIORITY_LIVE = 0
+PRIORITY_TEST = 1
+
+RETRYABLE_ERRORS = ('ThrottlingException', 'ModelTimeoutException')
+MAX_RETRIES = int(os.environ.get('BEDROCK_MAX_RETRIES', '4'))
+BASE_BACKOFF = 0.25   # seconds
+MAX_BACKOFF = 8.0     # seconds
+DEADLINE_MARGIN = 1.0 # seconds reserved to finish the turn after the last Bedrock call
+RESERVED_FRACTION = 0.2
+
+_invocation_context = contextvars.ContextVar('bedrock_invocation_context', default=(PRIORITY_LIVE, None))
+
+def set_invocation_context(priority: int = PRIORITY_LIVE, remaining_time_ms: int = None) -> None:
+    deadline = time.time() + remaining_time_ms / 1000 if remaining_time_ms else None
+    _invocation_context.set((priority, deadline))
+
+def get_priority() -> int:
+    return _invocation_context.get()[0]
+
+def get_remaining_time() -> float:
+    deadline = _invocation_context.get()[1]
+    if deadline is None:
+        return None
+    return deadline - time.time() - DEADLINE_MARGIN
+
+def backoff_delay(attempt: int) -> float:
+    """Returns the delay before retry number `attempt`, or None if the call should not be retried"""
+    if attempt >= MAX_RETRIES:
+        return None
+    delay = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+    remaining_time = get_remaining_time()
+    if remaining_time is not None and delay >= remaining_time:
+        return None
+    return delay
+
+
+class TokenBucket(object):
+    def __init__(self, capacity: float, refill_rate: float) -> None:
+        self._capacity = capacity
+        self._refill_rate = refill_rate  # per second
+        self._level = capacity
+        self._last_refill = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self._capacity, self._level + (now - self._last_refill) * self._refill_rate)
+        self._last_refill = now
+
+    def time_until(self, amount: float) -> float:
+        self.refill()
+        amount = min(amount, self._capacity)
+        if self._level >= amount:
+            return 0.0
+        return (amount - self._level) / self._refill_rate
+
+    def consume(self, amount: float) -> None:
+        # the level may go negative when actual usage exceeds the estimate
+        self.refill()
+        self._level -= amount
+
+    @property
+    def capacity(self) -> float:
+        return self._capacity
+
+
+class ModelRateLimiter(object):
+    def __init__(
+        self,
+        model_id: str,
+        requests_per_minute: int = None,
+        tokens_per_minute: int = None,
+        reserved_fraction: float = RESERVED_FRACTION
+    ) -> None:
+        self._model_id = model_id
+        self._requests = TokenBucket(requests_per_minute, requests_per_minute / 60) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute else None
+        self._reserved_fraction = reserved_fraction
+        self._condition = threading.Condition()
+        self._live_waiters = 0
+
+    def _wait_time(self, tokens: int, priority: int) -> float:
+        if priority != PRIORITY_LIVE and self._live_waiters > 0:
+            return MAX_BACKOFF
+
+        wait_time = 0.0
+        for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+            if bucket is None:
+                continue
+            if priority != PRIORITY_LIVE:
+                amount += bucket.capacity * self._reserved_fraction
+            wait_time = max(wait_time, bucket.time_until(amount))
+        return wait_time
+
+    def acquire(self, tokens: int) -> float:
+        """Blocks until the request fits the model budgets; returns the time waited in seconds"""
+        if self._requests is None and self._tokens is None:
+            return 0.0
+
+        priority = get_priority()
+        start_time = time.time()
+
+        with self._condition:
+            if priority == PRIORITY_LIVE:
+                self._live_waiters += 1
+            try:
+                while (wait_time := self._wait_time(tokens, priority)) > 0:
+                    remaining_time = get_remaining_time()
+                    if remaining_time is not None and wait_time >= remaining_time:
+                        if priority == PRIORITY_LIVE:
+                            # let Bedrock decide rather than failing a live caller locally
+                            logger.warning(f'<<acquire>> [{self._model_id}] rate limit wait exceeds remaining time, proceeding')
+                            break
+                        raise RuntimeError(f'rate limit wait for {self._model_id} exceeds remaining time')
+                    self._condition.wait(timeout=wait_time)
+
+                if self._requests:
+                    self._requests.consume(1)
+                if self._tokens:
+                    self._tokens.consume(tokens)
+            finally:
+                if priority == PRIORITY_LIVE:
+                    self._live_waiters -= 1
+                self._condition.notify_all()
+
+        waited = time.time() - start_time
+        if waited > 0.001:
+            logger.info(f'<<acquire>> [{self._model_id}] waited {int(waited * 1000)} ms for rate limit (priority {priority})')
+        return waited
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        if self._tokens is None or actual_tokens is None:
+            return
+        with self._condition:
+            self._tokens.consume(actual_tokens - estimated_tokens)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+_rate_limits = json.loads(os.environ.get('BEDROCK_RATE_LIMITS', '{}'))
+
+def set_rate_limit(model_id: str, requests_per_minute: int = None, tokens_per_minute: int = None) -> None:
+    with _rate_limiters_lock:
+        _rate_limits[model_id] = {'requests_per_minute': requests_per_minute, 'tokens_per_minute': tokens_per_minute}
+        _rate_limiters.pop(model_id, None)
+
+def get_rate_limiter(model_id: str) -> ModelRateLimiter:
+    with _rate_limiters_lock:
+        if (rate_limiter := _rate_limiters.get(model_id)) is None:
+            limits = _rate_limits.get(model_id, {})
+            rate_limiter = ModelRateLimiter(
+                model_id, limits.get('requests_per_minute'), limits.get('tokens_per_minute'))
+            _rate_limiters[model_id] = rate_limiter
+        return rate_limiter
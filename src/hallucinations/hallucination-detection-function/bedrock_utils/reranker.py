@@ -0,0 +1,106 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Re-ranking stage for retrieved knowledge base chunks
+
+The knowledge base ranks chunks by its own (vector or hybrid) score, so a chunk with the
+caller's exact terms ('EV charging', 'valet', brand names) can land below less specific
+chunks. LexicalReranker scores the retrieved chunks in-process with BM25 plus an exact
+phrase bonus, and fuses that with the service ranking:
+
+    rrf      - reciprocal rank fusion: sum of 1 / (rrf_k + rank) over both rankings
+    weighted - weight * service score + (1 - weight) * lexical score normalized to [0, 1]
+
+The fused score is stored as 'rerank_score', and results are returned in fused order. The
+original 'score' is kept, so the relevance threshold still applies to the service score.
+If top_n is set, only the top_n fused results are kept, so fewer, better chunks reach the
+LLM. Timing and the before/after rank of each chunk are logged for tuning.
+"""
+
+import logging
+import time
+
+from bedrock_utils.lexical import bm25_scores, phrase_overlap
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SOURCE_URI_KEY = 'x-amz-bedrock-kb-source-uri'
+
+class Reranker(object):
+    def rerank(self, query: str, results: list) -> list:
+        pass
+
+
+class LexicalReranker(Reranker):
+    def __init__(
+        self,
+        fusion: str = 'rrf',
+        weight: float = 0.5,
+        rrf_k: int = 60,
+        phrase_weight: float = 0.5,
+        top_n: int = None
+    ) -> None:
+        if fusion not in ('rrf', 'weighted'):
+            raise RuntimeError(f'unsupported fusion method: {fusion}')
+        self._fusion = fusion
+        self._weight = weight
+        self._rrf_k = rrf_k
+        self._phrase_weight = phrase_weight
+        self._top_n = top_n
+
+    def lexical_scores(self, query: str, texts: list) -> list:
+        scores = bm25_scores(query, texts)
+        best = max(scores) if scores and max(scores) > 0 else 1.0
+        return [score / best + self._phrase_weight * phrase_overlap(query, text) for score, text in zip(scores, texts)]
+
+    def rerank(self, query: str, results: list) -> list:
+        if len(results) < 2:
+            return results
+        start_time = time.time()
+
+        texts = [result.get('content', {}).get('text') or '' for result in results]
+        lexical = self.lexical_scores(query, texts)
+        service = [result.get('score', 0.0) for result in results]
+
+        if self._fusion == 'rrf':
+            service_rank = {i: rank for rank, i in enumerate(sorted(range(len(results)), key=lambda i: -service[i]))}
+            lexical_rank = {i: rank for rank, i in enumerate(sorted(range(len(results)), key=lambda i: -lexical[i]))}
+            fused = [1 / (self._rrf_k + service_rank[i] + 1) + 1 / (self._rrf_k + lexical_rank[i] + 1)
+                     for i in range(len(results))]
+        else:
+            best = max(lexical) if max(lexical) > 0 else 1.0
+            fused = [self._weight * service[i] + (1 - self._weight) * lexical[i] / best for i in range(len(results))]
+
+        order = sorted(range(len(results)), key=lambda i: -fused[i])
+        if self._top_n:
+            order = order[:self._top_n]
+
+        reranked = []
+        for i in order:
+            result = dict(results[i])
+            result['rerank_score'] = fused[i]
+            result['lexical_score'] = lexical[i]
+            reranked.append(result)
+
+        rerank_time = (time.time() - start_time) * 1000  # milliseconds
+        positions = ', '.join('{}->{}'.format(i + 1, new_rank + 1) for new_rank, i in enumerate(order))
+        logger.info(f'<<rerank>> {self._fusion} fusion in {rerank_time:.2f} ms, rank before->after: {positions}')
+        for new_rank, i in enumerate(order):
+            source = results[i].get('metadata', {}).get(SOURCE_URI_KEY, 'N/A')
+            logger.debug(f'<<rerank>> #{new_rank + 1} (was #{i + 1}) score={service[i]:.4f} '
+                         f'lexical={lexical[i]:.4f} fused={fused[i]:.4f} {source}')
+        return reranked
@@ -0,0 +1,222 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Exact-match response cache for ConversationalAgent.generate_response
+
+Responses are keyed on the model ID, the temperature, the normalized rendered prompt, and
+an optional namespace (e.g. the knowledge base ID and data version). The rendered prompt
+includes the prompt template and the retrieved context, so a changed template or changed
+knowledge base content produces a new key; changing the namespace invalidates everything
+cached for the previous knowledge base version.
+
+ResponseCache is two-tiered:
+ - an in-process LRUCache with byte-size accounting and TTL expiry
+ - an optional shared backend implementing the CacheBackend interface:
+     DynamoDBCacheBackend - a DynamoDB table with a string partition key 'cache_key'
+                            (enable DynamoDB TTL on the 'expires_at' attribute)
+     SQLiteCacheBackend   - a local SQLite file stand-in, for notebooks and offline tests
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# randomized instruction tags (see AnthropicClaude3ConversationalAgent) differ on every call
+RANDOMIZED_TAG = re.compile(r'random\d{5}')
+WHITESPACE = re.compile(r'\s+')
+
+def normalize_prompt(prompt: str) -> str:
+    prompt = RANDOMIZED_TAG.sub('random', prompt)
+    return WHITESPACE.sub(' ', prompt).strip()
+
+
+class CacheBackend(object):
+    def get(self, key: str) -> dict:
+        pass
+
+    def put(self, key: str, value: dict, ttl: int) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+
+class LRUCache(CacheBackend):
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: int = 3600) -> None:
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: dict, ttl: int = None) -> None:
+        size = len(key) + len(json.dumps(value).encode('utf-8'))
+        if size > self._max_bytes:
+            return
+        expires_at = time.time() + (ttl if ttl is not None else self._ttl)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._size += size
+            while self._size > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        if (entry := self._entries.pop(key, None)) is not None:
+            self._size -= entry[1]
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DynamoDBCacheBackend(CacheBackend):
+    def __init__(self, dynamodb_client, table_name: str) -> None:
+        self._dynamodb_client = dynamodb_client
+        self._table_name = table_name
+
+    def get(self, key: str) -> dict:
+        response = self._dynamodb_client.get_item(
+            TableName=self._table_name,
+            Key={'cache_key': {'S': key}}
+        )
+        if not (item := response.get('Item')):
+            return None
+        # DynamoDB deletes expired items lazily, so check the expiry here as well
+        if int(item['expires_at']['N']) < time.time():
+            return None
+        return json.loads(item['value']['S'])
+
+    def put(self, key: str, value: dict, ttl: int) -> None:
+        self._dynamodb_client.put_item(
+            TableName=self._table_name,
+            Item={
+                'cache_key': {'S': key},
+                'value': {'S': json.dumps(value)},
+                'expires_at': {'N': str(int(time.time() + ttl))}
+            }
+        )
+
+    def delete(self, key: str) -> None:
+        self._dynamodb_client.delete_item(TableName=self._table_name, Key={'cache_key': {'S': key}})
+
+
+class SQLiteCacheBackend(CacheBackend):
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache (cache_key TEXT PRIMARY KEY, value TEXT, expires_at REAL)')
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value, expires_at FROM cache WHERE cache_key = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict, ttl: int) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO cache (cache_key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + ttl))
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM cache WHERE cache_key = ?', (key,))
+
+
+class ResponseCache(object):
+    def __init__(
+        self,
+        local_cache: LRUCache = None,
+        shared_backend: CacheBackend = None,
+        ttl: int = 3600
+    ) -> None:
+        self._local_cache = local_cache if local_cache else LRUCache(ttl=ttl)
+        self._shared_backend = shared_backend
+        self._ttl = ttl
+        self._stats = {'hits': 0, 'misses': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    def make_key(self, model_id: str, temperature: float, prompt: str, namespace: str = None, **parameters) -> str:
+        key_data = json.dumps({
+            'model_id': model_id,
+            'temperature': temperature,
+            'namespace': namespace,
+            'parameters': parameters,
+            'prompt': normalize_prompt(prompt)
+        }, sort_keys=True)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> dict:
+        value = self._local_cache.get(key)
+
+        if value is None and self._shared_backend is not None:
+            try:
+                if (value := self._shared_backend.get(key)) is not None:
+                    self._local_cache.put(key, value)
+            except Exception as e:
+                logger.warning(f'<<ResponseCache>> shared backend get failed: {e}')
+                self._count('errors')
+
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def put(self, key: str, value: dict) -> None:
+        self._local_cache.put(key, value, self._ttl)
+        if self._shared_backend is not None:
+            try:
+                self._shared_backend.put(key, value, self._ttl)
+            except Exception as e:
+                logger.warning(f'<<ResponseCache>> shared backend put failed: {e}')
+                self._count('errors')
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._stats[counter] += 1
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
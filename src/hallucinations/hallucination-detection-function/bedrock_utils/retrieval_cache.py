@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Retrieval result cache for BedrockKnowledgeBase.retrieve_context
+
+Raw retrievalResults are cached (not the concatenated context), so the relevance
+threshold can be re-applied to a cached result. Entries are keyed on the knowledge base
+ID and data version (e.g. the latest ingestion job ID), the query text, the metadata
+filter, the search type and numberOfResults. Setting a new data version on the knowledge
+base therefore invalidates everything retrieved from the previous version.
+
+Entries are fresh for ttl seconds. For a further stale_ttl seconds they are served as
+STALE while a single background refresh re-runs the retrieval (stale-while-revalidate).
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from bedrock_utils.executor import get_executor
+from bedrock_utils.response_cache import LRUCache
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CACHE_HIT = 'HIT'
+CACHE_STALE = 'STALE'
+CACHE_MISS = 'MISS'
+
+class RetrievalCache(object):
+    def __init__(self, ttl: int = 300, stale_ttl: int = 3600, max_bytes: int = 8 * 1024 * 1024) -> None:
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._cache = LRUCache(max_bytes, ttl + stale_ttl)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def make_key(
+        self,
+        kb_id: str,
+        data_version: str,
+        query: str,
+        metadata_filter: dict,
+        search_type: str,
+        number_of_results: int
+    ) -> str:
+        key_data = json.dumps([kb_id, data_version, query, metadata_filter, search_type, number_of_results], sort_keys=True)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, refresh) -> tuple:
+        """Returns (results, cache status); refresh() is run in the background for stale entries"""
+        if (entry := self._cache.get(key)) is None:
+            return None, CACHE_MISS
+
+        if time.time() - entry['stored_at'] < self._ttl:
+            return entry['results'], CACHE_HIT
+
+        with self._lock:
+            start_refresh = key not in self._refreshing
+            self._refreshing.add(key)
+        if start_refresh:
+            get_executor('retrieval-refresh').submit(self._refresh, key, refresh)
+        return entry['results'], CACHE_STALE
+
+    def put(self, key: str, results: list) -> None:
+        self._cache.put(key, {'stored_at': time.time(), 'results': results})
+
+    def _refresh(self, key: str, refresh) -> None:
+        try:
+            self.put(key, refresh())
+        except Exception as e:
+            logger.warning(f'<<RetrievalCache>> background refresh failed: {e}')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
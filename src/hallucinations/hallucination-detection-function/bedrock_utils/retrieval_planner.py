@@ -0,0 +1,156 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Per-turn retrieval planning
+
+RetrievalPlanner.plan() decides, before the knowledge base is called, whether a turn:
+ - SKIPs retrieval: the context switch is off (the agent uses the no-context prompt), or
+   the intent (e.g. Welcome) is answered without the knowledge base
+ - REUSEs the context retrieved for an earlier turn: the question is a follow-up whose
+   terms are all found in that context, in the same knowledge base scope (KB, data version
+   and metadata filter), within max_reuse_turns turns
+ - RETRIEVEs, otherwise
+
+REUSE turns are cacheable when max_reuse_turns allows more than one REUSE turn per stored
+context. The write is speculative: the first REUSE turn writes the prompt cache, which is
+only read if the next turn is also a REUSE turn (the age of the stored context counts its
+REUSE turns, so every later REUSE turn follows one that wrote the cache). The caller reports
+the prompt cache writes and reads per session, to check that the reads pay for the writes.
+The stored context is trimmed and ordered by score (see encode_context), so a prompt cache
+written on the RETRIEVE turn would not, in general, be read by the REUSE turns.
+
+The retrieved context is kept in session state in compact form: encode_context() stores
+the chunks as zlib-compressed, base64-encoded JSON, dropping the lowest scoring chunks to
+stay within max_stored_bytes, since Lex session attributes are size limited.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import zlib
+from bedrock_utils.lexical import terms
+from bedrock_utils.retrieved_context import RetrievedChunk, RetrievedContext
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RETRIEVE = 'RETRIEVE'
+REUSE = 'REUSE'
+SKIP = 'SKIP'
+
+# words that make a question a follow-up, rather than asking about something new
+FOLLOW_UP_WORDS = frozenset('they them their it its about also else more tell there those'.split())
+
+def make_scope(kb_id: str, data_version: str, metadata_filter: dict) -> str:
+    """Identifies where a context was retrieved from, so it is only reused in the same place"""
+    value = json.dumps([kb_id, data_version, metadata_filter], sort_keys=True)
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=8).hexdigest()
+
+class RetrievalPlanner():
+    def __init__(
+        self,
+        skip_intents: tuple = ('Welcome',),
+        max_reuse_turns: int = 2,
+        min_coverage: float = 1.0,
+        max_stored_bytes: int = 6000
+    ) -> None:
+        self._skip_intents = skip_intents
+        self._max_reuse_turns = max_reuse_turns
+        self._min_coverage = min_coverage
+        self._max_stored_bytes = max_stored_bytes
+
+    def plan(self, intent: str, question: str, context_enabled: bool, stored: str = None, scope: str = None) -> dict:
+        """Returns the decision, its reason and, for REUSE, the stored context to use"""
+        if not context_enabled:
+            return self.decision(SKIP, 'context switch off')
+        if intent in self._skip_intents:
+            return self.decision(SKIP, f'{intent} intent')
+
+        previous = self.decode_context(stored) if stored else None
+        if previous is None:
+            return self.decision(RETRIEVE, 'no stored context')
+        if previous['scope'] != scope:
+            return self.decision(RETRIEVE, 'knowledge base or filter changed')
+        if previous['age'] >= self._max_reuse_turns:
+            return self.decision(RETRIEVE, 'stored context too old')
+
+        question_terms = set(terms(question)) - FOLLOW_UP_WORDS
+        if not question_terms:
+            return self.decision(RETRIEVE, 'no question terms')
+        context_terms = set()
+        for chunk in previous['context'].chunks:
+            context_terms.update(terms(chunk.text))
+        coverage = len(question_terms & context_terms) / len(question_terms)
+        if coverage < self._min_coverage:
+            return self.decision(RETRIEVE, f'coverage {coverage:.2f}')
+
+        response = self.decision(REUSE, f'coverage {coverage:.2f}, age {previous["age"]}')
+        response['context'] = previous['context']
+        response['age'] = previous['age']
+        # the first REUSE turn writes the prompt cache speculatively, and the next ones read it
+        response['cacheable'] = self._max_reuse_turns > 1
+        return response
+
+    def decision(self, decision: str, reason: str) -> dict:
+        logger.info(f'<<plan>> {decision}: {reason}')
+        return {'decision': decision, 'reason': reason}
+
+    def encode_context(self, context: RetrievedContext, scope: str, age: int = 0) -> str:
+        """The context as a compact session attribute value, or None if no chunk fits"""
+        chunks = sorted(context.chunks, key=lambda chunk: chunk.score, reverse=True)
+        while chunks:
+            sources = list(dict.fromkeys(chunk.source for chunk in chunks))
+            value = {
+                'scope': scope,
+                'age': age,
+                'sources': sources,
+                'chunks': [[chunk.chunk_id, sources.index(chunk.source), round(chunk.score, 4), chunk.text]
+                           for chunk in chunks]
+            }
+            encoded = base64.b64encode(zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), 9))
+            if len(encoded) <= self._max_stored_bytes:
+                return encoded.decode('ascii')
+            chunks.pop()
+        logger.info(f'<<encode_context>> no chunk fits in {self._max_stored_bytes} bytes')
+        return None
+
+    def decode_context(self, stored: str) -> dict:
+        try:
+            value = json.loads(zlib.decompress(base64.b64decode(stored)))
+        except Exception as e:
+            logger.warning(f'<<decode_context>> exception: {str(e)}')
+            return None
+        chunks = [RetrievedChunk(text, value['sources'][source], score, chunk_id)
+                  for chunk_id, source, score, text in value['chunks']]
+        return {'scope': value['scope'], 'age': value['age'], 'context': RetrievedContext(chunks)}
+
+    @property
+    def skip_intents(self) -> tuple:
+        return self._skip_intents
+
+    @skip_intents.setter
+    def skip_intents(self, value: tuple):
+        self._skip_intents = value
+
+    @property
+    def max_reuse_turns(self) -> int:
+        return self._max_reuse_turns
+
+    @max_reuse_turns.setter
+    def max_reuse_turns(self, value: int):
+        self._max_reuse_turns = value
@@ -0,0 +1,139 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Structured knowledge base retrieval results
+
+retrieve_context returns its matches as RetrievedChunk objects (text, source URI, score
+and chunk ID) wrapped in a RetrievedContext, so the source, score and chunk boundaries
+survive to the stages after retrieval (context packing, citations, hallucination detection).
+The context is only rendered to a string when it is used in a prompt, via str() or format().
+
+relevant_to() selects the chunks that contain the terms of a generated answer, so the
+hallucination detector can check the answer against those chunks rather than against the
+whole concatenated context. to_json() / from_json() carry the chunks through SQS.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from bedrock_utils.lexical import terms
+
+CHUNK_ID_KEY = 'x-amz-bedrock-kb-chunk-id'
+SOURCE_URI_KEY = 'x-amz-bedrock-kb-source-uri'
+NO_MATCH_TEXT = 'There is no information available on this topic.'
+
+@dataclass
+class RetrievedChunk:
+    __slots__ = ('text', 'source', 'score', 'chunk_id')
+    text: str
+    source: str
+    score: float
+    chunk_id: str
+
+    @classmethod
+    def from_result(cls, result: dict):
+        """Creates a chunk from a Bedrock Retrieve API result"""
+        text = result.get('content', {}).get('text')
+        metadata = result.get('metadata', {})
+        source = metadata.get(SOURCE_URI_KEY)
+        chunk_id = metadata.get(CHUNK_ID_KEY)
+        if chunk_id is None:
+            # a content hash is stable across retrievals of the same chunk
+            chunk_id = hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest() if text else ''
+        return cls(text, 'N/A' if source is None else source, result.get('score', 0.0), chunk_id)
+
+    def to_dict(self) -> dict:
+        return {'text': self.text, 'source': self.source, 'score': self.score, 'chunk_id': self.chunk_id}
+
+    @classmethod
+    def from_dict(cls, value: dict):
+        return cls(value['text'], value.get('source', 'N/A'), value.get('score', 0.0), value.get('chunk_id', ''))
+
+
+class RetrievedContext:
+    __slots__ = ('_chunks', '_separator', '_text')
+
+    def __init__(self, chunks: list = None, separator: str = '\n') -> None:
+        self._chunks = chunks if chunks is not None else []
+        self._separator = separator
+        self._text = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            if self._chunks:
+                self._text = self._separator.join(chunk.text for chunk in self._chunks) + self._separator
+            else:
+                self._text = NO_MATCH_TEXT
+        return self._text
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
+
+    def __repr__(self) -> str:
+        return f'RetrievedContext({len(self._chunks)} chunks from {len(self.sources)} sources)'
+
+    def relevant_to(self, answer: str):
+        """Returns a RetrievedContext with only the chunks relevant to answer, in the same order.
+
+        Chunks are chosen greedily (most answer terms first) until every answer term found
+        anywhere in the context is covered by a chosen chunk, so no supporting evidence for
+        the answer is dropped. If the answer shares no terms with the context, all chunks
+        are returned."""
+        answer_terms = set(terms(answer))
+        if not answer_terms or len(self._chunks) < 2:
+            return self
+
+        overlaps = [answer_terms.intersection(terms(chunk.text)) for chunk in self._chunks]
+        uncovered = set().union(*overlaps)
+        if not uncovered:
+            return self
+
+        chosen = set()
+        while uncovered:
+            best = max(range(len(overlaps)), key=lambda i: len(overlaps[i] & uncovered))
+            chosen.add(best)
+            uncovered -= overlaps[best]
+        if len(chosen) == len(self._chunks):
+            return self
+        return RetrievedContext([chunk for i, chunk in enumerate(self._chunks) if i in chosen], self._separator)
+
+    def to_json(self) -> list:
+        return [chunk.to_dict() for chunk in self._chunks]
+
+    @classmethod
+    def from_json(cls, value):
+        """Accepts the output of to_json(), or a plain context string from an older producer"""
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, str):
+            return cls([RetrievedChunk(value, 'N/A', 0.0, '')]) if value else cls()
+        return cls([RetrievedChunk.from_dict(chunk) for chunk in value])
+
+    @property
+    def chunks(self) -> list:
+        return self._chunks
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self._chunks)
+
+    @property
+    def sources(self) -> list:
+        return list(dict.fromkeys(chunk.source for chunk in self._chunks))
+
+    @property
+    def separator(self) -> str:
+        return self._separator
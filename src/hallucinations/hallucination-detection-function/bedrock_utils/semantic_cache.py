@@ -0,0 +1,170 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Semantic question cache
+
+SemanticCache returns a stored answer for a question that is a close paraphrase of one
+answered before ('can I bring my dog' vs 'are pets allowed'). Questions are normalized,
+combined with the brand filter, embedded, and compared against a preallocated NumPy
+matrix of prior questions (int8 or float16), so a lookup is a single matrix-vector
+product. The matrix is bounded by max_bytes; when it is full, the least recently used
+entry is evicted.
+
+Entries are partitioned (e.g. by brand, knowledge base version and LLM), and only
+entries in the same partition can match.
+
+A caller that looks a question up and then stores its answer can embed the question once
+with embed(), and pass the vector to both lookup() and store().
+
+Embedders are pluggable (see bedrock_utils.embeddings): TitanEmbedder in production, and
+HashingEmbedder for tests and notebooks.
+"""
+
+import logging
+import re
+import threading
+import time
+import numpy as np
+from bedrock_utils.embeddings import Embedder, HashingEmbedder, TitanEmbedder
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+WORDS = re.compile(r"[a-z0-9']+")
+
+def normalize_question(question: str) -> str:
+    return ' '.join(WORDS.findall(question.lower()))
+
+
+class SemanticCache(object):
+    INT8_SCALE = 127.0
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        threshold: float = 0.92,
+        max_bytes: int = 4 * 1024 * 1024,
+        dtype: str = 'int8',
+        ttl: int = 3600
+    ) -> None:
+        if dtype not in ('int8', 'float16'):
+            raise RuntimeError(f'unsupported semantic cache dtype: {dtype}')
+
+        self._embedder = embedder
+        self._threshold = threshold
+        self._dtype = np.dtype(dtype)
+        self._ttl = ttl
+        self._max_entries = max(1, max_bytes // (embedder.dimensions * self._dtype.itemsize))
+        self._matrix = np.zeros((self._max_entries, embedder.dimensions), dtype=self._dtype)
+        self._entries = [None] * self._max_entries  # slot -> entry dict, None when free
+        self._partitions = np.full(self._max_entries, -1, dtype=np.int32)
+        self._partition_ids = {}
+        self._last_used = np.zeros(self._max_entries, dtype=np.float64)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def embed(self, question: str, brand: str = None) -> np.ndarray:
+        text = normalize_question(question)
+        if brand:
+            text += ' | brand: ' + normalize_question(brand)
+        return self._embedder.embed(text)
+
+    def lookup(self, question: str, brand: str = None, partition: str = None, vector: np.ndarray = None) -> dict:
+        start_time = time.time()
+        query = vector if vector is not None else self.embed(question, brand)
+
+        with self._lock:
+            match = None
+            if (partition_id := self._partition_ids.get(partition)) is not None:
+                candidates = np.flatnonzero(self._partitions == partition_id)
+                if len(candidates) > 0:
+                    similarities = self.similarities(candidates, query)
+                    best = int(np.argmax(similarities))
+                    slot = int(candidates[best])
+                    entry = self._entries[slot]
+                    if entry['expires_at'] < time.time():
+                        self._free(slot)
+                    elif similarities[best] >= self._threshold:
+                        self._last_used[slot] = time.time()
+                        match = dict(entry, similarity=float(similarities[best]))
+
+            self._stats['hits' if match else 'misses'] += 1
+
+        lookup_time = int((time.time() - start_time) * 1000)  # milliseconds
+        if match:
+            match['lookup_time'] = lookup_time
+            logger.info(f'<<SemanticCache>> HIT ({match["similarity"]:.4f}) "{question}" ~ "{match["question"]}"')
+        else:
+            logger.info(f'<<SemanticCache>> MISS "{question}" in {lookup_time} ms')
+        return match
+
+    def store(self, question: str, answer: str, brand: str = None, partition: str = None, vector: np.ndarray = None) -> None:
+        if vector is None:
+            vector = self.embed(question, brand)
+
+        with self._lock:
+            free_slots = np.flatnonzero(self._partitions == -1)
+            if len(free_slots) > 0:
+                slot = int(free_slots[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._stats['evictions'] += 1
+
+            if (partition_id := self._partition_ids.get(partition)) is None:
+                partition_id = self._partition_ids[partition] = len(self._partition_ids)
+
+            self._matrix[slot] = self.quantize(vector)
+            self._partitions[slot] = partition_id
+            self._last_used[slot] = time.time()
+            self._entries[slot] = {
+                'question': question,
+                'answer': answer,
+                'expires_at': time.time() + self._ttl
+            }
+
+    def quantize(self, vector: np.ndarray) -> np.ndarray:
+        if self._dtype == np.int8:
+            return np.clip(np.rint(vector * self.INT8_SCALE), -127, 127).astype(np.int8)
+        return vector.astype(np.float16)
+
+    def similarities(self, slots: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if self._dtype == np.int8:
+            scores = self._matrix[slots].astype(np.int32) @ self.quantize(query).astype(np.int32)
+            # quantization error can push the cosine of near-identical vectors slightly above 1
+            return np.minimum(scores / (self.INT8_SCALE * self.INT8_SCALE), 1.0)
+        return self._matrix[slots].astype(np.float32) @ query
+
+    def _free(self, slot: int) -> None:
+        self._entries[slot] = None
+        self._partitions[slot] = -1
+        self._last_used[slot] = 0.0
+
+    @property
+    def threshold(self) -> float:
+        return self._threshold
+
+    @threshold.setter
+    def threshold(self, value: float):
+        self._threshold = value
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=int(np.count_nonzero(self._partitions != -1)))
@@ -18,6 +18,8 @@ import json
 import logging
 import os
 import bedrock_helpers
+from bedrock_utils import clients, metering, rate_limiter, judge_output, grounding_check
+from bedrock_utils.retrieved_context import RetrievedContext
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -27,20 +29,29 @@ def handler(event, context):
         batch_item_failures = []
         sqs_batch_response = {}
      
+        # 'context' is reused for the retrieved context of each record below
+        lambda_context = context
+
         for record in event.get("Records", []):
             try:
+                rate_limiter.set_invocation_context(
+                    remaining_time_ms=lambda_context.get_remaining_time_in_millis() if lambda_context else None)
                 logger.info(f'record = {json.dumps(record, indent=4)}')
                 body = json.loads(record.get('body', {}))
+                cost_meter = metering.start_turn(body.get('event', {}).get('sessionId'))
                 
                 question = body.get('question', 'temp')
                 answer = body.get('answer', 'temp')
-                context = body.get('context', 'temp')
+                # the context is a list of retrieved chunks, or a string from an older producer
+                context = RetrievedContext.from_json(body.get('context', 'temp'))
 
                 logger.debug(f'question = "{question}"')
                 logger.debug(f'answer = "{answer}"')
                 logger.debug(f'context = "{context}"')
                 
-                detection_agent = bedrock_helpers.select_conversational_agent(os.environ.get('LLM'))
+                # once the daily budget is spent, scan with the cheaper fallback model
+                detection_llm = bedrock_helpers.BUDGET_FALLBACK_LLM if metering.budget_exhausted() else os.environ.get('LLM')
+                detection_agent = bedrock_helpers.select_conversational_agent(detection_llm)
                 
                 if (detection_response := detection_agent.detect_hallucinations(question, answer, context)):
                     logger.debug(f'DETECTION RESULT = {json.dumps(detection_response, indent=4)}')
@@ -52,7 +63,11 @@ def handler(event, context):
                     output = {
                         'question': question,
                         'answer': answer,
-                        'context': context,
+                        'context': str(context),
+                        'checked_chunks': detection_response.get('document_chunks'),
+                        'parse_status': detection_response.get('parse_status'),
+                        'detection_stage': detection_response.get('detection_stage', 'llm'),
+                        'local_verdict': detection_response.get('local_verdict'),
                         'rationale': rationale,
                         'latency': invocation_time
                     }
@@ -69,10 +84,15 @@ def handler(event, context):
                         output['hallucination'] = 'UNDETERMINED'
                         logger.error(f'Error in hallucination detection: {json.dumps(output, indent=4)}')
 
+                metering.finish_turn(cost_meter, {'Function': 'HallucinationDetection'})
+
             except Exception as e:
                 logger.error(f'exception: {str(e)}')
                 batch_item_failures.append({"itemIdentifier": record['messageId']})
         
         sqs_batch_response["batchItemFailures"] = batch_item_failures
         logger.info(f'response = {json.dumps(sqs_batch_response, indent=4)}')
+        logger.info(f'connection stats = {json.dumps(clients.get_connection_stats())}')
+        logger.info(f'judge stats = {json.dumps(judge_output.get_judge_stats())}')
+        logger.info(f'grounding stats = {json.dumps(grounding_check.get_grounding_stats())}')
         return sqs_batch_response
@@ -17,14 +17,30 @@
 import logging
 import json
 import os
+import time
 import dialog_helpers
 import slot_configuration
 import bedrock_helpers
+from bedrock_utils import context_packer
+from bedrock_utils.query_builder import QueryBuilder
+from bedrock_utils.retrieval_planner import RetrievalPlanner, make_scope, RETRIEVE, REUSE, SKIP
+from bedrock_utils.retrieved_context import RetrievedContext
 
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
 MAX_CONVERSATION_TURNS = int(os.environ.get('CONVERSATION_TURNS', '4'))
+# optionally stream the LLM response and stop after this many sentences (0 = no limit)
+MAX_RESPONSE_SENTENCES = int(os.environ.get('MAX_RESPONSE_SENTENCES', '0'))
+# merge overlapping chunks, drop duplicates and fit the context to the model's token budget
+CONTEXT_PACKING = os.environ.get('CONTEXT_PACKING', '1') == '1'
+# RETRIEVAL_QUERY = builder (current question + entities from earlier questions) | rolling (conversation tail)
+RETRIEVAL_QUERY = os.environ.get('RETRIEVAL_QUERY', 'builder')
+# skip retrieval, or reuse the previous turn's context, when the knowledge base is not needed
+# (the reusable context is kept in session state, in at most RETRIEVAL_CONTEXT_MAX_BYTES)
+RETRIEVAL_PLANNER = RetrievalPlanner(
+    max_stored_bytes=int(os.environ.get('RETRIEVAL_CONTEXT_MAX_BYTES', '6000'))
+) if os.environ.get('RETRIEVAL_PLANNER', '1') == '1' else None
 SQS_QUEUE_URL = os.environ.get('SQS_QUEUE_URL')
 ANY_HOTEL = 'Any'
 
@@ -41,12 +57,16 @@ def lambda_handler(event, context):
 
     logger.info('<<{}>> - Lex event info {} '.format(intent_name, json.dumps(event)))
     
-    if not (agent := bedrock_helpers.select_conversational_agent(sessionAttributes.get('ragLLM'))):
+    llm_name = sessionAttributes.get('ragLLM')
+    if sessionAttributes.get('budget_exhausted') == '1':
+        llm_name = bedrock_helpers.BUDGET_FALLBACK_LLM
+
+    if not (agent := bedrock_helpers.select_conversational_agent(llm_name, hedged=True)):
         # set prompt_id and prompt for analytics
         sessionAttributes['prompt_id'] = intent_name + '-LLM-Config-Error'
         response_template = 'Configuration error, LLM = "{llm}"'
         sessionAttributes['prompt'] = response_template
-        response_string = response_template.format(llm = sessionAttributes.get('ragLLM', 'None'))
+        response_string = response_template.format(llm = llm_name if llm_name else 'None')
         response_message = dialog_helpers.format_message_array(response_string, 'PlainText')
         logger.error(response_message)
         
@@ -105,38 +125,127 @@ def lambda_handler(event, context):
         bedrock_kb = bedrock_helpers.select_knowledge_base(knowledge_base)
 
         # set the query filter - in this case, based on the S3 folder structure
+        # (passed per query, since the knowledge base instance is shared)
+        query_filter = None
         if bedrock_kb.s3_bucket is not None and len(bedrock_kb.s3_bucket) > 0:
             query_filter = {
                 'startsWith': {
                     'key': 'x-amz-bedrock-kb-source-uri',
                     'value': 's3://' + bedrock_kb.s3_bucket + get_brand_filter(brand)
                 }
-            }            
-            bedrock_kb.metadata_filter = query_filter
+            }
             logger.debug(f'KB s3_bucket = {bedrock_kb.s3_bucket}')
 
         logger.debug(f'KB = {bedrock_kb.kb_instance_name}')
         logger.debug(f'KB threshold = {bedrock_kb.threshold}')
         logger.debug(f'KB max_docs = {bedrock_kb.max_docs}')
         logger.debug(f'KB search_type = {bedrock_kb.search_type}')
-        logger.debug(f'KB metadata_filter = {json.dumps(bedrock_kb.metadata_filter, indent=4)}')
+        logger.debug(f'KB metadata_filter = {json.dumps(query_filter, indent=4)}')
         
-        # retrieve context to pass to the LLM based on selected brand, if any
-        # note: max query length is 1000 characters for Bedrock KB
-        logger.info(f'BEDROCK KB Query = {rolling_conversation[-500:]}')
-        response = bedrock_kb.retrieve_context(query=rolling_conversation[-500:])
-
-        retrieval_time = response.get('invocation_time')
-        retrieved_context = response.get('context', 'No information is available on this topic.')
-        logger.debug(f'retrieved_context = {retrieved_context}')
+        # optional semantic cache: a paraphrase of a question answered before skips retrieval and
+        # generation (first turns only, since follow-up questions depend on the conversation history)
+        semantic_cache = None
+        semantic_match = None
+        prompt_cache = False
+        if bedrock_helpers.SEMANTIC_CACHE is not None and not turns and not sessionAttributes.get('ground-truth'):
+            semantic_cache = bedrock_helpers.SEMANTIC_CACHE
+            semantic_partition = '|'.join([
+                f'{bedrock_kb.kb_id}:{bedrock_kb.data_version}',
+                agent.model_instance.model_id,
+                sessionAttributes.get('context_switch', '1'),
+                sessionAttributes.get('guardrails_switch', '1')
+            ])
+            # the question is embedded once, for both the lookup and the store after a miss
+            start_time = time.time()
+            semantic_vector = semantic_cache.embed(input_transcript, brand)
+            semantic_match = semantic_cache.lookup(input_transcript, brand, semantic_partition, semantic_vector)
+            semantic_lookup_time = int((time.time() - start_time) * 1000)  # milliseconds
+
+        retrieval_cache_status = None
+        retrieval_cutoff = None
+        retrieval_backends = None
+        context_report = None
+        if semantic_match:
+            retrieval_time = 0
+            agent_response = {
+                'model_id': agent.model_instance.model_id,
+                'input_tokens': 0,
+                'output_tokens': 0,
+                'first_token_time': semantic_lookup_time,
+                'invocation_time': semantic_lookup_time,
+                'response': semantic_match['answer']
+            }
+        else:
+            context_enabled = sessionAttributes.get('context_switch', '1') == '1'
+            retrieval_scope = make_scope(bedrock_kb.kb_id, bedrock_kb.data_version, query_filter)
+            if RETRIEVAL_PLANNER is not None:
+                plan = RETRIEVAL_PLANNER.plan(intent_name, input_transcript, context_enabled,
+                                              sessionAttributes.get('retrieval_context'), retrieval_scope)
+            else:
+                plan = {'decision': RETRIEVE if context_enabled else SKIP, 'reason': 'no planner'}
+            sessionAttributes['retrieval_plan'] = plan['decision']
+            sessionAttributes['retrieval_plan_reason'] = plan['reason']
+
+            retrieval_time = 0
+            if plan['decision'] == RETRIEVE:
+                # retrieve context to pass to the LLM based on selected brand, if any
+                # note: max query length is 1000 characters for Bedrock KB
+                if RETRIEVAL_QUERY == 'rolling':
+                    kb_query = rolling_conversation[-500:]
+                else:
+                    kb_query = QUERY_BUILDER.build(input_transcript, turns, get_brand_name(brand))['query']
+                logger.info(f'BEDROCK KB Query = {kb_query}')
+                response = bedrock_kb.retrieve_context(query=kb_query, metadata_filter=query_filter, intent=intent_name)
+
+                retrieval_time = response.get('invocation_time')
+                retrieval_cache_status = response.get('cache_status')
+                if response.get('cutoff_score') is not None:
+                    retrieval_cutoff = response
+                retrieval_backends = response.get('backends')
+                retrieved_context = response.get('context', 'No information is available on this topic.')
+                if CONTEXT_PACKING and response.get('chunks'):
+                    context_report = context_packer.pack_context(
+                        response['chunks'], context_packer.get_token_budget(agent.model_instance.model_id))
+                    retrieved_context = context_report['context']
+
+                if RETRIEVAL_PLANNER is not None and isinstance(retrieved_context, RetrievedContext):
+                    stored = RETRIEVAL_PLANNER.encode_context(retrieved_context, retrieval_scope)
+                    if stored:
+                        sessionAttributes['retrieval_context'] = stored
+                    else:
+                        sessionAttributes.pop('retrieval_context', None)
+
+            elif plan['decision'] == REUSE:
+                retrieved_context = plan['context']
+                sessionAttributes['retrieval_context'] = RETRIEVAL_PLANNER.encode_context(
+                    retrieved_context, retrieval_scope, plan['age'] + 1)
+            logger.debug(f'retrieved_context = {retrieved_context}')
         
-        logger.info(f'agent model ID = {agent.model_instance.model_id}')
+            logger.info(f'agent model ID = {agent.model_instance.model_id}')
+
+            # generate the response
+            agent.context = plan['decision'] != SKIP
+            agent.guardrails = sessionAttributes.get('guardrails_switch', '1') == '1'
+            agent.max_sentences = MAX_RESPONSE_SENTENCES
+            prompt_cache = plan['decision'] == REUSE and plan['cacheable']
+            agent.cache_context = prompt_cache
 
-        # generate the response
-        agent.context = sessionAttributes.get('context_switch', '1') == '1'
-        agent.guardrails = sessionAttributes.get('guardrails_switch', '1') == '1'
+            # test runs always invoke the model, so evaluations measure the LLM rather than the cache
+            if sessionAttributes.get('ground-truth'):
+                agent.response_cache = None
+            else:
+                agent.response_cache = bedrock_helpers.RESPONSE_CACHE
+                agent.cache_namespace = f'{bedrock_kb.kb_id}:{bedrock_kb.data_version}'
         
-        agent_response = agent.generate_response(retrieved_context, rolling_conversation)
+            agent_response = agent.generate_response(
+                retrieved_context if retrieved_context else RetrievedContext(), rolling_conversation)
+
+            # only answers from the partition's own model are stored: not failed answers, and not
+            # answers from a hedged request or a fallback model
+            if (semantic_cache is not None and not agent_response.get('error') and not agent_response.get('hedged')
+                    and agent_response.get('model_id') == agent.model_instance.model_id):
+                semantic_cache.store(input_transcript, agent_response.get('response'), brand,
+                                     semantic_partition, semantic_vector)
         
         prompt = agent_response.get('prompt')
         rag_response = agent_response.get('response')
@@ -153,12 +262,47 @@ def lambda_handler(event, context):
         # capture session attributes for analytics
         sessionAttributes['knowledge_base'] = bedrock_kb.kb_id
         sessionAttributes['retrieval_latency'] = retrieval_time
-        sessionAttributes['rag_llm'] = agent.model_instance.model_id
+        if context_report:
+            sessionAttributes['context_tokens'] = context_report['tokens_after']
+            sessionAttributes['context_tokens_saved'] = context_report['tokens_saved']
+        if retrieval_cache_status:
+            sessionAttributes['retrieval_cache'] = retrieval_cache_status
+        if retrieval_backends:
+            # per knowledge base: status/latency ms/results contributed, e.g. Alfa:OK/412/3,Bravo:TIMEOUT/1500/0
+            sessionAttributes['retrieval_backends'] = ','.join(
+                f"{name}:{backend['status']}/{backend['latency']}/{backend['contributed']}"
+                for name, backend in retrieval_backends.items())
+        if retrieval_cutoff:
+            sessionAttributes['retrieval_num_results'] = retrieval_cutoff['number_of_results']
+            sessionAttributes['retrieval_num_matches'] = retrieval_cutoff['num_matches']
+            sessionAttributes['retrieval_tokens_avoided'] = retrieval_cutoff['tokens_avoided']
+        sessionAttributes['rag_llm'] = agent_response.get('model_id', agent.model_instance.model_id)
+        sessionAttributes['rag_hedged'] = '1' if agent_response.get('hedged') else '0'
         sessionAttributes['rag_request_id'] = agent_response.get('request_id')
         sessionAttributes['rag_input_tokens'] = agent_response.get('input_tokens')
         sessionAttributes['rag_output_tokens'] = agent_response.get('output_tokens')
+        sessionAttributes['rag_cache_read_tokens'] = agent_response.get('cache_read_tokens', 0)
+        sessionAttributes['rag_cache_write_tokens'] = agent_response.get('cache_write_tokens', 0)
+        if prompt_cache:
+            # speculative prompt cache writes on REUSE turns, against the reads they enabled
+            for counter, tokens in (('prompt_cache_writes', 'cache_write_tokens'), ('prompt_cache_reads', 'cache_read_tokens')):
+                if agent_response.get(tokens):
+                    sessionAttributes[counter] = str(int(sessionAttributes.get(counter, '0')) + 1)
+            if (cache_writes := int(sessionAttributes.get('prompt_cache_writes', '0'))):
+                sessionAttributes['prompt_cache_read_write_ratio'] = \
+                    f'{int(sessionAttributes.get("prompt_cache_reads", "0")) / cache_writes:.2f}'
         sessionAttributes['rag_latency'] = agent_response.get('invocation_time')
+        sessionAttributes['rag_first_token_latency'] = agent_response.get('first_token_time')
         sessionAttributes['total_latency'] = agent_response.get('invocation_time') + retrieval_time
+        if (cache_hit := agent_response.get('cache_hit')) is not None:
+            counter = 'rag_cache_hits' if cache_hit else 'rag_cache_misses'
+            sessionAttributes[counter] = str(int(sessionAttributes.get(counter, '0')) + 1)
+            sessionAttributes['rag_cache_hit'] = '1' if cache_hit else '0'
+            sessionAttributes['rag_cache_latency'] = agent_response.get('cache_lookup_time')
+        if semantic_cache is not None:
+            sessionAttributes['semantic_cache_hit'] = '1' if semantic_match else '0'
+            if semantic_match:
+                sessionAttributes['semantic_cache_similarity'] = f'{semantic_match["similarity"]:.4f}'
         sessionAttributes['prompt_id'] = intent_name + '-LLM-Response'
         sessionAttributes['prompt'] = '(LLM response)'
 
@@ -174,7 +318,9 @@ def lambda_handler(event, context):
         action = dialog_helpers.close
         
         # queue the response for async hallucination detection evaluation
-        if SQS_QUEUE_URL is not None and len(SQS_QUEUE_URL) > 0:
+        # (semantic cache hits were scanned when they were first generated, and
+        # turns answered without retrieved context have nothing to check against)
+        if SQS_QUEUE_URL is not None and len(SQS_QUEUE_URL) > 0 and not semantic_match and retrieved_context:
             bedrock_helpers.queue_hallucination_scan(event, input_transcript, rag_response, retrieved_context)
 
     intent['state'] = 'Fulfilled'
@@ -196,6 +342,14 @@ BRAND_FILTERS = {
     'Example Corp Party Times':     '/party-times',
 }
 
+QUERY_BUILDER = QueryBuilder(brands=BRAND_FILTERS.keys())
+
+def get_brand_name(brand):
+    """brand is a brand name, or a brand filter (e.g. '/seaside-resorts') in test case session attributes"""
+    if brand in BRAND_FILTERS:
+        return brand
+    return next((name for name, brand_filter in BRAND_FILTERS.items() if brand_filter == brand), None)
+
 def get_brand_filter(brand_name):
     if not brand_name:
         return ''
@@ -18,21 +18,13 @@ import json
 import logging
 import os
 import sys
+import threading
 import botocore
 import boto3
 
-from bedrock_utils.knowledge_base import BedrockKnowledgeBase
-
-from bedrock_utils.models.ai21 import (AI21LabsJurassic2Model, AI21LabsJambaModel)
-from bedrock_utils.models.amazon import AmazonTitanModel
-from bedrock_utils.models.anthropic import AnthropicClaudeModel
-from bedrock_utils.models.cohere import CohereCommandModel
-from bedrock_utils.models.meta import Llama3Model
-from bedrock_utils.models.mistral import MistralAIModel
-
-from bedrock_utils.hotel_agents.conversational_agent import ConversationalAgent
-from bedrock_utils.hotel_agents.amazon import AmazonTitanConversationalAgent
-from bedrock_utils.hotel_agents.anthropic import AnthropicClaude3ConversationalAgent
+from bedrock_utils import clients
+from bedrock_utils import response_cache
+from bedrock_utils.agent_registry import AgentRegistry, AgentSpec
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -42,119 +34,288 @@ logger.setLevel(logging.INFO)
 logger.info('<<bedrock_helpers>> boto3 version={}'.format(boto3.__version__))
 logger.info('<<bedrock_helpers>> botocore version={}'.format(botocore.__version__))
 
-bedrock_client = boto3.client('bedrock-runtime')
-bedrock_agents_client = boto3.client('bedrock-agent-runtime')
-sqs_client = boto3.client('sqs')
-
-KNOWLEDGE_BASES = {
-    'Alfa': BedrockKnowledgeBase(
-        bedrock_agent_client = bedrock_agents_client, 
-        kb_id = os.environ.get('KB_ALFA'),
-        kb_instance_name = 'Alfa', 
-        max_docs = 5,
-        threshold = 0.40, 
-        search_type = 'HYBRID',
-        s3_bucket = os.environ.get('S3_BUCKET_ALFA'),
-    )
-    # you can add additional KBs here for testing: Bravo, Charlie, Delta, Echo, Foxtrot
-}
-KNOWLEDGE_BASES['Default'] = KNOWLEDGE_BASES['Alfa']
+# boto3 clients, knowledge bases and the optional retrieval, grounding and hedging modules
+# are only created or imported on first use (see test/benchmarks/cold_start.py); the
+# clients are shared through bedrock_utils.clients
+def bedrock_client():
+    return clients.get_client('bedrock-runtime')
+
+# open pooled connections during init, so the first caller does not pay for the handshakes
+# (this creates the runtime clients during init)
+if (prewarm_connections := int(os.environ.get('PREWARM_CONNECTIONS', '0'))) > 0:
+    clients.get_client('bedrock-runtime')
+    clients.get_client('bedrock-agent-runtime')
+    clients.prewarm_clients(prewarm_connections)
+
+# cached retrieval results are fresh for RETRIEVAL_CACHE_TTL seconds (0 disables the cache),
+# then served while they are refreshed in the background for RETRIEVAL_CACHE_STALE_TTL seconds
+RETRIEVAL_CACHE_TTL = int(os.environ.get('RETRIEVAL_CACHE_TTL', '300'))
+
+# optional lexical re-ranking of retrieved chunks: RERANK_FUSION = rrf | weighted
+# (RERANK_TOP_N keeps only the best N chunks after fusion)
+RERANK_FUSION = os.environ.get('RERANK_FUSION')
+
+# RETRIEVAL_SELECTION = adaptive chooses the number of chunks from each result set's scores
+# (the threshold still applies), and tunes numberOfResults per intent
+ADAPTIVE_SELECTION = os.environ.get('RETRIEVAL_SELECTION', 'threshold') == 'adaptive'
+
+# built by select_knowledge_base() on first use
+KNOWLEDGE_BASES = {}
+knowledge_bases_lock = threading.Lock()
+
+def create_knowledge_bases():
+    from bedrock_utils.knowledge_base import BedrockKnowledgeBase
+    from bedrock_utils.retrieval_cache import RetrievalCache
+    from bedrock_utils.reranker import LexicalReranker
+    from bedrock_utils.adaptive_cutoff import AdaptiveCutoff, ResultCountTuner
+
+    retrieval_cache = RetrievalCache(
+        ttl=RETRIEVAL_CACHE_TTL,
+        stale_ttl=int(os.environ.get('RETRIEVAL_CACHE_STALE_TTL', '3600'))
+    ) if RETRIEVAL_CACHE_TTL > 0 else None
+
+    reranker = LexicalReranker(
+        fusion=RERANK_FUSION,
+        top_n=int(os.environ.get('RERANK_TOP_N', '0')) or None
+    ) if RERANK_FUSION else None
+
+    knowledge_bases = {
+        'Alfa': BedrockKnowledgeBase(
+            bedrock_agent_client = clients.get_client('bedrock-agent-runtime'),
+            kb_id = os.environ.get('KB_ALFA'),
+            kb_instance_name = 'Alfa', 
+            max_docs = 5,
+            threshold = 0.40, 
+            search_type = 'HYBRID',
+            s3_bucket = os.environ.get('S3_BUCKET_ALFA'),
+            data_version = os.environ.get('KB_ALFA_DATA_VERSION'),
+            retrieval_cache = retrieval_cache,
+            reranker = reranker,
+            adaptive_cutoff = AdaptiveCutoff(max_count=10) if ADAPTIVE_SELECTION else None,
+            result_count_tuner = ResultCountTuner(min_results=3, max_results=15) if ADAPTIVE_SELECTION else None,
+        )
+        # you can add additional KBs here for testing: Bravo, Charlie, Delta, Echo, Foxtrot
+    }
+    knowledge_bases['Default'] = knowledge_bases['Alfa']
+
+    # optional in-process knowledge base for local runs and retrieval benchmarks, built from the
+    # sample content (e.g. LOCAL_KB_CONTENT=../content/content-word) on first use
+    if (local_kb_index := os.environ.get('LOCAL_KB_INDEX')):
+        from bedrock_utils.local_knowledge_base import LocalKnowledgeBase
+        knowledge_bases['Local'] = LocalKnowledgeBase(
+            index_dir = local_kb_index,
+            content_dir = os.environ.get('LOCAL_KB_CONTENT'),
+            kb_instance_name = 'Local',
+            max_docs = 5,
+            retrieval_cache = retrieval_cache,
+            reranker = reranker,
+        )
+
+    # optional fan-out across several knowledge bases with rank fusion, selected as 'Composite'
+    # (e.g. COMPOSITE_KB=Alfa,Bravo); a backend that misses COMPOSITE_KB_TIMEOUT_MS is left out of the turn
+    if (composite_kb := os.environ.get('COMPOSITE_KB')):
+        from bedrock_utils.composite_knowledge_base import CompositeKnowledgeBase
+        knowledge_bases['Composite'] = CompositeKnowledgeBase(
+            knowledge_bases = [knowledge_bases[name.strip()] for name in composite_kb.split(',')],
+            kb_instance_name = 'Composite',
+            max_docs = 5,
+            threshold = 0.40,
+            timeout_ms = int(os.environ.get('COMPOSITE_KB_TIMEOUT_MS', '1500')),
+            reranker = reranker,
+        )
+
+    # tie cached results to the latest ingestion job, when the data source ID is known
+    if (data_source_id := os.environ.get('KB_ALFA_DATA_SOURCE_ID')):
+        knowledge_bases['Alfa'].sync_data_version(clients.get_client('bedrock-agent'), data_source_id)
+
+    return knowledge_bases
 
 def select_knowledge_base(knowledge_base):
+    if not KNOWLEDGE_BASES:
+        with knowledge_bases_lock:
+            if not KNOWLEDGE_BASES:
+                KNOWLEDGE_BASES.update(create_knowledge_bases())
+
     if knowledge_base and len(knowledge_base) > 0:
         return KNOWLEDGE_BASES.get(knowledge_base)
     else:
         return KNOWLEDGE_BASES.get('Default')
 
 
-CONVERSATIONAL_AGENTS = {
-    'Jurassic 2 Mid': ConversationalAgent(
-        AI21LabsJurassic2Model(bedrock_client, AI21LabsJurassic2Model.JURASSIC_2_MID, 'Jurassic 2 Mid')
-    ),
-    'Jurassic 2 Ultra': ConversationalAgent(
-        AI21LabsJurassic2Model(bedrock_client, AI21LabsJurassic2Model.JURASSIC_2_ULTRA, 'Jurassic 2 Ultra')
-    ),
-    'Jamba Instruct': ConversationalAgent(
-        AI21LabsJambaModel(bedrock_client, AI21LabsJambaModel.JAMBA_INSTRUCT, 'Jamba Instruct')
-    ),
-    'Titan Text G1 Lite': AmazonTitanConversationalAgent(
-        AmazonTitanModel(bedrock_client, AmazonTitanModel.TITAN_TEXT_LITE, 'Titan Text G1 Lite')
-    ),
-    'Titan Text G1 Express': AmazonTitanConversationalAgent(
-        AmazonTitanModel(bedrock_client, AmazonTitanModel.TITAN_TEXT_EXPRESS, 'Titan Text G1 Express')
-    ),
-    'Titan Text G1 Premier': AmazonTitanConversationalAgent(
-        AmazonTitanModel(bedrock_client, AmazonTitanModel.TITAN_TEXT_PREMIER, 'Titan Text G1 Premier')
-    ),
-    'Claude V1 Instant': AnthropicClaude3ConversationalAgent(
-        AnthropicClaudeModel(bedrock_client, AnthropicClaudeModel.CLAUDE_V1_INSTANT, 'Claude V1 Instant')
-    ),
-    'Claude V2': AnthropicClaude3ConversationalAgent(
-        AnthropicClaudeModel(bedrock_client, AnthropicClaudeModel.CLAUDE_V2, 'Claude V2')
-    ),
-    'Claude V2.1': AnthropicClaude3ConversationalAgent(
-        AnthropicClaudeModel(bedrock_client, AnthropicClaudeModel.CLAUDE_V2_1, 'Claude V2.1')
-    ),
-    'Claude V3 Haiku': AnthropicClaude3ConversationalAgent(
-        AnthropicClaudeModel(bedrock_client, AnthropicClaudeModel.CLAUDE_V3_HAIKU, 'Claude V3 Haiku')
-    ),
-    'Claude V3 Sonnet': AnthropicClaude3ConversationalAgent(
-        AnthropicClaudeModel(bedrock_client, AnthropicClaudeModel.CLAUDE_V3_SONNET, 'Claude V3 Sonnet')
-    ),
-    'Claude V3.5 Sonnet': AnthropicClaude3ConversationalAgent(
-        AnthropicClaudeModel(bedrock_client, AnthropicClaudeModel.CLAUDE_V3_5_SONNET, 'Claude V3.5 Sonnet')
-    ),
-    'Claude V3 Opus': AnthropicClaude3ConversationalAgent(
-        AnthropicClaudeModel(bedrock_client, AnthropicClaudeModel.CLAUDE_V3_OPUS, 'Claude V3 Opus')
-    ),
-    'Cohere Command': ConversationalAgent(
-        CohereCommandModel(bedrock_client, CohereCommandModel.COHERE_COMMAND, 'Cohere Command')
-    ),
-    'Cohere Command Light': ConversationalAgent(
-        CohereCommandModel(bedrock_client, CohereCommandModel.COHERE_COMMAND_LIGHT, 'Cohere Command Light')
-    ),
-    'Cohere Command R': ConversationalAgent(
-        CohereCommandModel(bedrock_client, CohereCommandModel.COHERE_COMMAND_R, 'Cohere Command R')
-    ),
-    'Cohere Command R Plus': ConversationalAgent(
-        CohereCommandModel(bedrock_client, CohereCommandModel.COHERE_COMMAND_R_PLUS, 'Cohere Command R Plus')
-    ), 
-    'Llama 3 8B Instruct': ConversationalAgent(
-        Llama3Model(bedrock_client, Llama3Model.LLAMA3_8B_INSTRUCT, 'Llama 3 8B Instruct')
-    ), 
-    'Llama 3 70B Instruct': ConversationalAgent(
-        Llama3Model(bedrock_client, Llama3Model.LLAMA3_70B_INSTRUCT, 'Llama 3 70B Instruct')
-    ), 
-    'Mistral 7B': ConversationalAgent(
-        MistralAIModel(bedrock_client, MistralAIModel.MISTRAL_7B_INSTRUCT, 'Mistral 7B')
-    ), 
-    'Mixtral 8x7B': ConversationalAgent(
-        MistralAIModel(bedrock_client, MistralAIModel.MIXTRAL_8X7B_INSTRUCT, 'Mixtral 8x7B')
-    ), 
-    'Mistral Small': ConversationalAgent(
-        MistralAIModel(bedrock_client, MistralAIModel.MISTRAL_SMALL, 'Mistral Small')
-    ), 
-    'Mistral Large': ConversationalAgent(
-        MistralAIModel(bedrock_client, MistralAIModel.MISTRAL_LARGE, 'Mistral Large')
+# agent and model classes are imported on first use
+HOTEL_AGENT = 'bedrock_utils.hotel_agents.conversational_agent.ConversationalAgent'
+TITAN_AGENT = 'bedrock_utils.hotel_agents.amazon.AmazonTitanConversationalAgent'
+CLAUDE_AGENT = 'bedrock_utils.hotel_agents.anthropic.AnthropicClaude3ConversationalAgent'
+
+JURASSIC_MODEL = 'bedrock_utils.models.ai21.AI21LabsJurassic2Model'
+JAMBA_MODEL = 'bedrock_utils.models.ai21.AI21LabsJambaModel'
+TITAN_MODEL = 'bedrock_utils.models.amazon.AmazonTitanModel'
+CLAUDE_MODEL = 'bedrock_utils.models.anthropic.AnthropicClaudeModel'
+COHERE_MODEL = 'bedrock_utils.models.cohere.CohereCommandModel'
+LLAMA_MODEL = 'bedrock_utils.models.meta.Llama3Model'
+MISTRAL_MODEL = 'bedrock_utils.models.mistral.MistralAIModel'
+
+# judge output (evaluate_response, compare_responses, detect_hallucinations): 'structured'
+# (tool-use or JSON, with one repair call) or 'text' (verdict and rationale on separate lines)
+JUDGE_OUTPUT = os.environ.get('JUDGE_OUTPUT', 'structured')
+
+# hallucination detection: 'llm' (every answer is checked by the detection LLM), 'shadow'
+# (the local grounding check also runs on every answer, and its agreement with the LLM is
+# recorded, see bedrock_utils.grounding_check) or 'cascade' (clear local passes skip the
+# LLM, except for a GROUNDING_CHECK_SAMPLE_RATE sample that keeps measuring agreement)
+GROUNDING_CHECK = os.environ.get('GROUNDING_CHECK', 'llm')
+
+def create_grounding_checker():
+    if GROUNDING_CHECK not in ('shadow', 'cascade'):
+        return None
+
+    from bedrock_utils.grounding_check import GroundingChecker
+
+    return GroundingChecker(
+        sample_rate=1.0 if GROUNDING_CHECK == 'shadow' else float(os.environ.get('GROUNDING_CHECK_SAMPLE_RATE', '0.05'))
     )
-}
-CONVERSATIONAL_AGENTS['Default'] = CONVERSATIONAL_AGENTS['Claude V3 Haiku']
 
-# set default hyperparameters
-for agent in CONVERSATIONAL_AGENTS.values():
-    agent.model_instance.temperature = 0.0
-    agent.model_instance.max_tokens = 1000
-    
-def select_conversational_agent(llm_name):
-    if llm_name and len(llm_name) > 0:
-        return CONVERSATIONAL_AGENTS.get(llm_name)
+GROUNDING_CHECKER = create_grounding_checker()
+
+# optional hedged requests and fallback chains, per entry (only applied when the caller
+# asks for a hedged agent, so offline model comparisons always get answers from the model
+# they selected):
+#   fallbacks:      ordered agent names to try when the primary is slow or fails
+#                   (if empty, the hedged request is sent to the same model)
+#   hedge_delay_ms: delay before sending a hedged request (None = p95 latency of the primary model)
+CONVERSATIONAL_AGENTS = AgentRegistry(
+    bedrock_client,
+    {
+        'Jurassic 2 Mid':        AgentSpec(HOTEL_AGENT,  JURASSIC_MODEL, 'ai21.j2-mid-v1'),
+        'Jurassic 2 Ultra':      AgentSpec(HOTEL_AGENT,  JURASSIC_MODEL, 'ai21.j2-ultra-v1'),
+        'Jamba Instruct':        AgentSpec(HOTEL_AGENT,  JAMBA_MODEL,    'ai21.jamba-instruct-v1:0'),
+        'Titan Text G1 Lite':    AgentSpec(TITAN_AGENT,  TITAN_MODEL,    'amazon.titan-text-lite-v1'),
+        'Titan Text G1 Express': AgentSpec(TITAN_AGENT,  TITAN_MODEL,    'amazon.titan-text-express-v1'),
+        'Titan Text G1 Premier': AgentSpec(TITAN_AGENT,  TITAN_MODEL,    'amazon.titan-text-premier-v1:0'),
+        'Claude V1 Instant':     AgentSpec(CLAUDE_AGENT, CLAUDE_MODEL,   'anthropic.claude-instant-v1'),
+        'Claude V2':             AgentSpec(CLAUDE_AGENT, CLAUDE_MODEL,   'anthropic.claude-v2'),
+        'Claude V2.1':           AgentSpec(CLAUDE_AGENT, CLAUDE_MODEL,   'anthropic.claude-v2:1'),
+        'Claude V3 Haiku':       AgentSpec(CLAUDE_AGENT, CLAUDE_MODEL,   'anthropic.claude-3-haiku-20240307-v1:0',
+                                           fallbacks=['Mistral Small'], hedge_delay_ms=None),
+        'Claude V3 Sonnet':      AgentSpec(CLAUDE_AGENT, CLAUDE_MODEL,   'anthropic.claude-3-sonnet-20240229-v1:0'),
+        'Claude V3.5 Sonnet':    AgentSpec(CLAUDE_AGENT, CLAUDE_MODEL,   'anthropic.claude-3-5-sonnet-20240620-v1:0'),
+        'Claude V3.5 Haiku':     AgentSpec(CLAUDE_AGENT, CLAUDE_MODEL,   'anthropic.claude-3-5-haiku-20241022-v1:0'),
+        'Claude V3 Opus':        AgentSpec(CLAUDE_AGENT, CLAUDE_MODEL,   'anthropic.claude-3-opus-20240229-v1:0'),
+        'Cohere Command':        AgentSpec(HOTEL_AGENT,  COHERE_MODEL,   'cohere.command-text-v14'),
+        'Cohere Command Light':  AgentSpec(HOTEL_AGENT,  COHERE_MODEL,   'cohere.command-light-text-v14'),
+        'Cohere Command R':      AgentSpec(HOTEL_AGENT,  COHERE_MODEL,   'cohere.command-r-v1:0'),
+        'Cohere Command R Plus': AgentSpec(HOTEL_AGENT,  COHERE_MODEL,   'cohere.command-r-plus-v1:0'),
+        'Llama 3 8B Instruct':   AgentSpec(HOTEL_AGENT,  LLAMA_MODEL,    'meta.llama3-8b-instruct-v1:0'),
+        'Llama 3 70B Instruct':  AgentSpec(HOTEL_AGENT,  LLAMA_MODEL,    'meta.llama3-70b-instruct-v1:0'),
+        'Mistral 7B':            AgentSpec(HOTEL_AGENT,  MISTRAL_MODEL,  'mistral.mistral-7b-instruct-v0:2'),
+        'Mixtral 8x7B':          AgentSpec(HOTEL_AGENT,  MISTRAL_MODEL,  'mistral.mixtral-8x7b-instruct-v0:1'),
+        'Mistral Small':         AgentSpec(HOTEL_AGENT,  MISTRAL_MODEL,  'mistral.mistral-small-2402-v1:0'),
+        'Mistral Large':         AgentSpec(HOTEL_AGENT,  MISTRAL_MODEL,  'mistral.mistral-large-2402-v1:0'),
+    },
+    aliases={'Default': 'Claude V3 Haiku'},
+    # default hyperparameters
+    model_parameters={'temperature': 0.0, 'max_tokens': 1000},
+    agent_parameters={'structured_output': JUDGE_OUTPUT == 'structured', 'grounding_checker': GROUNDING_CHECKER}
+)
+
+HEDGED_AGENTS = {}
+
+# cheaper agent used once a session or daily cost budget is exhausted (see bedrock_utils.metering)
+BUDGET_FALLBACK_LLM = os.environ.get('BUDGET_FALLBACK_LLM', 'Mistral 7B')
+
+# exact-match response cache (RESPONSE_CACHE_TTL = 0 disables it); optionally shared
+# across Lambda instances through a DynamoDB table, or a local SQLite file for notebooks
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+def create_response_cache():
+    if RESPONSE_CACHE_TTL <= 0:
+        return None
+
+    shared_backend = None
+    if (table_name := os.environ.get('RESPONSE_CACHE_TABLE')):
+        shared_backend = response_cache.DynamoDBCacheBackend(clients.get_client('dynamodb'), table_name)
+    elif (sqlite_path := os.environ.get('RESPONSE_CACHE_SQLITE')):
+        shared_backend = response_cache.SQLiteCacheBackend(sqlite_path)
+
+    return response_cache.ResponseCache(
+        local_cache=response_cache.LRUCache(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL),
+        shared_backend=shared_backend,
+        ttl=RESPONSE_CACHE_TTL
+    )
+
+RESPONSE_CACHE = create_response_cache()
+
+# optional semantic question cache (SEMANTIC_CACHE_THRESHOLD = 0 disables it); NumPy is
+# only imported when it is enabled
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0'))
+
+def create_semantic_cache():
+    if SEMANTIC_CACHE_THRESHOLD <= 0:
+        return None
+
+    from bedrock_utils import semantic_cache
+
+    if os.environ.get('SEMANTIC_CACHE_EMBEDDER', 'titan') == 'hashing':
+        embedder = semantic_cache.HashingEmbedder()
     else:
-        return CONVERSATIONAL_AGENTS.get('Default')
+        embedder = semantic_cache.TitanEmbedder(bedrock_client())
+
+    return semantic_cache.SemanticCache(
+        embedder,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        max_bytes=int(os.environ.get('SEMANTIC_CACHE_MAX_BYTES', str(4 * 1024 * 1024))),
+        dtype=os.environ.get('SEMANTIC_CACHE_DTYPE', 'int8'),
+        ttl=int(os.environ.get('SEMANTIC_CACHE_TTL', '3600'))
+    )
+
+SEMANTIC_CACHE = create_semantic_cache()
+
+# backend for offline batch inference jobs (the *_offline agent methods, used by the notebooks):
+# Bedrock model invocation jobs when BATCH_INFERENCE_ROLE_ARN and BATCH_INFERENCE_S3_URI are
+# set (e.g. s3://<bucket>/batch-inference/, see notebooks/iam-roles/bedrock-batch-inference.json),
+# otherwise a local stand-in that runs each record on demand
+def create_batch_backend():
+    from bedrock_utils import batch_inference
+
+    role_arn = os.environ.get('BATCH_INFERENCE_ROLE_ARN')
+    s3_uri = os.environ.get('BATCH_INFERENCE_S3_URI')
+    if role_arn and s3_uri:
+        return batch_inference.BedrockBatchBackend(
+            clients.get_client('bedrock'), clients.get_client('s3'), role_arn, s3_uri,
+            timeout_hours=int(os.environ.get('BATCH_INFERENCE_TIMEOUT_HOURS', str(batch_inference.BATCH_TIMEOUT_HOURS)))
+        )
+    return batch_inference.LocalBatchBackend(bedrock_client())
+
+def select_conversational_agent(llm_name, hedged=False):
+    if not llm_name or len(llm_name) == 0:
+        llm_name = 'Default'
+
+    if not (agent := CONVERSATIONAL_AGENTS.get(llm_name)):
+        return None
+
+    spec = CONVERSATIONAL_AGENTS.spec(llm_name)
+    if hedged and spec.fallbacks is not None:
+        if llm_name not in HEDGED_AGENTS:
+            from bedrock_utils.conversational_agents.hedged_agent import HedgedConversationalAgent
+            HEDGED_AGENTS[llm_name] = HedgedConversationalAgent(
+                agent,
+                fallback_agents=[CONVERSATIONAL_AGENTS[name] for name in spec.fallbacks],
+                hedge_delay_ms=spec.hedge_delay_ms
+            )
+        return HEDGED_AGENTS[llm_name]
+
+    return agent
     
 def queue_hallucination_scan(event, question, answer, context):
+    from bedrock_utils.retrieved_context import RetrievedContext
+
     try:
+        # a RetrievedContext is sent as its chunks, so the detector can check only the relevant ones
+        if isinstance(context, RetrievedContext):
+            context = context.to_json()
         body = {'event': event, 'question': question, 'answer': answer, 'context': context}
-        response = sqs_client.send_message(
+        response = clients.get_client('sqs').send_message(
             QueueUrl=os.environ.get('SQS_QUEUE_URL'),
             MessageBody=json.dumps(body)
         )
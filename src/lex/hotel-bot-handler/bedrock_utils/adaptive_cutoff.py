@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Adaptive relevance cutoff and per-intent numberOfResults
+
+A static threshold and max_docs waste tokens on weak chunks for narrow questions, and
+truncate useful chunks for broad ones. AdaptiveCutoff chooses how many of the ranked
+results to keep from the score distribution of each result set:
+ - results scoring below top_ratio * the top score are never kept
+ - within those, the result set is cut at the largest score gap (relative to the top
+   score), if that gap is at least min_gap
+ - at least min_count and at most max_count results are kept
+
+ResultCountTuner adjusts numberOfResults per intent from the number of results the cutoff
+actually kept (an exponentially weighted average with headroom). When the cutoff keeps
+every result it was given, the result set was probably truncated, so the next request for
+that intent asks for more.
+"""
+
+import logging
+import math
+import threading
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+class AdaptiveCutoff(object):
+    def __init__(
+        self,
+        min_count: int = 1,
+        max_count: int = 10,
+        top_ratio: float = 0.75,
+        min_gap: float = 0.08
+    ) -> None:
+        self.min_count = min_count
+        self.max_count = max_count
+        self.top_ratio = top_ratio
+        self.min_gap = min_gap
+
+    def select(self, scores: list) -> dict:
+        """Returns the number of leading scores to keep, and the score at the cutoff"""
+        if not scores or scores[0] <= 0:
+            return {'count': 0, 'cutoff_score': None, 'reason': 'no results'}
+
+        top = scores[0]
+        candidates = 1
+        while candidates < min(len(scores), self.max_count) and scores[candidates] >= top * self.top_ratio:
+            candidates += 1
+
+        count = candidates
+        reason = 'ratio' if candidates < len(scores) else 'all'
+        gaps = [((scores[i - 1] - scores[i]) / top, i) for i in range(max(1, self.min_count), candidates)]
+        if gaps and (largest := max(gaps))[0] >= self.min_gap:
+            count = largest[1]
+            reason = 'gap'
+
+        count = max(min(self.min_count, len(scores)), count)
+        return {'count': count, 'cutoff_score': scores[count - 1], 'reason': reason}
+
+
+class ResultCountTuner(object):
+    def __init__(
+        self,
+        min_results: int = 3,
+        max_results: int = 20,
+        headroom: float = 1.5,
+        alpha: float = 0.2
+    ) -> None:
+        self._min_results = min_results
+        self._max_results = max_results
+        self._headroom = headroom
+        self._alpha = alpha
+        self._kept = {}
+        self._lock = threading.Lock()
+
+    def number_of_results(self, intent: str, default: int) -> int:
+        with self._lock:
+            if (kept := self._kept.get(intent)) is None:
+                return default
+        return max(self._min_results, min(self._max_results, math.ceil(kept * self._headroom)))
+
+    def observe(self, intent: str, kept: int, requested: int, returned: int) -> None:
+        with self._lock:
+            previous = self._kept.get(intent)
+            average = kept if previous is None else (1 - self._alpha) * previous + self._alpha * kept
+            # every result was kept, and the service returned all that was asked for: ask for more next time
+            if kept >= returned and returned >= requested:
+                average = max(average, (requested + 1) / self._headroom)
+            self._kept[intent] = average
+        logger.debug(f'<<ResultCountTuner>> {intent}: kept {kept} of {returned} ({requested} requested), average = {average:.2f}')
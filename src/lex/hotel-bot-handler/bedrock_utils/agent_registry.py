@@ -0,0 +1,136 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Lazy registry of conversational agents
+
+Agents are declared as lightweight AgentSpec entries, naming the agent class, the model
+wrapper class and the model ID. An agent - and its provider module - is only imported and
+instantiated the first time it is selected, so a Lambda cold start pays only for the
+agent that the session actually uses.
+
+    registry = AgentRegistry(bedrock_client, {
+        'Claude V3 Haiku': AgentSpec(
+            'bedrock_utils.hotel_agents.anthropic.AnthropicClaude3ConversationalAgent',
+            'bedrock_utils.models.anthropic.AnthropicClaudeModel',
+            'anthropic.claude-3-haiku-20240307-v1:0'
+        )
+    }, aliases={'Default': 'Claude V3 Haiku'})
+
+    agent = registry.get('Default')
+
+The Bedrock client can also be given as a function that returns it, so that the client is
+only created with the first agent.
+"""
+
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def import_class(class_path: str):
+    module_name, class_name = class_path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class AgentSpec(object):
+    __slots__ = ('agent_class', 'model_class', 'model_id', 'fallbacks', 'hedge_delay_ms')
+
+    def __init__(
+        self,
+        agent_class: str,
+        model_class: str,
+        model_id: str,
+        fallbacks: list = None,
+        hedge_delay_ms: int = None
+    ) -> None:
+        self.agent_class = agent_class
+        self.model_class = model_class
+        self.model_id = model_id
+        # optional hedged requests and fallback chain (see HedgedConversationalAgent)
+        self.fallbacks = fallbacks
+        self.hedge_delay_ms = hedge_delay_ms
+
+
+class AgentRegistry(object):
+    def __init__(
+        self,
+        bedrock_client,
+        specs: dict,
+        aliases: dict = None,
+        model_parameters: dict = None,
+        agent_parameters: dict = None
+    ) -> None:
+        self._bedrock_client = bedrock_client
+        self._specs = specs
+        self._aliases = aliases if aliases else {}
+        self._model_parameters = model_parameters if model_parameters else {}
+        self._agent_parameters = agent_parameters if agent_parameters else {}
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, name: str) -> str:
+        return self._aliases.get(name, name)
+
+    def spec(self, name: str) -> AgentSpec:
+        return self._specs.get(self.resolve(name))
+
+    def get(self, name: str, default=None):
+        name = self.resolve(name)
+        if name not in self._specs:
+            return default
+
+        with self._lock:
+            if (agent := self._agents.get(name)) is None:
+                agent = self._materialize(name, self._specs[name])
+                self._agents[name] = agent
+        return agent
+
+    def _materialize(self, name: str, spec: AgentSpec):
+        start_time = time.time()
+
+        model_class = import_class(spec.model_class)
+        agent_class = import_class(spec.agent_class)
+
+        if callable(self._bedrock_client):
+            self._bedrock_client = self._bedrock_client()
+
+        model_instance = model_class(self._bedrock_client, spec.model_id, name)
+        for parameter, value in self._model_parameters.items():
+            setattr(model_instance, parameter, value)
+        agent = agent_class(model_instance)
+        for parameter, value in self._agent_parameters.items():
+            setattr(agent, parameter, value)
+
+        logger.info(f'<<AgentRegistry>> created agent "{name}" in {int((time.time() - start_time) * 1000)} ms')
+        return agent
+
+    def __getitem__(self, name: str):
+        if (agent := self.get(name)) is None:
+            raise KeyError(name)
+        return agent
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve(name) in self._specs
+
+    def keys(self) -> list:
+        return list(self._specs.keys()) + list(self._aliases.keys())
+
+    @property
+    def loaded(self) -> list:
+        return list(self._agents.keys())
@@ -30,7 +30,7 @@ import datetime
 import uuid
 import random
 
-from bedrock_utilsself.models.bedrock_model import BedrockModel
+from bedrock_utils.models.bedrock_model import BedrockModel
 from bedrock_utils.conversational_agents.conversational_agent import ConversationalAgent
 
 logger = logging.getLogger()
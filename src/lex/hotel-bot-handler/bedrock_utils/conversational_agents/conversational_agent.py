@@ -21,21 +21,100 @@ including:
 - evaluate_response: compare a generated response to a "ground truth" response
 - compare_responses: compare two reponses and determine which is "better"
 - detect_hallucinations: detect hallucinations in a generated response by checking the context
+
+Each method has an asyncio counterpart (generate_response_async, evaluate_response_async,
+compare_responses_async, detect_hallucinations_async) that runs on a bounded executor.
+
+Prompt templates are compiled once (see bedrock_utils.prompt_template) and rendered in a
+single pass; build_prompt, build_evaluation_prompt, build_comparison_prompt and
+build_detection_prompt return the rendered prompts. Subclasses add answer prompt slot
+values (e.g. the randomized tag name) by overriding get_prompt_values.
+
+When cache_context is set and the model supports prompt caching, generate_response passes
+the answer prompt up to its first per-question slot (the system block, date, guardrails and
+documents, see build_cache_prefix) as the cacheable prefix, so later turns that reuse the
+same context read it from the cache. Writing the cache costs more than sending the prefix
+uncached, so the caller only sets cache_context on turns that write a prefix a later turn
+reads, or read one an earlier turn wrote (see the retrieval planner's cacheable flag);
+cache_read_tokens and cache_write_tokens are returned with input_tokens.
+
+With structured_output, the judge methods (evaluate_response, compare_responses and
+detect_hallucinations) ask for tool-use or JSON output and parse it tolerantly, with at
+most one repair call (see bedrock_utils.judge_output); the result and rationale keep the
+same values as with the text output. Each judge response reports its output_format and
+parse_status ('parsed', 'repaired' or 'failed').
+
+evaluate_responses_batch and detect_hallucinations_batch grade many items per model call:
+items are packed into batches within a token budget, each batch asks for indexed
+structured verdicts (documents shared by several detection items are included once), a
+batch that fails is split in two, and items without a valid verdict are retried one at a
+time with evaluate_response / detect_hallucinations. Each item gets the same response
+dictionary as the single-item method, plus batch_size.
+
+generate_responses_offline, evaluate_responses_offline and detect_hallucinations_offline
+run one prompt per item as a Bedrock batch inference job (see bedrock_utils.batch_inference),
+for large offline runs; judge verdicts that cannot be parsed are retried on demand.
+
+When max_sentences is set, generate_response streams the LLM response and stops generation
+as soon as that many complete sentences have arrived; the response then has 'stopped_early' set.
+
+When a response_cache is set, generate_response returns a cached response for an identical
+(model, temperature, prompt, cache_namespace) request instead of invoking the LLM.
+
+The context and document arguments may be a string or a RetrievedContext; a RetrievedContext
+is rendered when the prompt is built, and detect_hallucinations only passes the chunks that
+are relevant to the answer to the detection prompt.
+
+When a grounding_checker is set, detect_hallucinations first checks the answer's prices,
+dates, numbers and names against the context locally (see bedrock_utils.grounding_check),
+and only skips the LLM for a clear local pass (except for a sample of them); the response
+reports the detection_stage ('local' or 'llm') and local verdict.
 """
 
 import json
 import logging
 import time
-import datetime
 import uuid
 import random
+import re
+import html
 
 from bedrock_utils.models.bedrock_model import BedrockModel
+from bedrock_utils.executor import run_in_executor
+from bedrock_utils.response_cache import ResponseCache
+from bedrock_utils.retrieved_context import RetrievedContext
+from bedrock_utils.prompt_template import PromptTemplate, compile_template, current_date
+from bedrock_utils.judge_output import JUDGES, JudgeOutputParser, REPAIR_MAX_TOKENS, record_judge_call
+from bedrock_utils.judge_output import BATCH_PREFILL, pack_batches
+from bedrock_utils.batch_inference import BatchBackend, BatchInferenceJob
+from bedrock_utils.grounding_check import GroundingChecker, record_grounding_check
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# batched judges: input token budget and item limit per call, and the output tokens allowed per item
+BATCH_MAX_TOKENS = 12000
+BATCH_MAX_ITEMS = 10
+BATCH_ITEM_OUTPUT_TOKENS = 120
+BATCH_BASE_OUTPUT_TOKENS = 100
+
+# role marker lines, removed from the batch prompts of agents whose prompts do not use them
+ROLE_MARKER = re.compile(r'^(?:System|Human):[ \t]*\n', re.MULTILINE)
+TRAILING_ASSISTANT = re.compile(r'\s*Assistant:\s*$')
+
+def batch_field(text: str) -> str:
+    # one line per field, and no markup that could end an item early
+    return html.escape(text.replace('\n', ' ').strip(), quote=False)
+
+# model_id reported by detections decided by the local grounding check
+GROUNDING_CHECK_MODEL_ID = 'local-grounding-check'
+
+# a sentence is complete once its terminal punctuation is followed by whitespace
+SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s')
+
 class ConversationalAgent(object):
+    # default templates are built once per agent class, and shared by all of its instances
+    _shared_defaults = {}
 
     def __init__(
         self, 
@@ -47,56 +126,138 @@ class ConversationalAgent(object):
         evaluation_prompt: str = None,
         comparison_prompt: str = None,
         detection_prompt: str = None,
+        max_sentences: int = None,
+        response_cache: ResponseCache = None,
+        cache_namespace: str = None,
+        structured_output: bool = False,
+        grounding_checker: GroundingChecker = None,
+        cache_context: bool = False
     ) -> None:
         self._model_instance = model_instance
         self._guardrails = guardrails
         self._context = context
         self._detection_prompt = detection_prompt
+        self._max_sentences = max_sentences
+        self._response_cache = response_cache
+        self._cache_namespace = cache_namespace
+        self._structured_output = structured_output
+        self._grounding_checker = grounding_checker
+        self._cache_context = cache_context
 
         if answer_prompt:
             self._answer_prompt = answer_prompt
         else:
-            self._answer_prompt = self.get_default_answer_prompt()
+            self._answer_prompt = self.get_shared_default('answer_prompt')
             
         if no_context_answer_prompt:
             self._no_context_answer_prompt = no_context_answer_prompt
         else:
-            self._no_context_answer_prompt = self.get_default_answer_prompt_no_context()
+            self._no_context_answer_prompt = self.get_shared_default('answer_prompt_no_context')
 
         if evaluation_prompt:
             self._evaluation_prompt = evaluation_prompt
         else:
-            self._evaluation_prompt = self.get_default_evaluation_prompt()
+            self._evaluation_prompt = self.get_shared_default('evaluation_prompt')
 
         if comparison_prompt:
             self._comparison_prompt = comparison_prompt
         else:
-            self._comparison_prompt = self.get_default_comparison_prompt()
+            self._comparison_prompt = self.get_shared_default('comparison_prompt')
 
         if detection_prompt:
             self._detection_prompt = detection_prompt
         else:
-            self._detection_prompt = self.get_default_detection_prompt()
+            self._detection_prompt = self.get_shared_default('detection_prompt')
             
-    def build_prompt(self, context: str, user_input: str) -> str:
+    def get_shared_default(self, name: str) -> str:
+        key = (type(self), name)
+        if (template := ConversationalAgent._shared_defaults.get(key)) is None:
+            template = getattr(self, 'get_default_' + name)()
+            ConversationalAgent._shared_defaults[key] = template
+        return template
+
+    def get_answer_template(self) -> PromptTemplate:
         template = self._answer_prompt if self._context else self._no_context_answer_prompt        
-        guardrails = self.get_default_guardrails_on() if self._guardrails else self.get_default_guardrails_off()
+        guardrails = self.get_shared_default('guardrails_on') if self._guardrails else self.get_shared_default('guardrails_off')
+        return compile_template(template, guardrails=guardrails)
+
+    def get_prompt_values(self) -> dict:
+        """Additional slot values for the answer prompt (e.g. a per-call randomized tag name)"""
+        return {}
 
-        today = datetime.datetime.now().strftime('%B %-d, %Y')
-        prompt = template.replace('{current_date}', today)
-        prompt = prompt.replace('{context}', context)
-        prompt = prompt.replace('{guardrails}', guardrails)
-        prompt = prompt.replace('{user_question}', user_input)
+    def build_prompt(self, context: str, user_input: str) -> str:
+        return self.get_answer_template().render(
+            current_date=current_date(),
+            context=str(context),
+            user_question=user_input,
+            **self.get_prompt_values()
+        )
 
-        return prompt
+    def build_cache_prefix(self, context: str) -> str:
+        """The start of the answer prompt that is the same for every question on this context"""
+        return self.get_answer_template().prefix(current_date=current_date(), context=str(context))
 
     def post_process_response(self, response: str) -> str:
         response = response.replace('\n', ' ').strip()
         return response
     
+    def stream_response(self, prompt: str, max_sentences: int, **kwargs) -> dict:
+        stream = self._model_instance.invoke_stream(prompt, **kwargs)
+        
+        text = ''
+        for delta in stream:
+            text += delta
+            sentence_ends = [match.end() for match in SENTENCE_END.finditer(text)]
+            if len(sentence_ends) >= max_sentences:
+                stream.close()
+                stream.response['prediction'] = text[:sentence_ends[max_sentences - 1]]
+                stream.response['stopped_early'] = True
+                logger.info(f'<<stream_response>> stopped after {max_sentences} sentences')
+                break
+        
+        return stream.response
+
+    def get_cached_response(self, prompt: str) -> tuple:
+        start_time = time.time()
+        cache_key = self._response_cache.make_key(
+            self._model_instance.model_id,
+            getattr(self._model_instance, 'temperature', None),
+            prompt,
+            self._cache_namespace,
+            context=self._context,
+            guardrails=self._guardrails,
+            max_sentences=self._max_sentences
+        )
+        cached_response = self._response_cache.get(cache_key)
+        lookup_time = int((time.time() - start_time) * 1000)  # milliseconds
+        logger.info(f'<<get_cached_response>> cache {"HIT" if cached_response else "MISS"} in {lookup_time} ms')
+
+        if cached_response:
+            cached_response = dict(cached_response, prompt=prompt, input_tokens=0, output_tokens=0,
+                                   first_token_time=lookup_time, invocation_time=lookup_time)
+        return cache_key, cached_response, lookup_time
+
     def generate_response(self, context: str, user_input: str) -> dict:        
+        context = str(context)
         prompt = self.build_prompt(context, user_input)
-        llm_response = self._model_instance.invoke(prompt)
+
+        cache_key = None
+        cache_lookup_time = None
+        if self._response_cache is not None:
+            cache_key, cached_response, cache_lookup_time = self.get_cached_response(prompt)
+            if cached_response:
+                cached_response['cache_hit'] = True
+                cached_response['cache_lookup_time'] = cache_lookup_time
+                return cached_response
+        
+        invoke_args = {}
+        if self._cache_context and self._model_instance.supports_prompt_caching:
+            invoke_args['cache_prefix'] = self.build_cache_prefix(context)
+
+        if self._max_sentences:
+            llm_response = self.stream_response(prompt, self._max_sentences, **invoke_args)
+        else:
+            llm_response = self._model_instance.invoke(prompt, **invoke_args)
         
         if (response := llm_response.get('prediction')):
             llm_response['prediction'] = self.post_process_response(response)
@@ -105,154 +266,489 @@ class ConversationalAgent(object):
         
         response = {
             'prompt': prompt,
+            'model_id': self._model_instance.model_id,
             'request_id': llm_response.get('request_id'),
             'input_tokens': llm_response.get('input_tokens'),
             'output_tokens': llm_response.get('output_tokens'),
+            'cache_read_tokens': llm_response.get('cache_read_tokens', 0),
+            'cache_write_tokens': llm_response.get('cache_write_tokens', 0),
+            'first_token_time': llm_response.get('first_token_time'),
             'invocation_time': llm_response.get('invocation_time'),
             'response': llm_response.get('prediction')
-        }        
+        }
+        if llm_response.get('error'):
+            response['error'] = llm_response['error']
+        if llm_response.get('stopped_early'):
+            response['stopped_early'] = True
+
+        if cache_key is not None:
+            response['cache_hit'] = False
+            response['cache_lookup_time'] = cache_lookup_time
+            if not llm_response.get('error'):
+                self._response_cache.put(cache_key, {
+                    'model_id': response['model_id'],
+                    'request_id': response['request_id'],
+                    'response': response['response']
+                })
         return response
 
     
+    def invoke_judge(self, judge: str, prompt: str) -> dict:
+        """Invokes a judge prompt, and adds the parsed result and rationale to the LLM response"""
+        schema = JUDGES[judge]
+        model_id = self._model_instance.model_id
+
+        if not self._structured_output:
+            llm_response = self._model_instance.invoke(prompt)
+            llm_response['prompt'] = prompt
+            llm_response['output_format'] = 'text'
+            llm_response['result'], llm_response['rationale'] = schema.parse_text(llm_response.get('prediction').strip())
+            llm_response['parse_status'] = 'failed' if llm_response['result'] == 'ERROR' else 'parsed'
+            record_judge_call(model_id, judge, 'text', llm_response['parse_status'],
+                              (llm_response.get('input_tokens') or 0) + (llm_response.get('output_tokens') or 0))
+            return llm_response
+
+        output_format = 'tool' if self._model_instance.supports_tool_use else 'json'
+        structured_prompt, prefill = schema.structured_prompt(prompt, output_format)
+        invoke_args = {'tool': schema.tool} if output_format == 'tool' else {}
+
+        parser = JudgeOutputParser(schema, prefill)
+        stream = self._model_instance.invoke_stream(structured_prompt, **invoke_args)
+        for delta in stream:
+            if parser.feed(delta):
+                # the object is complete, anything after it is not needed
+                stream.close()
+                break
+        llm_response = stream.response
+        llm_response['prediction'] = parser.text.strip() if parser.text else llm_response.get('prediction', '')
+        tokens = (llm_response.get('input_tokens') or 0) + (llm_response.get('output_tokens') or 0)
+
+        parse_status = 'parsed'
+        repair_tokens = 0
+        if (parsed := parser.parse()) is None:
+            # one repair call, on the response alone
+            repair_prompt, repair_prefill = schema.repair_prompt(
+                llm_response['prediction'], assistant='Assistant:' in structured_prompt)
+            repair_response = self._model_instance.invoke(repair_prompt, max_tokens=REPAIR_MAX_TOKENS)
+            repair_tokens = (repair_response.get('input_tokens') or 0) + (repair_response.get('output_tokens') or 0)
+            repair_parser = JudgeOutputParser(schema, repair_prefill)
+            repair_parser.feed(repair_response.get('prediction', ''))
+            parsed = repair_parser.parse()
+            parse_status = 'repaired' if parsed else 'failed'
+            for key in ('input_tokens', 'output_tokens'):
+                if llm_response.get(key) is not None:
+                    llm_response[key] += repair_response.get(key) or 0
+
+        llm_response['prompt'] = structured_prompt
+        llm_response['output_format'] = output_format
+        llm_response['parse_status'] = parse_status
+        llm_response['result'], llm_response['rationale'] = parsed if parsed else ('ERROR', 'Unparseable test result')
+        record_judge_call(model_id, judge, output_format, parse_status, tokens, repair_tokens)
+        return llm_response
+
+    def build_evaluation_prompt(self, question: str, answer: str, ground_truth: str) -> str:
+        return compile_template(self._evaluation_prompt).render(
+            current_date=current_date(),
+            question=question.replace('\n', ' ').strip(),
+            ground_truth=ground_truth.replace('\n', ' ').strip(),
+            answer=answer.replace('\n', ' ').strip()
+        )
+
     def evaluate_response(self, question: str, answer: str, ground_truth: str) -> dict:        
-        today = datetime.datetime.now().strftime('%B %-d, %Y')
-        prompt = self._evaluation_prompt.replace('{current_date}', today)
-        prompt = prompt.replace('{question}', question.replace('\n', ' ').strip())
-        prompt = prompt.replace('{ground_truth}', ground_truth.replace('\n', ' ').strip())
-        prompt = prompt.replace('{answer}', answer.replace('\n', ' ').strip())
+        prompt = self.build_evaluation_prompt(question, answer, ground_truth)
 
-        llm_response = self._model_instance.invoke(prompt)
+        llm_response = self.invoke_judge('evaluation', prompt)
 
         logger.info(f'LLM RESPONSE = {json.dumps(llm_response, indent=4)}')
-        prediction = llm_response.get('prediction').strip()
         
-        response = {
-            'prompt': prompt,
-            'request_id': llm_response.get('request_id'),
-            'input_tokens': llm_response.get('input_tokens'),
-            'output_tokens': llm_response.get('output_tokens'),
-            'invocation_time': llm_response.get('invocation_time'),
-            'response': prediction,
-            'result': None,
-            'rationale': None
-        }
-        
-        if not '\n' in prediction:
-            response['result'] = 'ERROR'
-            response['rationale'] = 'Missing newline in test result'
-        else:
-            parts = prediction.split('\n')
-            result = parts[0].strip()
-            rationale = ' '.join(parts[1:]).strip()
-
-            if 'yes' in result.lower():
-                response['result'] = 'PASSED'
-                response['rationale'] = rationale
-            elif 'no' in result.lower():
-                response['result'] = 'FAILED'
-                response['rationale'] = rationale
-            else:
-                response['result'] = 'ERROR'
-                response['rationale'] = 'Unsupported test result'
-                
-        return response
+        return self.judge_response(llm_response)
+
 
+    def build_comparison_prompt(self, question: str, document: str, response_1: str, response_2: str) -> str:
+        return compile_template(self._comparison_prompt).render(
+            current_date=current_date(),
+            question=question.strip(),
+            document=str(document),
+            answer_1=response_1.strip(),
+            answer_2=response_2.strip()
+        )
 
     def compare_responses(self, question: str, document: str, response_1: str, response_2: str) -> dict:        
-        today = datetime.datetime.now().strftime('%B %-d, %Y')
-        
-        prompt = self._comparison_prompt.replace('{current_date}', today)
-        prompt = prompt.replace('{question}', question.strip())
-        prompt = prompt.replace('{document}', document)
-        prompt = prompt.replace('{answer_1}', response_1.strip())
-        prompt = prompt.replace('{answer_2}', response_2.strip())
+        prompt = self.build_comparison_prompt(question, document, response_1, response_2)
         
         logger.info('<<compare_responses>> prompt={}'.format(prompt))
 
-        llm_response = self._model_instance.invoke(prompt)
+        llm_response = self.invoke_judge('comparison', prompt)
         
         logger.info(f'LLM RESPONSE = {json.dumps(llm_response, indent=4)}')
-        prediction = llm_response.get('prediction').strip()
         
-        response = {
-            'prompt': prompt,
-            'request_id': llm_response.get('request_id'),
-            'input_tokens': llm_response.get('input_tokens'),
-            'output_tokens': llm_response.get('output_tokens'),
-            'invocation_time': llm_response.get('invocation_time'),
-            'response': prediction,
-            'result': None,
-            'rationale': None
-        }
-        
-        if not '\n' in prediction:
-            response['result'] = 'ERROR'
-            response['rationale'] = 'Missing newline in test result'
-        else:
-            parts = prediction.split('\n')
-            result = parts[0].strip()
-            rationale = ' '.join(parts[1:]).strip()
-
-            if '1' in result:
-                response['result'] = 'ANSWER 1'
-                response['rationale'] = rationale
-            elif '2' in result:
-                response['result'] = 'ANSWER 2'
-                response['rationale'] = rationale
-            elif '0' in result:
-                response['result'] = 'NO EVALUATION'
-                response['rationale'] = rationale
-            else:
-                response['result'] = 'ERROR'
-                response['rationale'] = 'Unsupported test result'
-                
-        return response
+        return self.judge_response(llm_response)
 
     
+    def build_detection_prompt(self, question: str, answer: str, document: str) -> str:
+        return compile_template(self._detection_prompt).render(
+            current_date=current_date(),
+            question=question.replace('\n', ' ').strip(),
+            document=str(document),
+            answer=answer.replace('\n', ' ').strip()
+        )
+
     def detect_hallucinations(self, question: str, answer: str, document: str) -> dict:
-        today = datetime.datetime.now().strftime('%B %-d, %Y')
-        prompt = self._detection_prompt.replace('{current_date}', today)
-        prompt = prompt.replace('{question}', question.replace('\n', ' ').strip())
-        prompt = prompt.replace('{document}', document)
-        prompt = prompt.replace('{answer}', answer.replace('\n', ' ').strip())
+        grounding = None
+        sampled = False
+        if self._grounding_checker:
+            # checked against the whole context, a claim may come from a chunk that is not narrowed in
+            grounding = self._grounding_checker.check(question, answer, document)
+            logger.info(f'<<detect_hallucinations>> local verdict = {grounding["verdict"]}: {grounding["rationale"]}')
+            if self._grounding_checker.decides(grounding['verdict']):
+                if not (sampled := self._grounding_checker.sample()):
+                    record_grounding_check(self._model_instance.model_id, grounding['verdict'])
+                    return self.grounding_response(grounding)
+
+        num_chunks = None
+        if isinstance(document, RetrievedContext):
+            relevant = document.relevant_to(answer)
+            logger.info(f'<<detect_hallucinations>> checking {relevant.num_chunks} of {document.num_chunks} chunks')
+            document = relevant
+            num_chunks = relevant.num_chunks
+
+        prompt = self.build_detection_prompt(question, answer, document)
 
         logger.info('<<detect_hallucinations>> prompt={}'.format(prompt))
 
-        llm_response = self._model_instance.invoke(prompt)
+        llm_response = self.invoke_judge('detection', prompt)
 
         logger.debug(f'LLM RESPONSE = {json.dumps(llm_response, indent=4)}')
-        prediction = llm_response.get('prediction').strip()
 
-        response = {
-            'prompt': prompt,
+        response = self.judge_response(llm_response)
+        response['document_chunks'] = num_chunks
+        if grounding:
+            record_grounding_check(self._model_instance.model_id, grounding['verdict'], response['result'], sampled)
+            response['detection_stage'] = 'llm'
+            response['local_verdict'] = grounding['verdict']
+        return response
+
+    def grounding_response(self, grounding: dict) -> dict:
+        # a detection decided by the local grounding check, with the same keys as a judge response
+        return {
+            'prompt': None,
+            'model_id': GROUNDING_CHECK_MODEL_ID,
+            'request_id': None,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'invocation_time': grounding['check_time'],
+            'response': json.dumps({'verdict': grounding['verdict'], 'rationale': grounding['rationale']}),
+            'output_format': 'local',
+            'parse_status': 'parsed',
+            'result': grounding['verdict'],
+            'rationale': grounding['rationale'],
+            'document_chunks': None,
+            'detection_stage': 'local',
+            'local_verdict': grounding['verdict'],
+            'claims': grounding['claims']
+        }
+
+    def judge_response(self, llm_response: dict) -> dict:
+        return {
+            'prompt': llm_response['prompt'],
+            'model_id': self._model_instance.model_id,
             'request_id': llm_response.get('request_id'),
             'input_tokens': llm_response.get('input_tokens'),
             'output_tokens': llm_response.get('output_tokens'),
             'invocation_time': llm_response.get('invocation_time'),
-            'response': prediction,
-            'result': None,
-            'rationale': None
+            'response': llm_response.get('prediction').strip(),
+            'output_format': llm_response['output_format'],
+            'parse_status': llm_response['parse_status'],
+            'result': llm_response['result'],
+            'rationale': llm_response['rationale']
         }
 
-        if not '\n' in prediction:
-            response['result'] = 'ERROR'
-            response['rationale'] = 'Missing newline in test result'
+    def build_batch_prompt(self, template: str, judge_prompt: str, output_format: str, **values) -> str:
+        # a batch uses Human/Assistant markers only if the batched judge's own template does
+        body = TRAILING_ASSISTANT.sub('', compile_template(template).render(current_date=current_date(), **values))
+        role_markers = 'Assistant:' in judge_prompt
+        if not role_markers:
+            body = ROLE_MARKER.sub('', body)
+        if output_format == 'tool':
+            return body.strip() + '\n'
+        return body.strip() + '\n\n' + ('Assistant: ' if role_markers else '') + BATCH_PREFILL
+
+    def judge_batch(self, judge: str, entries: list, build_prompt, item_tokens, single,
+                    max_batch_tokens: int, max_batch_items: int) -> list:
+        """Runs a judge over entries in batches; see evaluate_responses_batch"""
+        schema = JUDGES[judge]
+        model_id = self._model_instance.model_id
+        output_format = 'tool' if self._model_instance.supports_tool_use else 'json'
+        invoke_args = {'tool': schema.batch_tool} if output_format == 'tool' else {}
+
+        results = [None] * len(entries)
+        pending = pack_batches(len(entries), item_tokens, max_batch_tokens, max_batch_items)
+        while pending:
+            batch = pending.pop(0)
+            if len(batch) == 1:
+                results[batch[0]] = dict(single(entries[batch[0]]), batch_size=1)
+                continue
+
+            prompt = build_prompt([entries[index] for index in batch], output_format)
+            try:
+                llm_response = self._model_instance.invoke(
+                    prompt, max_tokens=BATCH_BASE_OUTPUT_TOKENS + BATCH_ITEM_OUTPUT_TOKENS * len(batch), **invoke_args)
+                parsed = schema.parse_batch(llm_response.get('prediction') or '', len(batch))
+            except Exception as e:
+                logger.warning(f'<<judge_batch>> {judge} batch of {len(batch)} failed: {e}')
+                llm_response, parsed = {}, {}
+
+            input_tokens = (llm_response.get('input_tokens') or 0) // len(batch)
+            output_tokens = (llm_response.get('output_tokens') or 0) // len(batch)
+            for position, index in enumerate(batch, start=1):
+                record_judge_call(model_id, f'{judge}_batch', output_format,
+                                  'parsed' if position in parsed else 'failed', input_tokens + output_tokens)
+
+            if not parsed:
+                # nothing usable: smaller batches are more likely to fit and to be followed
+                half = len(batch) // 2
+                logger.info(f'<<judge_batch>> splitting {judge} batch of {len(batch)}')
+                pending[:0] = [batch[:half], batch[half:]]
+                continue
+
+            retries = []
+            for position, index in enumerate(batch, start=1):
+                if position not in parsed:
+                    retries.append(index)
+                    continue
+                result, rationale, item_response = parsed[position]
+                results[index] = dict({
+                    'prompt': prompt,
+                    'model_id': model_id,
+                    'request_id': llm_response.get('request_id'),
+                    'input_tokens': input_tokens,
+                    'output_tokens': output_tokens,
+                    'invocation_time': llm_response.get('invocation_time'),
+                    'response': item_response,
+                    'output_format': output_format,
+                    'parse_status': 'parsed',
+                    'result': result,
+                    'rationale': rationale
+                }, **entries[index].get('fields', {}), batch_size=len(batch))
+
+            if retries:
+                logger.info(f'<<judge_batch>> retrying {len(retries)} of {len(batch)} {judge} items one at a time')
+            pending[:0] = [[index] for index in retries]
+
+        return results
+
+    def evaluate_responses_batch(
+        self,
+        items: list,
+        max_batch_tokens: int = BATCH_MAX_TOKENS,
+        max_batch_items: int = BATCH_MAX_ITEMS
+    ) -> list:
+        """Evaluates (question, answer, ground_truth) items; returns one evaluate_response dict per item"""
+        entries = [
+            {'question': question, 'answer': answer, 'ground_truth': ground_truth}
+            for question, answer, ground_truth in items
+        ]
+        template = self.get_shared_default('batch_evaluation_prompt')
+
+        def item_text(entry: dict) -> str:
+            return (f'<question>{batch_field(entry["question"])}</question>\n'
+                    f'<ground_truth>{batch_field(entry["ground_truth"])}</ground_truth>\n'
+                    f'<answer>{batch_field(entry["answer"])}</answer>')
+
+        def build_prompt(batch: list, output_format: str) -> str:
+            return self.build_batch_prompt(
+                template, self._evaluation_prompt, output_format,
+                count=str(len(batch)),
+                items='\n'.join(f'<item index="{n}">\n{item_text(entry)}\n</item>' for n, entry in enumerate(batch, start=1)),
+                instruction=JUDGES['evaluation'].batch_instruction(output_format, len(batch))
+            )
+
+        def item_tokens(index: int, batch: list) -> int:
+            return len(item_text(entries[index])) // 4 + 10
+
+        def single(entry: dict) -> dict:
+            return self.evaluate_response(entry['question'], entry['answer'], entry['ground_truth'])
+
+        return self.judge_batch('evaluation', entries, build_prompt, item_tokens, single,
+                                max_batch_tokens - len(template) // 4, max_batch_items)
+
+    def detect_hallucinations_batch(
+        self,
+        items: list,
+        max_batch_tokens: int = BATCH_MAX_TOKENS,
+        max_batch_items: int = BATCH_MAX_ITEMS
+    ) -> list:
+        """Checks (question, answer, document) items; returns one detect_hallucinations dict per item"""
+        entries = []
+        for question, answer, document in items:
+            entry = {'question': question, 'answer': answer, 'document': document, 'fields': {'document_chunks': None}}
+            if isinstance(document, RetrievedContext):
+                relevant = document.relevant_to(answer)
+                entry['fields']['document_chunks'] = relevant.num_chunks
+                entry['text'] = str(relevant)
+            else:
+                entry['text'] = str(document)
+            entries.append(entry)
+        template = self.get_shared_default('batch_detection_prompt')
+
+        def build_prompt(batch: list, output_format: str) -> str:
+            # items that were checked against the same document share it
+            document_ids = {}
+            for entry in batch:
+                document_ids.setdefault(entry['text'], len(document_ids) + 1)
+            return self.build_batch_prompt(
+                template, self._detection_prompt, output_format,
+                count=str(len(batch)),
+                documents='\n'.join(f'<document id="{n}">\n{text}\n</document>' for text, n in document_ids.items()),
+                items='\n'.join(
+                    f'<item index="{n}">\n'
+                    f'<question>{batch_field(entry["question"])}</question>\n'
+                    f'<document_id>{document_ids[entry["text"]]}</document_id>\n'
+                    f'<answer>{batch_field(entry["answer"])}</answer>\n'
+                    f'</item>'
+                    for n, entry in enumerate(batch, start=1)),
+                instruction=JUDGES['detection'].batch_instruction(output_format, len(batch))
+            )
+
+        def item_tokens(index: int, batch: list) -> int:
+            entry = entries[index]
+            tokens = (len(entry['question']) + len(entry['answer'])) // 4 + 20
+            if all(entries[other]['text'] != entry['text'] for other in batch):
+                tokens += len(entry['text']) // 4
+            return tokens
+
+        def single(entry: dict) -> dict:
+            return self.detect_hallucinations(entry['question'], entry['answer'], entry['document'])
+
+        return self.judge_batch('detection', entries, build_prompt, item_tokens, single,
+                                max_batch_tokens - len(template) // 4, max_batch_items)
+
+    def run_offline(self, requests: list, backend: BatchBackend, job_name: str = None) -> list:
+        """Runs (prompt, invoke_args) requests as one batch inference job; returns the LLM responses in order"""
+        job = BatchInferenceJob(self._model_instance, backend, job_name)
+        for index, (prompt, invoke_args) in enumerate(requests):
+            job.add(index, prompt, **invoke_args)
+        results = job.run()
+        return [dict(results[index], batch_job=job.job_name) for index in range(len(requests))]
+
+    def generate_responses_offline(self, items: list, backend: BatchBackend, job_name: str = None) -> list:
+        """Answers (context, user_input) items in a batch inference job; returns one generate_response dict per item"""
+        prompts = [self.build_prompt(str(context), user_input) for context, user_input in items]
+        llm_responses = self.run_offline([(prompt, {}) for prompt in prompts], backend, job_name)
+
+        responses = []
+        for prompt, llm_response in zip(prompts, llm_responses):
+            response = llm_response.get('prediction')
+            if response and self._max_sentences:
+                # the same cut-off generate_response applies while streaming
+                sentence_ends = [match.end() for match in SENTENCE_END.finditer(response)]
+                if len(sentence_ends) >= self._max_sentences:
+                    response = response[:sentence_ends[self._max_sentences - 1]]
+            if response:
+                response = self.post_process_response(response)
+
+            responses.append({
+                'prompt': prompt,
+                'model_id': self._model_instance.model_id,
+                'record_id': llm_response.get('record_id'),
+                'batch_job': llm_response.get('batch_job'),
+                'input_tokens': llm_response.get('input_tokens'),
+                'output_tokens': llm_response.get('output_tokens'),
+                'cost': llm_response.get('cost'),
+                'error': llm_response.get('error'),
+                'response': response
+            })
+        return responses
+
+    def judge_offline(self, judge: str, prompts: list, single, backend: BatchBackend, job_name: str = None) -> list:
+        """Runs judge prompts in a batch inference job; items without a valid verdict are judged again by single(index)"""
+        schema = JUDGES[judge]
+        model_id = self._model_instance.model_id
+
+        if self._structured_output:
+            output_format = 'tool' if self._model_instance.supports_tool_use else 'json'
+            requests = [schema.structured_prompt(prompt, output_format) for prompt in prompts]
+            invoke_args = {'tool': schema.tool} if output_format == 'tool' else {}
         else:
-            parts = prediction.split('\n')
-            result = parts[0].strip()
-            rationale = ' '.join(parts[1:]).strip()
-        
-            if 'hallucinated' in result.lower():
-                response['result'] = 'HALLUCINATED'
-                response['rationale'] = rationale
-            elif 'correct' in result.lower():
-                response['result'] = 'CORRECT'
-                response['rationale'] = rationale
+            output_format = 'text'
+            requests = [(prompt, None) for prompt in prompts]
+            invoke_args = {}
+
+        llm_responses = self.run_offline([(prompt, invoke_args) for prompt, _ in requests], backend, job_name)
+
+        results = []
+        for index, ((prompt, prefill), llm_response) in enumerate(zip(requests, llm_responses)):
+            prediction = llm_response.get('prediction', '')
+            tokens = (llm_response.get('input_tokens') or 0) + (llm_response.get('output_tokens') or 0)
+            parsed = None
+            if llm_response.get('error'):
+                pass
+            elif output_format == 'text':
+                parsed = schema.parse_text(prediction.strip())
+                parsed = None if parsed[0] == 'ERROR' else parsed
             else:
-                response['result'] = 'ERROR'
-                response['rationale'] = 'Unsupported test result'
-        
-        return response
+                parser = JudgeOutputParser(schema, prefill)
+                parser.feed(prediction)
+                parsed = parser.parse()
+
+            record_judge_call(model_id, f'{judge}_offline', output_format, 'parsed' if parsed else 'failed', tokens)
+            if parsed is None:
+                logger.warning(f'<<judge_offline>> {judge} record {llm_response.get("record_id")} has no verdict, retrying on demand')
+                results.append(single(index))
+                continue
+
+            llm_response.update(prompt=prompt, output_format=output_format, parse_status='parsed')
+            llm_response['result'], llm_response['rationale'] = parsed
+            results.append(dict(self.judge_response(llm_response),
+                                record_id=llm_response.get('record_id'), batch_job=llm_response.get('batch_job')))
+        return results
+
+    def evaluate_responses_offline(self, items: list, backend: BatchBackend, job_name: str = None) -> list:
+        """Evaluates (question, answer, ground_truth) items in a batch inference job; returns one evaluate_response dict per item"""
+        prompts = [self.build_evaluation_prompt(question, answer, ground_truth) for question, answer, ground_truth in items]
+
+        def single(index: int) -> dict:
+            return self.evaluate_response(*items[index])
+
+        return self.judge_offline('evaluation', prompts, single, backend, job_name)
+
+    def detect_hallucinations_offline(self, items: list, backend: BatchBackend, job_name: str = None) -> list:
+        """Checks (question, answer, document) items in a batch inference job; returns one detect_hallucinations dict per item"""
+        prompts = []
+        document_chunks = []
+        for question, answer, document in items:
+            num_chunks = None
+            if isinstance(document, RetrievedContext):
+                document = document.relevant_to(answer)
+                num_chunks = document.num_chunks
+            prompts.append(self.build_detection_prompt(question, answer, document))
+            document_chunks.append(num_chunks)
+
+        def single(index: int) -> dict:
+            return self.detect_hallucinations(*items[index])
+
+        results = self.judge_offline('detection', prompts, single, backend, job_name)
+        for result, num_chunks in zip(results, document_chunks):
+            result['document_chunks'] = num_chunks
+        return results
+
+    async def generate_response_async(self, context: str, user_input: str) -> dict:
+        return await run_in_executor(self.generate_response, context, user_input)
+
+    async def evaluate_response_async(self, question: str, answer: str, ground_truth: str) -> dict:
+        return await run_in_executor(self.evaluate_response, question, answer, ground_truth)
+
+    async def compare_responses_async(self, question: str, document: str, response_1: str, response_2: str) -> dict:
+        return await run_in_executor(self.compare_responses, question, document, response_1, response_2)
+
+    async def detect_hallucinations_async(self, question: str, answer: str, document: str) -> dict:
+        return await run_in_executor(self.detect_hallucinations, question, answer, document)
+
+    async def evaluate_responses_batch_async(self, items: list, **kwargs) -> list:
+        return await run_in_executor(self.evaluate_responses_batch, items, **kwargs)
+
+    async def detect_hallucinations_batch_async(self, items: list, **kwargs) -> list:
+        return await run_in_executor(self.detect_hallucinations_batch, items, **kwargs)
 
     
     @property
@@ -263,6 +759,54 @@ class ConversationalAgent(object):
     def model_instance(self, value: BedrockModel):
         self._model_instance = value
 
+    @property
+    def max_sentences(self) -> int:
+        return self._max_sentences
+
+    @max_sentences.setter
+    def max_sentences(self, value: int):
+        self._max_sentences = value
+
+    @property
+    def response_cache(self) -> ResponseCache:
+        return self._response_cache
+
+    @response_cache.setter
+    def response_cache(self, value: ResponseCache):
+        self._response_cache = value
+
+    @property
+    def cache_namespace(self) -> str:
+        return self._cache_namespace
+
+    @cache_namespace.setter
+    def cache_namespace(self, value: str):
+        self._cache_namespace = value
+
+    @property
+    def structured_output(self) -> bool:
+        return self._structured_output
+
+    @structured_output.setter
+    def structured_output(self, value: bool):
+        self._structured_output = value
+
+    @property
+    def cache_context(self) -> bool:
+        return self._cache_context
+
+    @cache_context.setter
+    def cache_context(self, value: bool):
+        self._cache_context = value
+
+    @property
+    def grounding_checker(self) -> GroundingChecker:
+        return self._grounding_checker
+
+    @grounding_checker.setter
+    def grounding_checker(self, value: GroundingChecker):
+        self._grounding_checker = value
+
     @property
     def answer_prompt(self) -> str:
         return self._answer_prompt
@@ -319,6 +863,74 @@ class ConversationalAgent(object):
     def detection_prompt(self, value: str):
         self._detection_prompt = value
 
+    def get_default_batch_evaluation_prompt(self) -> str:
+        return """System:
+You are a quality assurance specialist working in a contact center. You job is to review interactions
+between callers and contact center agents, and confirm that when a caller asks a specific question, the answer 
+provided by the agent has the same meaning as a ground truth answer, which has already been verified to be correct.
+
+Today is {current_date}.
+
+Human:
+For this task, you will review {count} numbered items. Each item has a caller's question, a ground truth sentence 
+and an actual answer sentence. For each item, compare the actual answer sentence to the ground truth sentence, and 
+determine whether the two sentences have the same meaning. The meaning of the actual answer sentence should be accurate 
+and complete when compared to the meaning of the ground truth sentence, including any specific dates or amounts.
+
+<items>
+{items}
+</items>
+
+Review each item on its own. The verdict for an item is "NO" if:
+- there are any discrepancies between the answer sentence and the ground truth sentence, including minor discrepancies
+- the actual answer sentence is missing information that is present in the ground truth sentence
+- specific details in the answer sentence, such as dates or amounts, differ from the corresponding details in the ground truth sentence
+
+Otherwise the verdict is "YES".
+
+It is very important that accurate and complete information is conveyed by the agent to the caller, including specific dates and amounts.
+
+{instruction}
+
+Assistant: """
+
+    def get_default_batch_detection_prompt(self) -> str:
+        return """System:
+You are a quality assurance specialist working in a contact center. You job is to review interactions
+between callers and contact center agents, and confirm that when a caller asks a specific question, the answer 
+provided by the agent can be confirmed by a document that contains approved content.
+
+Today is {current_date}.
+
+Human:
+For this task, you will review {count} numbered items. Each item has a caller's question, the ID of an informational 
+document and an actual answer sentence. For each item, compare the actual answer sentence to its document, and determine 
+whether the actual answer sentence matches information present in the document, including any specific details such as 
+dates or amounts.
+
+Here are the informational documents:
+<documents>
+{documents}
+</documents>
+
+<items>
+{items}
+</items>
+
+Review each item on its own, against its own document only. The verdict for an item is "HALLUCINATED" if:
+- the actual answer sentence includes information that is not present in the document
+- the actual answer references a specific date or deadline that differs from the information in the document
+- the actual answer references a specific amount or dollar value that differs from the information in the document
+
+Otherwise the verdict is "CORRECT".
+- If the document does not provide relevant information to answer the question, and the answer states this, the answer should be considered correct.
+
+It is very important that correct information is conveyed by the agent to the caller, so make sure to confirm specifics such as dates and amounts.
+
+{instruction}
+
+Assistant: """
+
     def get_default_answer_prompt(self) -> str:
         return """
 You are acting as a virtual agent working in a contact center, answering questions for callers.
@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Pluggable text embedders, shared by the semantic cache and the local knowledge base
+
+ - TitanEmbedder   - Amazon Titan Text Embeddings via Bedrock (production)
+ - HashingEmbedder - local feature hashing of words, word pairs and character trigrams,
+                     with no service calls (tests, notebooks and offline benchmarks)
+
+embed() returns a unit-length float32 NumPy vector.
+"""
+
+import hashlib
+import json
+import logging
+import numpy as np
+from boto3 import client
+from bedrock_utils import metering
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+class Embedder(object):
+    def __init__(self, dimensions: int) -> None:
+        self._dimensions = dimensions
+
+    def embed(self, text: str) -> np.ndarray:
+        pass
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+
+class TitanEmbedder(Embedder):
+    TITAN_EMBED_TEXT_V2 = 'amazon.titan-embed-text-v2:0'
+
+    def __init__(self, bedrock_client: client, model_id: str = TITAN_EMBED_TEXT_V2, dimensions: int = 256) -> None:
+        self._bedrock_client = bedrock_client
+        self._model_id = model_id
+        super().__init__(dimensions)
+
+    def embed(self, text: str) -> np.ndarray:
+        response = self._bedrock_client.invoke_model(
+            body=json.dumps({'inputText': text, 'dimensions': self._dimensions, 'normalize': True}),
+            modelId=self._model_id,
+            accept='application/json',
+            contentType='application/json'
+        )
+        response_body = json.loads(response.get('body').read())
+        metering.record_usage(self._model_id, response_body.get('inputTextTokenCount'), 0)
+        embedding = response_body.get('embedding')
+        return np.asarray(embedding, dtype=np.float32)
+
+
+class HashingEmbedder(Embedder):
+    def __init__(self, dimensions: int = 512) -> None:
+        super().__init__(dimensions)
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self._dimensions, dtype=np.float32)
+        words = text.split()
+        features = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+        features += [word[i:i + 3] for word in words for i in range(max(1, len(word) - 2))]
+
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self._dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+
+        if (norm := np.linalg.norm(vector)) > 0:
+            vector /= norm
+        return vector
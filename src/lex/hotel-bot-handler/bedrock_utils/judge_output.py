@@ -0,0 +1,419 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Structured output contract for the LLM-as-judge methods
+
+Each judge (evaluation, comparison, detection) is a JudgeSchema: the verdicts the judge
+prompt asks for, and the result each one maps to. In structured mode the rendered judge
+prompt keeps its instructions, but the trailing "Answer:" prefill is replaced with:
+ - tool-use (models that support it): a record_verdict tool, with the verdicts as an enum,
+   that the model is required to call
+ - JSON (all other models): an instruction to respond with a JSON object, and a prefill
+   that opens it ({"verdict": ")
+
+JudgeOutputParser accepts the response as it streams, and reports when the JSON object
+is complete so the rest of the generation can be cut off. It tolerates code fences, text
+around the object, a missing prefill, trailing commas, truncated strings and objects,
+and falls back to the legacy "verdict on the first line, rationale after" format. A
+response that still cannot be parsed gets one repair call: a short prompt, without the
+documents, asking the same model to restate the response as JSON.
+
+Batched judges (see ConversationalAgent.evaluate_responses_batch) ask for one indexed
+verdict per item, as a results array (tool-use) or a JSON array (prefilled with '[').
+parse_batch keeps every complete, valid item object it finds, so a truncated or partly
+malformed response still yields the items before the damage; pack_batches sizes the
+batches to a token budget.
+
+Calls, parse failures, repairs, errors and wasted tokens (tokens spent on judge calls
+that ended in ERROR, and on repair calls) are recorded per model and judge, for the text
+mode too, and printed as CloudWatch EMF records (JUDGE_METRICS=0 disables the records).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bedrock_utils import metering
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TOOL_NAME = 'record_verdict'
+JSON_PREFILL = '{"verdict": "'
+BATCH_PREFILL = '['
+REPAIR_MAX_TOKENS = 300
+EMIT_METRICS = os.environ.get('JUDGE_METRICS', '1') == '1'
+
+# the trailing answer prefill of the judge prompts, e.g. 'Assistant: Answer: ' or 'BETTER ANSWER: '
+PREFILL = re.compile(r'\n\s*(Assistant:)?[ \t]*[A-Za-z ]*ANSWER:\s*$', re.IGNORECASE)
+CODE_FENCE = re.compile(r'```(?:json)?', re.IGNORECASE)
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+ANSWER_LABEL = re.compile(r'^\W*(?:better\s+)?answer\s*:\s*', re.IGNORECASE)
+
+
+class JudgeSchema(object):
+    def __init__(self, name: str, verdicts: dict, description: str) -> None:
+        self.name = name
+        # verdict -> result, in the order the legacy parser checks them
+        self.verdicts = verdicts
+        self.description = description
+
+    @property
+    def tool(self) -> dict:
+        return {
+            'name': TOOL_NAME,
+            'description': 'Records the verdict and rationale of your review.',
+            'input_schema': {
+                'type': 'object',
+                'properties': {
+                    'verdict': {'type': 'string', 'enum': list(self.verdicts), 'description': self.description},
+                    'rationale': {'type': 'string', 'description': 'The rationale for your verdict, in one or two sentences.'}
+                },
+                'required': ['verdict', 'rationale']
+            }
+        }
+
+    def instruction(self, mode: str) -> str:
+        verdicts = ', '.join(f'"{verdict}"' for verdict in self.verdicts)
+        if mode == 'tool':
+            return (f'Record your response with the {TOOL_NAME} tool. Set "verdict" to one of {verdicts}: '
+                    f'{self.description}. Set "rationale" to the rationale for your response.')
+        return (f'Ignore the line format above, and respond only with a JSON object with two keys: "verdict", '
+                f'one of {verdicts}: {self.description}; and "rationale", the rationale for your response.')
+
+    def structured_prompt(self, prompt: str, mode: str) -> tuple:
+        """The judge prompt rewritten for tool-use or JSON output, and the prefill it ends with"""
+        assistant = bool((match := PREFILL.search(prompt)) and match.group(1))
+        body = prompt[:match.start()] if match else prompt.rstrip()
+        if mode == 'tool':
+            return f'{body}\n\n{self.instruction(mode)}\n', ''
+        prefill = JSON_PREFILL
+        return f'{body}\n\n{self.instruction(mode)}\n\n{"Assistant: " if assistant else ""}{prefill}', prefill
+
+    @property
+    def batch_tool(self) -> dict:
+        item = self.tool['input_schema']
+        return {
+            'name': TOOL_NAME,
+            'description': 'Records the verdict and rationale of your review of each numbered item.',
+            'input_schema': {
+                'type': 'object',
+                'properties': {
+                    'results': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': dict(
+                                index={'type': 'integer', 'description': 'The number of the item.'},
+                                **item['properties']
+                            ),
+                            'required': ['index'] + item['required']
+                        }
+                    }
+                },
+                'required': ['results']
+            }
+        }
+
+    def batch_instruction(self, mode: str, count: int) -> str:
+        verdicts = ', '.join(f'"{verdict}"' for verdict in self.verdicts)
+        fields = (f'"index", the number of the item; "verdict", one of {verdicts}: {self.description}; '
+                  f'and "rationale", the rationale for your verdict, in one or two sentences')
+        if mode == 'tool':
+            return f'Record your review of all {count} items with the {TOOL_NAME} tool, with one result per item: {fields}.'
+        return (f'Respond only with a JSON array of {count} objects, one per item and in item order, each with '
+                f'three keys: {fields}.')
+
+    def parse_batch(self, text: str, count: int) -> dict:
+        """Valid item results by index (1 to count): {index: (result, rationale, item JSON)}"""
+        results = {}
+        for data in iter_json_objects(CODE_FENCE.sub('', text)):
+            items = data.get('results') if isinstance(data.get('results'), list) else [data]
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    index = int(item.get('index'))
+                except (TypeError, ValueError):
+                    continue
+                if 1 <= index <= count and index not in results and (result := self.result(item.get('verdict'))):
+                    results[index] = (result, str(item.get('rationale', '')).strip(), json.dumps(item))
+        return results
+
+    def repair_prompt(self, response: str, assistant: bool) -> tuple:
+        prompt = (
+            f'{"Human: " if assistant else ""}Here is a review of an answer given to a caller:\n'
+            f'<review>\n{response.strip()}\n</review>\n\n'
+            f'Restate the review as a JSON object with two keys: "verdict", one of '
+            f'{", ".join(chr(34) + verdict + chr(34) for verdict in self.verdicts)}: {self.description}; '
+            f'and "rationale", the rationale given in the review. Respond only with the JSON object.\n\n'
+            f'{"Assistant: " if assistant else ""}{JSON_PREFILL}'
+        )
+        return prompt, JSON_PREFILL
+
+    def result(self, verdict) -> str:
+        verdict = ANSWER_LABEL.sub('', str(verdict)).strip().strip('"\'.').upper()
+        return self.verdicts.get(verdict)
+
+    def parse_text(self, prediction: str) -> tuple:
+        """The legacy parser: (result, rationale), with result 'ERROR' when the format is not followed"""
+        if not '\n' in prediction:
+            return 'ERROR', 'Missing newline in test result'
+        parts = prediction.split('\n')
+        result = parts[0].strip().lower()
+        rationale = ' '.join(parts[1:]).strip()
+        for verdict, mapped in self.verdicts.items():
+            if verdict.lower() in result:
+                return mapped, rationale
+        return 'ERROR', 'Unsupported test result'
+
+
+JUDGES = {
+    'evaluation': JudgeSchema(
+        'evaluation', {'YES': 'PASSED', 'NO': 'FAILED'},
+        'YES if the actual answer has the same meaning as the ground truth, otherwise NO'),
+    'comparison': JudgeSchema(
+        'comparison', {'1': 'ANSWER 1', '2': 'ANSWER 2', '0': 'NO EVALUATION'},
+        '1 if the first answer is better, 2 if the second answer is better, or 0 if they are the same or cannot be evaluated'),
+    'detection': JudgeSchema(
+        'detection', {'HALLUCINATED': 'HALLUCINATED', 'CORRECT': 'CORRECT'},
+        'HALLUCINATED if the actual answer includes information that is not in the document, otherwise CORRECT'),
+}
+
+
+class JudgeOutputParser(object):
+    def __init__(self, schema: JudgeSchema, prefill: str = '') -> None:
+        self._schema = schema
+        self._prefill = prefill
+        self._chunks = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._complete = False
+
+    def feed(self, delta: str) -> bool:
+        """Adds a streamed delta; returns True once the JSON object is complete"""
+        if self._complete or not delta:
+            return self._complete
+        if not self._started and not self._chunks and (stripped := delta.lstrip()):
+            # the response either continues the prefill, or (ignoring it) starts its own object
+            if self._prefill and not stripped.startswith('{'):
+                self._scan(self._prefill)
+        self._chunks.append(delta)
+        self._scan(delta)
+        return self._complete
+
+    def _scan(self, text: str) -> None:
+        for char in text:
+            if self._escape:
+                self._escape = False
+            elif self._in_string:
+                if char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._started:
+                self._in_string = True
+            elif char == '{':
+                self._started = True
+                self._depth += 1
+            elif char == '}' and self._started:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete = True
+                    return
+
+    @property
+    def complete(self) -> bool:
+        return self._complete
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._chunks)
+
+    def parse(self):
+        """(result, rationale), or None if no verdict can be found"""
+        text = CODE_FENCE.sub('', self.text).strip()
+        # the response continues the prefill, or has an object of its own (possibly after some text)
+        candidates = [text] if text.startswith('{') or not self._prefill else [self._prefill + text, text]
+
+        for candidate in candidates:
+            if (data := self.parse_json(candidate)) is None:
+                continue
+            verdict = data.get('verdict', data.get('answer', data.get('result')))
+            if (result := self._schema.result(verdict)) is not None:
+                return result, str(data.get('rationale', data.get('reason', ''))).strip()
+
+        # legacy format: the verdict on the first line, then the rationale
+        lines = self.text.strip().split('\n')
+        first_line = ANSWER_LABEL.sub('', lines[0]).strip()
+        for verdict, mapped in self._schema.verdicts.items():
+            if re.match(rf'\W*{re.escape(verdict)}\b', first_line, re.IGNORECASE):
+                return mapped, ' '.join(lines[1:]).strip()
+        return None
+
+    @staticmethod
+    def parse_json(text: str):
+        if (start := text.find('{')) < 0:
+            return None
+        text = text[start:]
+        # the object ends at its last closing brace; a truncated object is closed below
+        if (end := text.rfind('}')) >= 0:
+            try:
+                data = json.loads(TRAILING_COMMA.sub(r'\1', text[:end + 1]))
+                return data if isinstance(data, dict) else None
+            except json.JSONDecodeError:
+                pass
+
+        # close a truncated string and object (e.g. a response cut off by max_tokens)
+        repaired = text.rstrip().rstrip(',')
+        in_string = False
+        escape = False
+        for char in repaired:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = in_string
+            elif char == '"':
+                in_string = not in_string
+        if in_string:
+            repaired += '"'
+        repaired = TRAILING_COMMA.sub(r'\1', repaired.rstrip().rstrip(',') + '}' * max(1, repaired.count('{') - repaired.count('}')))
+        try:
+            data = json.loads(repaired)
+            return data if isinstance(data, dict) else None
+        except json.JSONDecodeError:
+            return None
+
+
+def iter_json_objects(text: str):
+    """Yields each complete top-level JSON object in the text (e.g. the items of a truncated array)"""
+    depth = 0
+    start = None
+    in_string = False
+    escape = False
+    for position, char in enumerate(text):
+        if escape:
+            escape = False
+        elif in_string:
+            if char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"' and depth > 0:
+            in_string = True
+        elif char == '{':
+            if depth == 0:
+                start = position
+            depth += 1
+        elif char == '}' and depth > 0:
+            depth -= 1
+            if depth == 0:
+                try:
+                    data = json.loads(TRAILING_COMMA.sub(r'\1', text[start:position + 1]))
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(data, dict):
+                    yield data
+
+def pack_batches(count: int, item_tokens, max_batch_tokens: int, max_batch_items: int) -> list:
+    """Packs item indexes 0..count-1, in order, into batches within the token and item limits
+
+    item_tokens(index, batch) is the estimated number of tokens the item adds to the batch
+    (the indexes already in it), e.g. without a document that is already included.
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for index in range(count):
+        tokens = item_tokens(index, batch)
+        if batch and (len(batch) >= max_batch_items or batch_tokens + tokens > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+            tokens = item_tokens(index, batch)
+            batch_tokens = 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def record_judge_call(
+    model_id: str,
+    judge: str,
+    output_format: str,
+    parse_status: str,
+    tokens: int,
+    repair_tokens: int = 0
+) -> None:
+    """Records a judge call; parse_status is 'parsed', 'repaired' or 'failed'"""
+    with _stats_lock:
+        stats = _stats.setdefault((model_id, judge), {
+            'calls': 0, 'parse_failures': 0, 'repaired': 0, 'errors': 0, 'tokens': 0, 'wasted_tokens': 0
+        })
+        stats['calls'] += 1
+        stats['parse_failures'] += parse_status != 'parsed'
+        stats['repaired'] += parse_status == 'repaired'
+        stats['errors'] += parse_status == 'failed'
+        stats['tokens'] += tokens + repair_tokens
+        wasted_tokens = tokens + repair_tokens if parse_status == 'failed' else repair_tokens
+        stats['wasted_tokens'] += wasted_tokens
+
+    if parse_status != 'parsed':
+        logger.warning(f'<<judge_output>> [{model_id}] {judge} ({output_format}) output {parse_status.upper()}')
+
+    if EMIT_METRICS:
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': metering.METRICS_NAMESPACE,
+                    'Dimensions': [['ModelId', 'Judge']],
+                    'Metrics': [
+                        {'Name': 'JudgeCalls', 'Unit': 'Count'},
+                        {'Name': 'JudgeParseFailures', 'Unit': 'Count'},
+                        {'Name': 'JudgeRepairs', 'Unit': 'Count'},
+                        {'Name': 'JudgeErrors', 'Unit': 'Count'},
+                        {'Name': 'JudgeWastedTokens', 'Unit': 'Count'}
+                    ]
+                }]
+            },
+            'ModelId': model_id,
+            'Judge': judge,
+            'OutputFormat': output_format,
+            'JudgeCalls': 1,
+            'JudgeParseFailures': int(parse_status != 'parsed'),
+            'JudgeRepairs': int(parse_status == 'repaired'),
+            'JudgeErrors': int(parse_status == 'failed'),
+            'JudgeWastedTokens': wasted_tokens
+        }))
+
+def get_judge_stats() -> dict:
+    """Cumulative counts per model and judge, with the parse failure, repair and error rates"""
+    with _stats_lock:
+        stats = {f'{model_id}/{judge}': dict(counts) for (model_id, judge), counts in _stats.items()}
+    for counts in stats.values():
+        counts['parse_failure_rate'] = round(counts['parse_failures'] / counts['calls'], 4)
+        counts['repair_rate'] = round(counts['repaired'] / counts['parse_failures'], 4) if counts['parse_failures'] else None
+        counts['error_rate'] = round(counts['errors'] / counts['calls'], 4)
+    return stats
@@ -14,12 +14,49 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-"""BedrockKnowledgeBases wrapper classes"""
+"""BedrockKnowledgeBases wrapper classes
 
+retrieve_context returns the matching chunks as RetrievedChunk objects ('chunks'), and a
+RetrievedContext ('context') that renders them to the prompt string only when it is used
+(see bedrock_utils.retrieved_context).
+
+retrieve_context_many runs several retrievals concurrently on a bounded pool. Each query
+is either a string or a dict with 'query' and optional 'max_docs', 'threshold',
+'metadata_filter' and 'search_type' keys, so per-query filters never touch the shared
+metadata_filter attribute:
+
+    results = kb.retrieve_context_many([
+        'Is there a pool?',
+        {'query': 'Is there a pool?', 'metadata_filter': seaside_filter}
+    ])
+
+Identical queries are retrieved once. Results are returned in query order, each with the
+retrieve_context fields plus the query parameters and its own timing.
+
+When a Reranker is set, retrieved chunks are re-ranked in-process (see
+bedrock_utils.reranker) before the relevance threshold is applied.
+
+When an AdaptiveCutoff is set, the number of chunks kept is chosen from the service score
+distribution of each result set (the threshold still applies as a floor), and the chunks
+above the threshold that were cut, and the tokens they would have cost, are logged. When a
+ResultCountTuner is also set and the caller passes its intent, numberOfResults is tuned
+per intent (see bedrock_utils.adaptive_cutoff).
+
+When a RetrievalCache is set, retrieve_context serves identical queries against an
+unchanged knowledge base (same data_version) from the cache, and reports the cache
+status (HIT, STALE or MISS) in its response.
+"""
+
+import contextvars
 import json
 import logging
 import time
 from boto3 import client
+from bedrock_utils.executor import get_executor, run_in_executor
+from bedrock_utils.retrieval_cache import RetrievalCache
+from bedrock_utils.reranker import Reranker
+from bedrock_utils.retrieved_context import RetrievedChunk, RetrievedContext
+from bedrock_utils.adaptive_cutoff import AdaptiveCutoff, ResultCountTuner
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -34,7 +71,12 @@ class BedrockKnowledgeBase(object):
         threshold: float = 0.40,
         metadata_filter: dict = None,
         search_type: str = 'SEMANTIC',
-        s3_bucket: str = None
+        s3_bucket: str = None,
+        data_version: str = None,
+        retrieval_cache: RetrievalCache = None,
+        reranker: Reranker = None,
+        adaptive_cutoff: AdaptiveCutoff = None,
+        result_count_tuner: ResultCountTuner = None
     ) -> None:
         self._bedrock_agent_client = bedrock_agent_client
         self._kb_id = kb_id
@@ -44,6 +86,11 @@ class BedrockKnowledgeBase(object):
         self._metadata_filter = metadata_filter
         self._search_type = search_type
         self._s3_bucket = s3_bucket
+        self._data_version = data_version
+        self._retrieval_cache = retrieval_cache
+        self._reranker = reranker
+        self._adaptive_cutoff = adaptive_cutoff
+        self._result_count_tuner = result_count_tuner
 
     def retrieve_context(
         self, 
@@ -51,71 +98,209 @@ class BedrockKnowledgeBase(object):
         max_docs: int = None,
         threshold: float = None,
         metadata_filter: str = None,
-        search_type: str = None
+        search_type: str = None,
+        intent: str = None
     ) -> dict:
         start_time = time.time()
-        
-        query_config = {
-            'vectorSearchConfiguration': {
-                'numberOfResults': max_docs if max_docs else self._max_docs,
-                'overrideSearchType': search_type if search_type else self._search_type
-            }
-        }
-        
-        if metadata_filter or self._metadata_filter:
-            query_config['vectorSearchConfiguration']['filter'] = \
-                metadata_filter if metadata_filter else self._metadata_filter        
-        
-        logger.info(f'<<retrieve_context>> Bedrock KB query-config = {json.dumps(query_config, indent=4)}')
 
-        response = self._bedrock_agent_client.retrieve(
-            knowledgeBaseId = self._kb_id,
-            retrievalQuery = {'text': query},
-            retrievalConfiguration = query_config
-        )
+        if not max_docs and intent and self._result_count_tuner is not None:
+            max_docs = self._result_count_tuner.number_of_results(intent, self._max_docs)
+        requested_docs = max_docs if max_docs else self._max_docs
+
+        results, cache_status = self.retrieve_results(query, max_docs, metadata_filter, search_type)
+        retrieval_time = int((time.time() - start_time) * 1000)  # milliseconds
+
+        rerank_time = None
+        if self._reranker is not None and results:
+            rerank_start_time = time.time()
+            results = self._reranker.rerank(query, results)
+            rerank_time = int((time.time() - rerank_start_time) * 1000)  # milliseconds
 
         num_matches = 0
-        context = ''
+        chunks = []
         
         relevance_threshold = threshold if threshold else self._threshold
+
+        # adaptive mode keeps only the leading results chosen from the score distribution
+        cutoff = None
+        keep_count = len(results) if results else 0
+        if self._adaptive_cutoff is not None and results:
+            # the count is chosen from the service scores, since fused scores can carry no
+            # magnitude (RRF scores only encode ranks); the leading results in fused order are kept
+            cutoff = self._adaptive_cutoff.select(sorted((result.get('score', 0.0) for result in results), reverse=True))
+            keep_count = cutoff['count']
+        tokens_avoided = 0
         
-        if response:
-            logger.info(f'<<retrieve_context>> Bedrock KB response = {json.dumps(response, indent=4)}')
-            results = response.get('retrievalResults', [])
-            for result in results:
-                text = result.get('content', {}).get('text')
-                source = result.get('metadata', {}).get('x-amz-bedrock-kb-source-uri')
-                source = 'N/A' if source is None else source
-                score = result.get('score', 0.0)
+        if results:
+            for position, result in enumerate(results):
+                chunk = RetrievedChunk.from_result(result)
+                text = chunk.text
+                source = chunk.source
+                score = chunk.score
 
                 logger.info(f'<<retrieve_context>> Bedrock KB source = {source}')
                 
                 prefix = '[ ]'
                 if text and score:
-                    if score >= relevance_threshold:
+                    if score >= relevance_threshold and position >= keep_count:
+                        tokens_avoided += len(text) // 4
+                        logger.info(f'<<retrieve_context>> {prefix} ({score:.7f}) {source} - BELOW ADAPTIVE CUTOFF')
+                    elif score >= relevance_threshold:
                         logger.debug(f'<<retrieve_context>> MATCH: {score:.7f} - {source}')
                         logger.debug(f'<<retrieve_context>> TEXT:  {text}')
 
                         prefix = '[x]'
                         num_matches += 1
-                        context += text + '\n'
+                        chunks.append(chunk)
                         logger.info(f'<<retrieve_context>> {prefix} ({score:.7f}) {source}')
                     else:
                         logger.info(f'<<retrieve_context>> {prefix} ({score:.7f}) {source} - LOW SCORE')
 
                     logger.info(f'<<retrieve_context>> {json.dumps(text)}')
                     
+        if cutoff is not None:
+            logger.info(f'<<retrieve_context>> adaptive cutoff kept {keep_count} of {len(results)} results '
+                        f'({cutoff["reason"]}, cutoff score = {cutoff["cutoff_score"]}), avoided ~{tokens_avoided} tokens')
+            if intent and self._result_count_tuner is not None:
+                self._result_count_tuner.observe(intent, num_matches, requested_docs, len(results))
+
         invocation_time = int((time.time() - start_time) * 1000)  # milliseconds
-        logger.info(f'<<retrieve_context>> found {num_matches} matches in the knowledge base in {invocation_time} ms.')
+        logger.info(f'<<retrieve_context>> found {num_matches} matches in the knowledge base in {invocation_time} ms '
+                    f'(retrieval {retrieval_time} ms, {cache_status}; rerank {rerank_time} ms).')
         
         response = {
-            'context': context if num_matches else "There is no information available on this topic.",
+            'context': RetrievedContext(chunks),
             'num_matches': num_matches,
-            'invocation_time': invocation_time
+            'chunks': chunks,
+            'invocation_time': invocation_time,
+            'retrieval_time': retrieval_time,
+            'rerank_time': rerank_time,
+            'cache_status': cache_status,
+            'number_of_results': requested_docs,
+            'cutoff_score': cutoff['cutoff_score'] if cutoff else None,
+            'tokens_avoided': tokens_avoided
         }
         
         return response
 
+    def retrieve_context_many(self, queries: list, **defaults) -> list:
+        start_time = time.time()
+
+        requests = []
+        for query in queries:
+            request = dict(defaults, **query) if isinstance(query, dict) else dict(defaults, query=query)
+            requests.append({
+                'query': request.get('query'),
+                'max_docs': request.get('max_docs'),
+                'threshold': request.get('threshold'),
+                'metadata_filter': request.get('metadata_filter'),
+                'search_type': request.get('search_type'),
+                'intent': request.get('intent')
+            })
+
+        # each distinct request is retrieved once, on the retrieval pool
+        futures = {}
+        executor = get_executor('retrieval')
+        for request in requests:
+            request_key = json.dumps(request, sort_keys=True)
+            if request_key not in futures:
+                context = contextvars.copy_context()
+                futures[request_key] = executor.submit(context.run, self.retrieve_context, **request)
+
+        results = []
+        seen = set()
+        for request in requests:
+            request_key = json.dumps(request, sort_keys=True)
+            result = dict(request, **futures[request_key].result())
+            result['duplicate'] = request_key in seen
+            seen.add(request_key)
+            results.append(result)
+
+        invocation_time = int((time.time() - start_time) * 1000)  # milliseconds
+        logger.info(f'<<retrieve_context_many>> {len(futures)} distinct of {len(requests)} queries in {invocation_time} ms')
+        return results
+
+    async def retrieve_context_many_async(self, queries: list, **defaults) -> list:
+        return await run_in_executor(self.retrieve_context_many, queries, **defaults)
+
+    def retrieve_results(
+        self,
+        query: str,
+        max_docs: int = None,
+        metadata_filter: dict = None,
+        search_type: str = None
+    ) -> tuple:
+        """Returns the raw retrievalResults and the cache status (None if there is no cache)"""
+        number_of_results = max_docs if max_docs else self._max_docs
+        search_type = search_type if search_type else self._search_type
+        metadata_filter = metadata_filter if metadata_filter else self._metadata_filter
+
+        def retrieve():
+            return self.invoke_retrieve(query, number_of_results, metadata_filter, search_type)
+
+        if self._retrieval_cache is None:
+            return retrieve(), None
+
+        cache_key = self._retrieval_cache.make_key(
+            self._kb_id, self._data_version, query, metadata_filter, search_type, number_of_results)
+        results, cache_status = self._retrieval_cache.get(cache_key, retrieve)
+        if results is None:
+            results = retrieve()
+            self._retrieval_cache.put(cache_key, results)
+        return results, cache_status
+
+    def invoke_retrieve(self, query: str, number_of_results: int, metadata_filter: dict, search_type: str) -> list:
+        query_config = {
+            'vectorSearchConfiguration': {
+                'numberOfResults': number_of_results,
+                'overrideSearchType': search_type
+            }
+        }
+        
+        if metadata_filter:
+            query_config['vectorSearchConfiguration']['filter'] = metadata_filter
+        
+        logger.info(f'<<retrieve_context>> Bedrock KB query-config = {json.dumps(query_config, indent=4)}')
+
+        response = self._bedrock_agent_client.retrieve(
+            knowledgeBaseId = self._kb_id,
+            retrievalQuery = {'text': query},
+            retrievalConfiguration = query_config
+        )
+
+        if not response:
+            return []
+
+        logger.info(f'<<retrieve_context>> Bedrock KB response = {json.dumps(response, indent=4)}')
+        return response.get('retrievalResults', [])
+
+    def sync_data_version(self, bedrock_agent_client: client, data_source_id: str) -> str:
+        """Sets data_version to the latest completed ingestion job ID of the data source"""
+        try:
+            response = bedrock_agent_client.list_ingestion_jobs(
+                knowledgeBaseId = self._kb_id,
+                dataSourceId = data_source_id,
+                filters = [{'attribute': 'STATUS', 'operator': 'EQ', 'values': ['COMPLETE']}],
+                sortBy = {'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+                maxResults = 1
+            )
+            if (jobs := response.get('ingestionJobSummaries')):
+                self.data_version = jobs[0].get('ingestionJobId')
+        except Exception as e:
+            logger.warning(f'<<sync_data_version>> unable to list ingestion jobs: {e}')
+        return self._data_version
+
+    async def retrieve_context_async(
+        self, 
+        query: str,
+        max_docs: int = None,
+        threshold: float = None,
+        metadata_filter: str = None,
+        search_type: str = None,
+        intent: str = None
+    ) -> dict:
+        return await run_in_executor(
+            self.retrieve_context, query, max_docs, threshold, metadata_filter, search_type, intent)
         
     @property
     def kb_id(self) -> str:
@@ -173,3 +358,47 @@ class BedrockKnowledgeBase(object):
     def s3_bucket(self, value: str):
         self._s3_bucket = value
 
+    # identifies the ingested content (e.g. the latest ingestion job ID); cached responses
+    # and retrieval results from a previous version are not reused
+    @property
+    def data_version(self) -> str:
+        return self._data_version
+
+    @data_version.setter
+    def data_version(self, value: str):
+        if value != self._data_version:
+            logger.info(f'<<data_version>> {self._kb_instance_name}: {self._data_version} -> {value}')
+        self._data_version = value
+
+    @property
+    def adaptive_cutoff(self) -> AdaptiveCutoff:
+        return self._adaptive_cutoff
+
+    @adaptive_cutoff.setter
+    def adaptive_cutoff(self, value: AdaptiveCutoff):
+        self._adaptive_cutoff = value
+
+    @property
+    def result_count_tuner(self) -> ResultCountTuner:
+        return self._result_count_tuner
+
+    @result_count_tuner.setter
+    def result_count_tuner(self, value: ResultCountTuner):
+        self._result_count_tuner = value
+
+    @property
+    def reranker(self) -> Reranker:
+        return self._reranker
+
+    @reranker.setter
+    def reranker(self, value: Reranker):
+        self._reranker = value
+
+    @property
+    def retrieval_cache(self) -> RetrievalCache:
+        return self._retrieval_cache
+
+    @retrieval_cache.setter
+    def retrieval_cache(self, value: RetrievalCache):
+        self._retrieval_cache = value
+
@@ -39,6 +39,7 @@ class AmazonTitanModel(BedrockModel):
         TITAN_TEXT_AGILE: 'Amazon Titan Text G1 - Agile',
         TITAN_TEXT_PREMIER: 'Amazon Titan Text Premier'
     }
+    LEADING_CHARACTER = '\n'
     
     def __init__(
         self,
@@ -56,7 +57,7 @@ class AmazonTitanModel(BedrockModel):
         self.stop_sequences = stop_sequences        
         super().__init__(bedrock_client, model_id, instance_name)
      
-    def invoke(self,
+    def get_prompt_data(self,
         prompt: str,
         temperature: float = None,
         top_p: float = None,
@@ -72,9 +73,25 @@ class AmazonTitanModel(BedrockModel):
                 "stopSequences": stop_sequences if stop_sequences is not None else self.stop_sequences
             }
         }
-        
+        return prompt_data
+
+    def get_stream_delta(self, chunk: dict) -> str:
+        return chunk.get('outputText')
+
+    def get_prediction(self, full_response: dict) -> str:
+        return full_response['results'][0].get('outputText')
+
+    def invoke(self,
+        prompt: str,
+        temperature: float = None,
+        top_p: float = None,
+        max_tokens: int = None,
+        stop_sequences: list = None
+    ) -> dict:
+        prompt_data = self.get_prompt_data(prompt, temperature, top_p, max_tokens, stop_sequences)
+
         response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)        
-        response['prediction'] = response['full_response']['results'][0].get('outputText')
+        response['prediction'] = self.get_prediction(response['full_response'])
 
         if not response['prediction']:
             response['error'] = 'no prediction returned'
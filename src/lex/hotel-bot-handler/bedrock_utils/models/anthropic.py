@@ -14,7 +14,18 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-"""AnthropicClaudeModel"""
+"""AnthropicClaudeModel
+
+Claude models in PROMPT_CACHING_MODELS mark the cache_prefix passed to invoke (or
+invoke_stream) as cacheable, with a cache_control checkpoint: on the system block when
+the prefix ends in the System part of the prompt, or on a separate leading user content
+block when it extends into the Human part. Prefixes shorter than the model's minimum are
+sent uncached, as are prompts that do not start with the prefix.
+
+Claude 3 models also accept a tool (name, description and JSON input_schema) that the
+model is required to call; the prediction is then the JSON tool input. The prompt should
+not end with an Assistant prefill, which the Messages API does not allow with a forced tool.
+"""
 
 import json
 import logging
@@ -35,6 +46,7 @@ class AnthropicClaudeModel(BedrockModel):
     CLAUDE_V3_HAIKU = 'anthropic.claude-3-haiku-20240307-v1:0'
     CLAUDE_V3_SONNET = 'anthropic.claude-3-sonnet-20240229-v1:0'
     CLAUDE_V3_5_SONNET = 'anthropic.claude-3-5-sonnet-20240620-v1:0'
+    CLAUDE_V3_5_HAIKU = 'anthropic.claude-3-5-haiku-20241022-v1:0'
     CLAUDE_V3_OPUS = 'anthropic.claude-3-opus-20240229-v1:0'
     MODEL_NAMES = {
         CLAUDE_V1_INSTANT: 'Anthropic Claude Instant V1.2',
@@ -43,8 +55,13 @@ class AnthropicClaudeModel(BedrockModel):
         CLAUDE_V3_HAIKU: 'Anthropic Claude V3 Haiku',
         CLAUDE_V3_SONNET: 'Anthropic Claude V3 Sonnet',
         CLAUDE_V3_5_SONNET: 'Anthropic Claude V3.5 Sonnet',
+        CLAUDE_V3_5_HAIKU: 'Anthropic Claude V3.5 Haiku',
         CLAUDE_V3_OPUS: 'Anthropic Claude V3 Opus'
     }
+    PROMPT_CACHING_MODELS = {
+        CLAUDE_V3_5_HAIKU: 2048
+    }
+    LEADING_CHARACTER = ' '
     
     def __init__(
         self,
@@ -64,13 +81,15 @@ class AnthropicClaudeModel(BedrockModel):
         self.stop_sequences = stop_sequences
         super().__init__(bedrock_client, model_id, instance_name)
         
-    def invoke(self, 
+    def get_prompt_data(self, 
         prompt: str,
         temperature: float = None,
         top_p: float = None,
         top_k: int = None,
         max_tokens: int = None,
-        stop_sequences: list = None
+        stop_sequences: list = None,
+        cache_prefix: str = None,
+        tool: dict = None
     ) -> dict:
 
         if self.model_id in [self.CLAUDE_V1_INSTANT, self.CLAUDE_V2, self.CLAUDE_V2_1]:
@@ -97,6 +116,7 @@ class AnthropicClaudeModel(BedrockModel):
                 prompt, system = prompt.rsplit('System:', 1)
                 
             user = human if human else prompt
+            cache_point = self.get_cache_point(cache_prefix, system, human)
 
             prompt_data = {
                 "anthropic_version": "bedrock-2023-05-31",
@@ -108,21 +128,81 @@ class AnthropicClaudeModel(BedrockModel):
             }
             if system:
                 prompt_data['system'] = system.strip()
+                if cache_point == 'system':
+                    prompt_data['system'] = [
+                        {"type": "text", "text": prompt_data['system'], "cache_control": {"type": "ephemeral"}}
+                    ]
             if user:
                 prompt_data['messages'].append({"role": "user", "content": user.strip()})
+                if isinstance(cache_point, int):
+                    prompt_data['messages'][-1]['content'] = [
+                        {"type": "text", "text": user[:cache_point].lstrip(), "cache_control": {"type": "ephemeral"}},
+                        {"type": "text", "text": user[cache_point:].rstrip()}
+                    ]
             if assistant:
                 prompt_data['messages'].append({"role": "assistant", "content": assistant.strip()})
+            if tool:
+                prompt_data['tools'] = [tool]
+                prompt_data['tool_choice'] = {"type": "tool", "name": tool['name']}
 
-        response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)
-        
+        return prompt_data
+
+    def get_cache_point(self, cache_prefix: str, system: str, human: str):
+        """Where the cacheable prefix ends: 'system', an offset into the Human part, or None"""
+        if not cache_prefix or not self.supports_prompt_caching or not human:
+            return None
+        if len(cache_prefix) // 4 < self.PROMPT_CACHING_MODELS[self.model_id]:
+            return None
+
+        if 'Human:' not in cache_prefix:
+            # the checkpoint can only follow the whole system block
+            if system and system.strip() and cache_prefix.rstrip().endswith(system.rstrip()):
+                return 'system'
+            return None
+
+        cached_human = cache_prefix.split('Human:', 1)[1]
+        if not human.startswith(cached_human) or not cached_human.strip() or not human[len(cached_human):].strip():
+            return None
+        return len(cached_human)
+
+    def get_stream_delta(self, chunk: dict) -> str:
         if self.model_id in [self.CLAUDE_V1_INSTANT, self.CLAUDE_V2, self.CLAUDE_V2_1]:
-            response['prediction'] = response['full_response'].get('completion')
-        else:
-            content = response['full_response'].get('content',[])
-            if len(content) == 0:
-                response['prediction'] = None
-            else:
-                response['prediction'] = content[0].get('text', None)
+            return chunk.get('completion')
+        elif chunk.get('type') == 'content_block_delta':
+            delta = chunk.get('delta', {})
+            # tool input arrives as partial JSON
+            return delta.get('text', delta.get('partial_json'))
+        return None
+
+    def get_prediction(self, full_response: dict) -> str:
+        if self.model_id in [self.CLAUDE_V1_INSTANT, self.CLAUDE_V2, self.CLAUDE_V2_1]:
+            return full_response.get('completion')
+        content = full_response.get('content', [])
+        if len(content) == 0:
+            return None
+        if (tool_use := next((block for block in content if block.get('type') == 'tool_use'), None)):
+            return json.dumps(tool_use.get('input', {}))
+        return content[0].get('text', None)
+
+    @property
+    def supports_tool_use(self) -> bool:
+        return self.model_id not in [self.CLAUDE_V1_INSTANT, self.CLAUDE_V2, self.CLAUDE_V2_1]
+
+    def invoke(self, 
+        prompt: str,
+        temperature: float = None,
+        top_p: float = None,
+        top_k: int = None,
+        max_tokens: int = None,
+        stop_sequences: list = None,
+        cache_prefix: str = None,
+        tool: dict = None
+    ) -> dict:
+        prompt_data = self.get_prompt_data(
+            prompt, temperature, top_p, top_k, max_tokens, stop_sequences, cache_prefix, tool)
+
+        response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)
+        response['prediction'] = self.get_prediction(response['full_response'])
 
         if not response['prediction']:
             response['error'] = 'no prediction returned'
@@ -49,9 +49,53 @@ Output is also normalized by providing a consistent JSON document structure:
         "prediction": "Hello, world!",
         "input_tokens": 9,
         "output_tokens": 6
+        "cache_read_tokens": 0,
+        "cache_write_tokens": 0,
+        "cost": 0.0000097,
         "invocation_time_ms": 205,
     }
 
+Each call is priced and recorded by bedrock_utils.metering.
+
+Each instance also provides an asyncio counterpart, which runs invoke on a bounded
+executor so that independent calls can be overlapped:
+
+    response = await instance.invoke_async(prompt, temperature=0.0)
+
+Streaming invocations use the same parameters, and return a BedrockModelStream that
+yields normalized text deltas as they arrive:
+
+    stream = instance.invoke_stream(prompt, temperature=0.0)
+    for delta in stream:
+        print(delta, end='')
+    stream.close()  # optional - stops generation early if the stream is not exhausted
+
+Once the stream is exhausted or closed, stream.response holds the normalized output
+plus the streaming metrics:
+
+    {
+        "prediction": "Hello, world!",
+        "input_tokens": 9,
+        "output_tokens": 6,
+        "first_token_time": 120,
+        "invocation_time": 205,
+        "stopped_early": false
+    }
+
+Wrappers for models that support prompt caching list them in PROMPT_CACHING_MODELS, with
+the minimum number of tokens Bedrock will cache, and accept a cache_prefix argument: the
+start of the prompt that is stable from call to call, which is marked as cacheable when it
+is long enough. Cache reads and writes are reported as cache_read_tokens and
+cache_write_tokens (input_tokens excludes them); wrappers and models without prompt
+caching ignore cache_prefix:
+
+    if instance.supports_prompt_caching:
+        response = instance.invoke(prompt, cache_prefix=stable_prefix)
+
+Prompts can also be run offline, as a Bedrock batch inference job (see
+bedrock_utils.batch_inference): get_prompt_data builds each record's model input, and
+get_prediction extracts the prediction from each output record.
+
 Note: these helper classes can be used independently, or in conjunction with LLM
 frameworks such as LangChain (https://python.langchain.com/en/latest/index.html).
 
@@ -61,6 +105,9 @@ import json
 import logging
 import time
 from boto3 import client
+from botocore.exceptions import ClientError
+from bedrock_utils.executor import run_in_executor
+from bedrock_utils import metering, rate_limiter
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -68,17 +115,179 @@ logger.setLevel(logging.INFO)
 RESPONSE_MIME_TYPE = 'application/json'
 INPUT_MIME_TYPE = 'application/json'
 
+class BedrockModelStream(object):
+    def __init__(
+        self,
+        model_instance: 'BedrockModel',
+        start_time: float,
+        bedrock_response: dict = None,
+        completed_response: dict = None,
+        estimated_input_tokens: int = None
+    ) -> None:
+        self._model_instance = model_instance
+        self._start_time = start_time
+        self._estimated_input_tokens = estimated_input_tokens
+        self._event_stream = None
+        self._deltas = []
+        self._finished = False
+
+        if completed_response is not None:
+            # models without streaming support are invoked synchronously, and the
+            # prediction is delivered as a single delta
+            self.response = completed_response
+            self.response['first_token_time'] = completed_response.get('invocation_time')
+            self.response['stopped_early'] = False
+        else:
+            self._event_stream = bedrock_response.get('body')
+            self.response = {
+                'prediction': None,
+                'input_tokens': None,
+                'output_tokens': None,
+                'cache_read_tokens': 0,
+                'cache_write_tokens': 0,
+                'first_token_time': None,
+                'invocation_time': None,
+                'stopped_early': False
+            }
+            response_metadata = bedrock_response.get('ResponseMetadata', {}).get('HTTPHeaders')
+            if response_metadata:
+                self.response['request_id'] = response_metadata.get('x-amzn-requestid')
+
+    def __iter__(self):
+        if self._event_stream is None:
+            if not self._finished:
+                self._finished = True
+                yield self.response.get('prediction')
+            return
+
+        for event in self._event_stream:
+            if not (chunk := event.get('chunk')):
+                error = ', '.join(event.keys())
+                logger.error('<<invoke_stream>>: EXCEPTION: {}'.format(error))
+                self._finish()
+                raise RuntimeError('error in response stream: {}'.format(error))
+
+            chunk_data = json.loads(chunk.get('bytes'))
+
+            if (metrics := chunk_data.get('amazon-bedrock-invocationMetrics')):
+                self.response['input_tokens'] = metrics.get('inputTokenCount')
+                self.response['output_tokens'] = metrics.get('outputTokenCount')
+                self.response['cache_read_tokens'] = metrics.get('cacheReadInputTokenCount', 0)
+                self.response['cache_write_tokens'] = metrics.get('cacheWriteInputTokenCount', 0)
+                self.response['invocation_latency'] = metrics.get('invocationLatency')
+
+            delta = self._model_instance.get_stream_delta(chunk_data)
+            if not delta:
+                continue
+
+            if self.response['first_token_time'] is None:
+                self.response['first_token_time'] = int((time.time() - self._start_time) * 1000)  # milliseconds
+                if delta[:1] == self._model_instance.LEADING_CHARACTER:
+                    delta = delta[1:]
+
+            self._deltas.append(delta)
+            yield delta
+
+        self._finish()
+
+    def close(self) -> dict:
+        if not self._finished and self._event_stream is not None:
+            self.response['stopped_early'] = True
+            self._event_stream.close()
+            self._finish()
+        return self.response
+
+    def _finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+
+        self.response['invocation_time'] = int((time.time() - self._start_time) * 1000)  # milliseconds
+        self.response['prediction'] = ''.join(self._deltas)
+
+        # streams closed early never receive the invocation metrics, but the tokens generated so far are billed
+        if self.response['input_tokens'] is None and self._estimated_input_tokens is not None:
+            self.response['input_tokens'] = self._estimated_input_tokens
+            self.response['output_tokens'] = len(self.response['prediction']) // 4
+        if self.response['input_tokens'] is not None:
+            if self._estimated_input_tokens is not None:
+                # reconcile the tokens-per-minute bucket, as invoke_bedrock_model does
+                rate_limiter.get_rate_limiter(self._model_instance.model_id).record_usage(
+                    self._estimated_input_tokens, self.response['input_tokens'] + (self.response['output_tokens'] or 0))
+            self.response['cost'] = metering.record_usage(
+                self._model_instance.model_id, self.response['input_tokens'], self.response['output_tokens'],
+                self.response['cache_read_tokens'], self.response['cache_write_tokens'])
+
+        if not self.response['prediction']:
+            self.response['error'] = 'no prediction returned'
+            self.response['prediction'] = 'no response from LLM'
+            logger.error('<<invoke_stream>>: {}'.format(self.response['error']))
+
+        logger.info('<<invoke_stream>>: [{}] prediction = {}'.format(
+            self._model_instance.model_instance_name, json.dumps(self.response['prediction'], indent=4)))
+        logger.debug('<<invoke_stream>>: [{}] first token time = {} ms, invocation time = {} ms'.format(
+            self._model_instance.model_instance_name,
+            self.response['first_token_time'],
+            self.response['invocation_time']))
+
+
 class BedrockModel(object):
     MODEL_NAMES = {}
+    # model_id -> minimum cacheable prefix, in tokens
+    PROMPT_CACHING_MODELS = {}
+    SUPPORTS_STREAMING = True
+    LEADING_CHARACTER = None
 
     def __init__(self, bedrock_client: client, model_id: str, instance_name: str = None) -> None:
         self._bedrock_client = bedrock_client
         self._model_id = model_id
         self._instance_name = instance_name if instance_name else self.model_name()
-        
+
     def invoke(self, prompt: str, model_id: str, instance_name: str) -> None:
         pass
-    
+
+    async def invoke_async(self, prompt: str, **kwargs) -> dict:
+        return await run_in_executor(self.invoke, prompt, **kwargs)
+
+    def get_prompt_data(self, prompt: str, **kwargs) -> dict:
+        pass
+
+    def get_stream_delta(self, chunk: dict) -> str:
+        return None
+
+    def get_prediction(self, full_response: dict) -> str:
+        # the generated text in a model response body (also used for batch inference output)
+        pass
+
+    def invoke_stream(self, prompt: str, **kwargs) -> BedrockModelStream:
+        if not self.SUPPORTS_STREAMING:
+            start_time = time.time()
+            return BedrockModelStream(self, start_time, completed_response=self.invoke(prompt, **kwargs))
+
+        prompt_data = self.get_prompt_data(prompt, **kwargs)
+        return self.invoke_bedrock_model_stream(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)
+
+    def invoke_bedrock_model_stream(
+        self,
+        prompt_data: dict,
+        input_mime_type: str,
+        response_mime_type: str,
+    ) -> BedrockModelStream:
+        logger.info('<<invoke_bedrock_model_stream>>: [{}] model_id = {}, prompt = {}'.format(
+            self.model_instance_name, self._model_id, json.dumps(prompt_data, indent=4)))
+
+        body = json.dumps(prompt_data)
+
+        bedrock_response, start_time = self.call_with_retry(
+            self._bedrock_client.invoke_model_with_response_stream, body, input_mime_type, response_mime_type)
+
+        if not bedrock_response:
+            logger.error('<<invoke_bedrock_model_stream>>: EXCEPTION: no response from model')
+            raise RuntimeError('no response from model')
+
+        return BedrockModelStream(
+            self, start_time, bedrock_response=bedrock_response, estimated_input_tokens=self.estimate_tokens(body))
+
     def invoke_bedrock_model(
         self,
         prompt_data: dict,
@@ -90,16 +299,9 @@ class BedrockModel(object):
         
         body = json.dumps(prompt_data)
 
-        start_time = time.time()
-
         response = None
-        try:
-            bedrock_response = self._bedrock_client.invoke_model(
-                body=body, modelId=self._model_id, accept=response_mime_type, contentType=input_mime_type
-            )
-        except Exception as e:
-            logger.error('<<invoke_bedrock_model>>: EXCEPTION: {}'.format(e))
-            raise e
+        bedrock_response, start_time = self.call_with_retry(
+            self._bedrock_client.invoke_model, body, input_mime_type, response_mime_type)
 
         invocation_time = int((time.time() - start_time) * 1000)  # milliseconds
 
@@ -126,13 +328,59 @@ class BedrockModel(object):
             response['invocation_latency'] = int(response_metadata.get('x-amzn-bedrock-invocation-latency'))
             response['input_tokens'] = int(response_metadata.get('x-amzn-bedrock-input-token-count'))
             response['output_tokens'] = int(response_metadata.get('x-amzn-bedrock-output-token-count'))
+            response['cache_read_tokens'] = int(response_metadata.get('x-amzn-bedrock-cache-read-input-token-count', 0))
+            response['cache_write_tokens'] = int(response_metadata.get('x-amzn-bedrock-cache-write-input-token-count', 0))
+            rate_limiter.get_rate_limiter(self._model_id).record_usage(
+                self.estimate_tokens(body), response['input_tokens'] + response['output_tokens'])
+            response['cost'] = metering.record_usage(
+                self._model_id, response['input_tokens'], response['output_tokens'],
+                response['cache_read_tokens'], response['cache_write_tokens'])
         
         return response
+
+    def estimate_tokens(self, body: str) -> int:
+        # rough estimate used for tokens-per-minute budgets, reconciled after each call
+        return len(body) // 4
+
+    def call_with_retry(self, operation, body: str, input_mime_type: str, response_mime_type: str) -> tuple:
+        limiter = rate_limiter.get_rate_limiter(self._model_id)
+        attempt = 0
+
+        while True:
+            limiter.acquire(self.estimate_tokens(body))
+            start_time = time.time()
+            try:
+                bedrock_response = operation(
+                    body=body, modelId=self._model_id, accept=response_mime_type, contentType=input_mime_type
+                )
+                return bedrock_response, start_time
+            except ClientError as e:
+                error_code = e.response.get('Error', {}).get('Code')
+                if error_code in rate_limiter.RETRYABLE_ERRORS and (delay := rate_limiter.backoff_delay(attempt)) is not None:
+                    logger.warning('<<call_with_retry>>: [{}] {} on attempt {}, retrying in {} ms'.format(
+                        self.model_instance_name, error_code, attempt + 1, int(delay * 1000)))
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                logger.error('<<call_with_retry>>: EXCEPTION: {}'.format(e))
+                raise e
+            except Exception as e:
+                logger.error('<<call_with_retry>>: EXCEPTION: {}'.format(e))
+                raise e
         
     @property
     def model_id(self) -> str:
         return self._model_id
 
+    @property
+    def supports_prompt_caching(self) -> bool:
+        return self._model_id in type(self).PROMPT_CACHING_MODELS
+
+    @property
+    def supports_tool_use(self) -> bool:
+        # wrappers that accept a tool argument (a tool the model is required to call) override this
+        return False
+
     @property
     def model_name(self) -> str:
         return type(self).MODEL_NAMES.get(self._model_id, 'NO-MODEL')
@@ -39,6 +39,7 @@ class MistralAIModel(BedrockModel):
         MISTRAL_SMALL: 'Mistral Small',
         MISTRAL_LARGE: 'Mistral Large'
     }
+    LEADING_CHARACTER = ' '
 
     def __init__(
         self,
@@ -57,7 +58,7 @@ class MistralAIModel(BedrockModel):
         self.max_tokens = max_tokens
         super().__init__(bedrock_client, model_id, instance_name)
 
-    def invoke(self, 
+    def get_prompt_data(self, 
         prompt: str,
         temperature: float = None,
         top_p: float = None,
@@ -75,12 +76,32 @@ class MistralAIModel(BedrockModel):
         
         if top_k:
             top_k = 200 if top_k > 200 else top_k
-        
+
+        return prompt_data
+
+    def get_stream_delta(self, chunk: dict) -> str:
+        outputs = chunk.get('outputs', [])
+        if len(outputs) == 0:
+            return None
+        return outputs[0].get('text')
+
+    def get_prediction(self, full_response: dict) -> str:
+        return full_response['outputs'][0].get('text')
+
+    def invoke(self, 
+        prompt: str,
+        temperature: float = None,
+        top_p: float = None,
+        top_k: int = None,
+        max_tokens: int = None
+    ) -> dict:
+        prompt_data = self.get_prompt_data(prompt, temperature, top_p, top_k, max_tokens)
+
         response = self.invoke_bedrock_model(prompt_data, INPUT_MIME_TYPE, RESPONSE_MIME_TYPE)
         
         logger.info('MistralAIModel: response = {}'.format(json.dumps(response, indent=4)))
 
-        response['prediction'] = response['full_response']['outputs'][0].get('text')
+        response['prediction'] = self.get_prediction(response['full_response'])
 
         if not response['prediction']:
             response['error'] = 'no prediction returned'
@@ -0,0 +1,187 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Retrieval query construction for multi-turn conversations
+
+Sending the tail of the rolling conversation as the knowledge base query truncates the
+start of the text rather than the stale part, and pads the query with previous answers
+that dilute the query embedding. QueryBuilder builds a compact query instead:
+ - the current question comes first, and is never dropped
+ - entities resolved from the conversation (brand, location, amenity) are appended when
+   the current question does not already name one of the same kind, so a follow-up like
+   "Do they have a spa?" is retrieved against the brand from an earlier question (earlier
+   locations are dropped when the current question names a brand, and only a short
+   follow-up question inherits the amenity of the previous question)
+ - previous answers are left out; only the user's questions and the session brand are used
+ - the query fits the Bedrock Retrieve limit of 1000 characters
+
+Brands are matched against the configured brand names (and their names without the
+'Example Corp' prefix), locations are the capitalized names left in a question once brands
+and sentence-initial words are removed, and amenities are matched against a vocabulary.
+"""
+
+import logging
+import re
+from bedrock_utils.lexical import terms
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_QUERY_LENGTH = 1000     # characters, Bedrock Retrieve limit
+BRAND_PREFIX = 'example corp '
+# a question with no more terms than this besides its entities is a follow-up (e.g. "What about
+# their other hotels?"), so it also inherits the amenity of the previous question
+FOLLOW_UP_TERMS = 2
+
+AMENITIES = (
+    'ev charging', 'charging station', 'room service', 'kids club', 'fitness center', 'business center',
+    'meeting room', 'swimming pool', 'infinity pool', 'pool', 'spa', 'gym', 'restaurant', 'dining', 'bar',
+    'lounge', 'parking', 'valet', 'wifi', 'wi-fi', 'internet', 'shuttle', 'beach', 'golf', 'tennis',
+    'casino', 'nightclub', 'concierge', 'pet', 'laundry', 'breakfast', 'suite', 'villa', 'bungalow',
+    'balcony', 'check-in', 'check-out', 'cancellation', 'loyalty', 'rewards', 'wedding', 'event'
+)
+
+# capitalized words that are not names
+NOT_NAMES = frozenset((
+    'a an and any are can could do does for from have how i in is it may of on or please should tell '
+    'the they this what when where which who why will with would yes no hi hello thanks thank you your '
+    'example corp hotel hotels resort resorts').split())
+
+NAME = re.compile(r"[A-Z][\w'-]*(?:\s+[A-Z][\w'-]*)*")
+
+class QueryBuilder():
+    def __init__(
+        self,
+        brands: list = None,
+        amenities: tuple = AMENITIES,
+        max_length: int = MAX_QUERY_LENGTH
+    ) -> None:
+        self._brands = list(brands) if brands else []
+        self._amenities = amenities
+        self._max_length = max_length
+
+        # brand aliases, longest first so the full name wins
+        aliases = []
+        for brand in self._brands:
+            aliases.append((brand.lower(), brand))
+            if brand.lower().startswith(BRAND_PREFIX):
+                aliases.append((brand.lower()[len(BRAND_PREFIX):], brand))
+        aliases.sort(key=lambda alias: len(alias[0]), reverse=True)
+        self._brand_aliases = [(re.compile(r'\b' + re.escape(alias) + r'\b'), brand) for alias, brand in aliases]
+        self._amenity_patterns = [
+            (re.compile(r'\b' + re.escape(amenity) + r'(?:s|es)?\b'), amenity) for amenity in amenities]
+
+    def extract_entities(self, text: str) -> dict:
+        entities = {'brand': [], 'location': [], 'amenity': []}
+
+        for pattern, brand in self._brand_aliases:
+            if pattern.search(text.lower()):
+                text = re.sub(pattern.pattern, ' ', text, flags=re.IGNORECASE)
+                if brand not in entities['brand']:
+                    entities['brand'].append(brand)
+
+        amenity_matches = []
+        lowered = text.lower()
+        for pattern, amenity in self._amenity_patterns:
+            amenity_matches += [(match.start(), match.end(), amenity) for match in pattern.finditer(lowered)]
+
+        names = []
+        for match in NAME.finditer(text):
+            words = match.group().split()
+            # drop leading and trailing words that are not names (e.g. sentence-initial 'What')
+            while words and words[0].lower() in NOT_NAMES:
+                words.pop(0)
+            while words and words[-1].lower() in NOT_NAMES:
+                words.pop()
+            name = ' '.join(words)
+            if len(name) < 2:
+                continue
+            start = text.index(name, match.start())
+            end = start + len(name)
+            # a name within an amenity (e.g. 'EV' in 'EV charging') is the amenity, and an
+            # amenity within a longer name (e.g. 'beach' in 'Miami Beach') is the name
+            if any(a_start <= start and end <= a_end for a_start, a_end, _ in amenity_matches):
+                continue
+            names.append((start, end))
+            if name not in entities['location']:
+                entities['location'].append(name)
+
+        for a_start, a_end, amenity in sorted(amenity_matches):
+            if any(start <= a_start and a_end <= end for start, end in names):
+                continue
+            # e.g. 'pool' within 'infinity pool'
+            if any(start <= a_start and a_end <= end and (start, end) != (a_start, a_end)
+                   for start, end, _ in amenity_matches):
+                continue
+            if amenity not in entities['amenity']:
+                entities['amenity'].append(amenity)
+
+        return entities
+
+    def build(self, question: str, history: list = None, brand: str = None) -> dict:
+        """history is the list of previous turns ({'Q': question, 'A': answer}), oldest first.
+        brand is the brand resolved for the session, if any"""
+        question = ' '.join(question.split())[:self._max_length]
+        current = self.extract_entities(question)
+
+        # entities from the session brand and earlier questions, most recent first,
+        # for the kinds of entity the current question does not name itself
+        entity_terms = set(terms(' '.join(value for values in current.values() for value in values)))
+        follow_up = len(set(terms(question)) - entity_terms) <= FOLLOW_UP_TERMS
+
+        resolved = {'brand': [], 'location': [], 'amenity': []}
+        sources = [self.extract_entities(brand)] if brand else []
+        sources += [self.extract_entities(turn.get('Q', '')) for turn in reversed(history or [])]
+        for position, entities in enumerate(sources):
+            for kind, values in entities.items():
+                if current[kind]:
+                    continue
+                # locations from earlier questions belong to the earlier brand
+                if kind == 'location' and current['brand']:
+                    continue
+                # amenities carry over to a follow-up, and only from the previous question
+                if kind == 'amenity' and (not follow_up or position != len(sources) - len(history or [])):
+                    continue
+                for value in values:
+                    if value not in resolved[kind]:
+                        resolved[kind].append(value)
+
+        added = []
+        query = question
+        for value in resolved['brand'] + resolved['location'] + resolved['amenity']:
+            candidate = f'{query}; {value}' if added else f'{query} ({value}'
+            if len(candidate) + 1 > self._max_length:
+                break
+            query = candidate
+            added.append(value)
+        if added:
+            query += ')'
+
+        logger.info(f'<<build>> retrieval query ({len(query)} characters) = {query}')
+        return {'query': query, 'entities': added, 'current_entities': current}
+
+    @property
+    def brands(self) -> list:
+        return self._brands
+
+    @property
+    def max_length(self) -> int:
+        return self._max_length
+
+    @max_length.setter
+    def max_length(self, value: int):
+        self._max_length = value
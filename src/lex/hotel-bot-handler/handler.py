@@ -14,6 +14,7 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import asyncio
 import json
 import logging
 
@@ -28,6 +29,7 @@ import ToggleLLMContext
 import ToggleLLMGuardrails
 
 import bedrock_helpers
+from bedrock_utils import clients, metering, rate_limiter
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -75,8 +77,19 @@ def lambda_handler(event, context):
     if intent_name in HANDLERS:
         logger.debug('<<handler>> handler function: routing to intent %s', intent_name)
         
+        # test traffic must never starve live callers of Bedrock capacity
+        rate_limiter.set_invocation_context(
+            priority=rate_limiter.PRIORITY_TEST if sessionAttributes.get('ground-truth') else rate_limiter.PRIORITY_LIVE,
+            remaining_time_ms=context.get_remaining_time_in_millis() if context else None
+        )
+
+        # meter the Bedrock calls made for this turn, and switch to a cheaper model once a budget is spent
+        cost_meter = metering.start_turn(event.get('sessionId'))
+        budget_exhausted = metering.budget_exhausted(float(sessionAttributes.get('session_cost', '0')))
+
         # clean up session attributes
         sessionAttributes = clear_session_attributes(sessionAttributes)
+        sessionAttributes['budget_exhausted'] = '1' if budget_exhausted else '0'
 
         # track the prior prompt for analysis purposes
         if prior_prompt_id := sessionAttributes.get('prompt_id'):
@@ -109,11 +122,12 @@ def lambda_handler(event, context):
         event['sessionState']['sessionAttributes'] = sessionAttributes
         response = HANDLERS[intent_name]['handler'](event, context)
 
-        logger.info('<<handler>>: delegated intent handler response = {}'.format(json.dumps(response)))
-        
+        # the retrieved context (a RetrievedContext) is removed before the response is logged
         if (retrieved_context := response.get('_retrieved_context')):
             logger.debug(f'RETRIEVED_CONTEXT = {retrieved_context}')
             del response['_retrieved_context']
+
+        logger.info('<<handler>>: delegated intent handler response = {}'.format(json.dumps(response)))
         
         # manage contexts
         response = clear_inactive_contexts(response)
@@ -123,8 +137,16 @@ def lambda_handler(event, context):
             input_transcript = event.get('inputTranscript')
             rag_response = response['messages'][0]['content']
 
-            if (evaluation_agent := bedrock_helpers.select_conversational_agent(sessionAttributes.get('evaluationLLM'))):
-                if (evaluation_response := evaluation_agent.evaluate_response(input_transcript, rag_response, ground_truth)):
+            evaluation_agent = bedrock_helpers.select_conversational_agent(
+                bedrock_helpers.BUDGET_FALLBACK_LLM if budget_exhausted else sessionAttributes.get('evaluationLLM'))
+            detection_agent = bedrock_helpers.select_conversational_agent(
+                bedrock_helpers.BUDGET_FALLBACK_LLM if budget_exhausted else sessionAttributes.get('detectionLLM'))
+
+            evaluation_response, detection_response = asyncio.run(run_test_evaluations(
+                evaluation_agent, detection_agent, input_transcript, rag_response, ground_truth, retrieved_context))
+
+            if evaluation_agent:
+                if evaluation_response:
                     logger.debug(f'EVALUATION RESULT = {json.dumps(evaluation_response, indent=4)}')
                     time_in_ms = evaluation_response.get('invocation_time')
                     result = evaluation_response.get('result')
@@ -133,10 +155,10 @@ def lambda_handler(event, context):
                     sessionAttributes['evaluation_result'] = result
                     sessionAttributes['evaluation_details'] = rationale
                     sessionAttributes['evaluation_latency'] = time_in_ms
-                    sessionAttributes['evaluation_llm'] = evaluation_agent.model_instance.model_id
+                    sessionAttributes['evaluation_llm'] = evaluation_response.get('model_id', evaluation_agent.model_instance.model_id)
 
-            if (detection_agent := bedrock_helpers.select_conversational_agent(sessionAttributes.get('detectionLLM'))):
-                  if (detection_response := detection_agent.detect_hallucinations(input_transcript, rag_response, retrieved_context)):
+            if detection_agent:
+                  if detection_response:
                     logger.debug(f'DETECTION RESULT = {json.dumps(detection_response, indent=4)}')
                     time_in_ms = detection_response.get('invocation_time')
                     result = detection_response.get('result')
@@ -145,10 +167,27 @@ def lambda_handler(event, context):
                     sessionAttributes['detection_result'] = result
                     sessionAttributes['detection_details'] = rationale
                     sessionAttributes['detection_latency'] = time_in_ms
-                    sessionAttributes['detection_llm'] = detection_agent.model_instance.model_id
-
+                    sessionAttributes['detection_llm'] = detection_response.get('model_id', detection_agent.model_instance.model_id)
+
+
+        # capture the cost of this turn (generation, evaluation and detection) for analytics
+        metering.finish_turn(cost_meter, {'Intent': intent_name})
+        responseAttributes = response.get('sessionState', {}).get('sessionAttributes', sessionAttributes)
+        responseAttributes['turn_cost'] = f'{cost_meter.cost:.6f}'
+        responseAttributes['session_cost'] = f'{float(responseAttributes.get("session_cost", "0")) + cost_meter.cost:.6f}'
+        responseAttributes['session_input_tokens'] = str(
+            int(responseAttributes.get('session_input_tokens', '0')) + cost_meter.input_tokens)
+        responseAttributes['session_output_tokens'] = str(
+            int(responseAttributes.get('session_output_tokens', '0')) + cost_meter.output_tokens)
+        responseAttributes['session_cache_read_tokens'] = str(
+            int(responseAttributes.get('session_cache_read_tokens', '0')) + cost_meter.cache_read_tokens)
+        responseAttributes['session_cache_write_tokens'] = str(
+            int(responseAttributes.get('session_cache_write_tokens', '0')) + cost_meter.cache_write_tokens)
+        responseAttributes['session_cache_savings'] = \
+            f'{float(responseAttributes.get("session_cache_savings", "0")) + cost_meter.cache_savings:.6f}'
 
         logger.info(f'<<handler>> handler response: {json.dumps(response)}')
+        logger.info(f'<<handler>> connection stats: {json.dumps(clients.get_connection_stats())}')
         return response
 
     else:
@@ -168,6 +207,20 @@ def lambda_handler(event, context):
         return response
 
 
+async def run_test_evaluations(evaluation_agent, detection_agent, question, answer, ground_truth, retrieved_context):
+    # the evaluation and hallucination detection calls are independent, so run them concurrently
+    async def no_agent():
+        return None
+
+    evaluation = evaluation_agent.evaluate_response_async(question, answer, ground_truth) \
+        if evaluation_agent else no_agent()
+    # turns answered without retrieved context (see RetrievalPlanner) have nothing to check against
+    detection = detection_agent.detect_hallucinations_async(question, answer, retrieved_context) \
+        if detection_agent and retrieved_context else no_agent()
+
+    return await asyncio.gather(evaluation, detection)
+
+
 def clear_inactive_contexts(response):
     sessionState = response.get('sessionState', {})
     activeContexts = sessionState.get('activeContexts', [])
@@ -185,7 +238,11 @@ def clear_inactive_contexts(response):
 
 def clear_session_attributes(sessionAttributes):
     delete_list = (
-        'rag_request_id', 'rag_input_tokens', 'rag_output_tokens', 
-        'retrieval_latency', 'rag_latency', 'total_latency'
+        'rag_request_id', 'rag_input_tokens', 'rag_output_tokens', 'rag_cache_read_tokens', 'rag_cache_write_tokens',
+        'retrieval_latency', 'rag_latency', 'rag_first_token_latency', 'rag_hedged', 'total_latency',
+        'rag_cache_hit', 'rag_cache_latency', 'semantic_cache_hit', 'semantic_cache_similarity',
+        'retrieval_cache', 'turn_cost', 'context_tokens', 'context_tokens_saved',
+        'retrieval_num_results', 'retrieval_num_matches', 'retrieval_tokens_avoided', 'retrieval_backends',
+        'retrieval_plan', 'retrieval_plan_reason'
     )
     return {k: sessionAttributes[k] for k in sessionAttributes if k not in delete_list}
@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Cold-start benchmark for bedrock_helpers
+
+Measures the work of a Lambda cold start up to the first answer, in a fresh interpreter
+per run:
+ - the time to import bedrock_helpers (the Lambda init phase)
+ - the time to select the default conversational agent and the default knowledge base
+   (the first turn, before any request is sent)
+ - the process RSS before the import and after the selection
+ - the number of agents and boto3 clients created
+
+Modes:
+ - eager: after the import, does what importing bedrock_helpers used to do - create the
+          Bedrock, Bedrock agent and SQS clients, import the grounding check and hedging
+          modules, and create every CONVERSATIONAL_AGENTS entry
+ - lazy:  only what the first turn selects is created
+
+Usage (no AWS credentials are needed, no models are invoked):
+
+    python test/benchmarks/cold_start.py [--runs 9]
+"""
+
+import argparse
+import importlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+HANDLER_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'lex', 'hotel-bot-handler')
+
+EAGER_CLIENTS = ['bedrock-runtime', 'bedrock-agent-runtime', 'sqs']
+EAGER_MODULES = ['bedrock_utils.grounding_check', 'bedrock_utils.conversational_agents.hedged_agent']
+
+def rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(mode: str) -> dict:
+    rss_before = rss_mb()
+
+    start_time = time.perf_counter()
+    import bedrock_helpers
+    from bedrock_utils import clients
+    if mode == 'eager':
+        for service_name in EAGER_CLIENTS:
+            clients.get_client(service_name)
+        for module_name in EAGER_MODULES:
+            importlib.import_module(module_name)
+        for name in bedrock_helpers.CONVERSATIONAL_AGENTS.keys():
+            bedrock_helpers.CONVERSATIONAL_AGENTS.get(name)
+    import_ms = (time.perf_counter() - start_time) * 1000
+
+    start_time = time.perf_counter()
+    bedrock_helpers.select_conversational_agent('Default')
+    bedrock_helpers.select_knowledge_base('Default')
+    select_ms = (time.perf_counter() - start_time) * 1000
+
+    return {
+        'import_ms': import_ms,
+        'select_ms': select_ms,
+        'total_ms': import_ms + select_ms,
+        'rss_before_mb': rss_before,
+        'rss_after_mb': rss_mb(),
+        'agents_created': len(bedrock_helpers.CONVERSATIONAL_AGENTS.loaded),
+        'clients_created': len(clients._clients)
+    }
+
+def run(mode: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    env['PREWARM_CONNECTIONS'] = '0'
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    output = subprocess.check_output(
+        [sys.executable, __file__, '--child', mode], cwd=HANDLER_DIR, env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=9)
+    parser.add_argument('--child', choices=['eager', 'lazy'])
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, os.path.abspath(HANDLER_DIR))
+        print(json.dumps(measure(args.child)))
+        return
+
+    # alternate the modes, so that both see the same machine load
+    results = {'eager': [], 'lazy': []}
+    for _ in range(args.runs):
+        for mode in results:
+            results[mode].append(run(mode))
+
+    print(f'{"mode":<8}{"import ms":>12}{"select ms":>12}{"total ms":>12}{"RSS before":>12}{"RSS after":>12}{"agents":>8}{"clients":>9}')
+    for mode, mode_results in results.items():
+        median = {key: statistics.median(result[key] for result in mode_results) for key in mode_results[0]}
+        print(f'{mode:<8}{median["import_ms"]:>12.1f}{median["select_ms"]:>12.1f}{median["total_ms"]:>12.1f}'
+              f'{median["rss_before_mb"]:>10.1f}MB{median["rss_after_mb"]:>10.1f}MB'
+              f'{median["agents_created"]:>8.0f}{median["clients_created"]:>9.0f}')
+
+if __name__ == '__main__':
+    main()
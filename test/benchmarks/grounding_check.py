@@ -0,0 +1,141 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Local grounding check benchmark
+
+Runs bedrock_utils.grounding_check.GroundingChecker over labelled (question, answer, context,
+label) cases, where label is CORRECT or HALLUCINATED, and reports:
+ - verdicts:        the number of cases per local verdict (CORRECT, HALLUCINATED, UNCERTAIN)
+ - accuracy:        per decisive local verdict, the share of cases that match the label
+ - escalation_rate: the share of cases that the cascade (GROUNDING_CHECK=cascade) still sends
+                    to the LLM, i.e. every verdict but a local CORRECT
+ - check_us:        the mean time per check, in microseconds, for a context of --context-chars
+No model is invoked, so no AWS credentials are needed.
+
+The cases are built in, or read from a JSON lines file with question, answer, context and
+label fields (e.g. exported from the hallucination detection logs, labelled by the LLM).
+
+Usage:
+
+    python test/benchmarks/grounding_check.py [--cases cases.jsonl] [--repeat 200] [--context-chars 12000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'lex', 'hotel-bot-handler'))
+
+from bedrock_utils.grounding_check import GroundingChecker
+
+CONTEXT = (
+    'Example Corp Seaside Resorts offer oceanfront villas from $349 per night, and suites from $529. '
+    'Check-in is at 4:00 PM and check-out is at 11 am. The Harbor View restaurant serves breakfast '
+    'from 6:30 am to 10:30 am. EV charging stations are available at all 3 locations. '
+    'The Summer Festival runs from June 14th to June 16th, 2025, at the Seaside Pavilion. '
+    'Late check-out is available until noon, and the pool closes at midnight. '
+    'Valet parking costs $25 per night, and the resort fee is $40 per stay. '
+)
+
+SWAP_CONTEXT = (
+    'Check-in is at 4 PM and check-out is at 11 am. Pets are not allowed in the villas. '
+    'The breakfast buffet costs $32 per person, and valet parking costs $25 per night. '
+    'The airport shuttle does not run on Sundays; it leaves every 30 minutes from 6 am.'
+)
+
+# (question, answer, label) against CONTEXT, or (question, answer, label, context)
+CASES = [
+    ('How much is a villa?', 'Oceanfront villas start at $349 per night.', 'CORRECT'),
+    ('How much is a villa?', 'Oceanfront villas start at $299 per night.', 'HALLUCINATED'),
+    ('How much is a suite?', 'Suites are available from 529 dollars a night.', 'CORRECT'),
+    ('When is check-in?', 'Check-in is at 4 pm, and check-out is at 11:00 AM.', 'CORRECT'),
+    ('When is check-in?', 'Check-in is at 3 pm.', 'HALLUCINATED'),
+    ('When is breakfast served?', 'Breakfast is served at Harbor View from 6:30 am to 10:30 am.', 'CORRECT'),
+    ('When is breakfast served?', 'Breakfast is served at the Coral Terrace from 7 am.', 'HALLUCINATED'),
+    ('Do you have EV chargers?', 'Yes, EV charging stations are available at all three locations.', 'CORRECT'),
+    ('Do you have EV chargers?', 'Yes, EV charging stations are available at all five locations.', 'HALLUCINATED'),
+    ('When is the festival?', 'The Summer Festival runs from June 14 to June 16, 2025 at the Seaside Pavilion.', 'CORRECT'),
+    ('When is the festival?', 'The Summer Festival runs from July 14 to July 16.', 'HALLUCINATED'),
+    ('Is there a spa?', 'Yes, the resorts have a full-service spa.', 'HALLUCINATED'),
+    ('Are pets allowed?', 'I am sorry, I do not have information about pets.', 'CORRECT'),
+    ('Is the pool heated?', 'The villas are oceanfront, and guests can use the pool.', 'CORRECT'),
+    # times written as words in the context
+    ('Until when is late check-out?', 'Late check-out is available until 12 pm.', 'CORRECT'),
+    ('When does the pool close?', 'The pool closes at 12 am.', 'CORRECT'),
+    ('When does the pool close?', 'The pool closes at 10 pm.', 'HALLUCINATED'),
+    # amounts derived from the context
+    ('How much is valet parking for three nights?', 'Valet parking for three nights costs $75.', 'CORRECT'),
+    ('How much is valet parking for three nights?', 'Valet parking for three nights costs $90.', 'HALLUCINATED'),
+    ('What is the total for a villa night and the resort fee?', 'It comes to $389.', 'CORRECT'),
+    # values from the context attached to another fact, and negations that differ from the context
+    ('When is check-out?', 'Check-out is at 4 PM.', 'HALLUCINATED', SWAP_CONTEXT),
+    ('When is check-out?', 'Check-out is at 11 am.', 'CORRECT', SWAP_CONTEXT),
+    ('When is check-in?', 'Check-in is at 4 PM, and pets are allowed in the villas.', 'HALLUCINATED', SWAP_CONTEXT),
+    ('How much is breakfast?', 'The breakfast buffet costs $32, and check-in is at 11 am.', 'HALLUCINATED', SWAP_CONTEXT),
+    ('How much is breakfast?', 'The breakfast buffet costs $32 per person.', 'CORRECT', SWAP_CONTEXT),
+    ('How much is valet parking?', 'Valet parking costs $32 per night.', 'HALLUCINATED', SWAP_CONTEXT),
+    ('Can I bring my dog?', 'Yes, dogs are welcome, and pets are allowed in the villas.', 'HALLUCINATED', SWAP_CONTEXT),
+    # a negated clause next to the supporting one leaves a correct answer to the LLM
+    ('Is there a shuttle?', 'The airport shuttle runs every 30 minutes.', 'CORRECT', SWAP_CONTEXT),
+]
+
+def load_cases(path: str) -> list:
+    cases = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                case = json.loads(line)
+                cases.append((case['question'], case['answer'], case['label'], case['context']))
+    return cases
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', default=None)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--context-chars', type=int, default=12000)
+    args = parser.parse_args()
+
+    cases = load_cases(args.cases) if args.cases else [(case + (CONTEXT,))[:4] for case in CASES]
+    checker = GroundingChecker()
+
+    verdicts = {'CORRECT': 0, 'HALLUCINATED': 0, 'UNCERTAIN': 0}
+    matches = {'CORRECT': 0, 'HALLUCINATED': 0}
+    for question, answer, label, context in cases:
+        verdict = checker.check(question, answer, context)['verdict']
+        verdicts[verdict] += 1
+        if verdict in matches:
+            matches[verdict] += verdict == label
+    long_context = (CONTEXT * (args.context_chars // len(CONTEXT) + 1))[:args.context_chars]
+    question, answer = CASES[0][:2]
+    start_time = time.perf_counter()
+    for _ in range(args.repeat):
+        checker.check(question, answer, long_context)
+    check_us = round((time.perf_counter() - start_time) / args.repeat * 1e6, 2)
+
+    print(json.dumps({
+        'cases': len(cases),
+        'verdicts': verdicts,
+        'accuracy': {verdict: round(matches[verdict] / verdicts[verdict], 3) if verdicts[verdict] else None
+                     for verdict in matches},
+        'escalation_rate': round(sum(count for verdict, count in verdicts.items() if not checker.decides(verdict)) / len(cases), 3),
+        'check_us': check_us
+    }, indent=4))
+
+if __name__ == '__main__':
+    main()
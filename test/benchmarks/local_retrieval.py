@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Offline retrieval benchmark for LocalKnowledgeBase
+
+Builds (or reuses) a local index of the sample content, then measures:
+ - the index build time and the cold load time
+ - per-query retrieval latency (p50 / p95) for each search type
+ - the brand of the top-ranked chunk for each question, so ranking changes can be diffed
+
+Usage (no AWS credentials are needed):
+
+    python test/benchmarks/local_retrieval.py [--content content/content-word] [--index /tmp/local-kb] [--rebuild]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'lex', 'hotel-bot-handler'))
+
+from bedrock_utils.local_knowledge_base import LocalKnowledgeBase, build_index
+
+QUESTIONS = [
+    'Is there EV charging at the hotel?',
+    'Do you allow pets?',
+    'What is the cancellation policy?',
+    'Is valet parking available at Luxury Suites?',
+    'Which resorts have a kids club?',
+    'Tell me about the loyalty program.',
+    'Can I host a bachelorette party?',
+    'Where are the Seaside Resorts located?',
+    'Do Waypoint Inns offer free breakfast?',
+    'What brands does Example Corp Hospitality Group operate?',
+]
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--content', default=os.path.join(ROOT_DIR, 'content', 'content-word'))
+    parser.add_argument('--index', default='/tmp/local-kb')
+    parser.add_argument('--rebuild', action='store_true')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    report = {}
+    if args.rebuild or not os.path.exists(args.index):
+        shutil.rmtree(args.index, ignore_errors=True)
+        start_time = time.perf_counter()
+        metadata = build_index(args.content, args.index)
+        report['build_ms'] = round((time.perf_counter() - start_time) * 1000, 1)
+        report['chunks'] = len(metadata['chunks'])
+
+    start_time = time.perf_counter()
+    kb = LocalKnowledgeBase(args.index, max_docs=5)
+    report['load_ms'] = round((time.perf_counter() - start_time) * 1000, 1)
+
+    for search_type in ('SEMANTIC', 'HYBRID'):
+        latencies = []
+        top_sources = {}
+        for question in QUESTIONS:
+            for _ in range(args.repeat):
+                start_time = time.perf_counter()
+                results, _ = kb.retrieve_results(question, search_type=search_type)
+                latencies.append((time.perf_counter() - start_time) * 1000)
+            top_sources[question] = results[0]['metadata']['x-amz-bedrock-kb-source-uri'].split('/')[3]
+        report[search_type] = {
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'top_brand': top_sources
+        }
+
+    print(json.dumps(report, indent=4))
+
+if __name__ == '__main__':
+    main()
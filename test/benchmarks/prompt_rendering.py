@@ -0,0 +1,140 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Prompt rendering micro-benchmark for every conversational agent class
+
+For each agent class (generic and hotel, base / Titan / Claude), renders the answer,
+evaluation, comparison and detection prompts with:
+ - legacy: the datetime.strftime call plus sequential str.replace passes used before
+   bedrock_utils.prompt_template (and the extra {randomized} pass for the Claude agents)
+ - compiled: the agent's build_*_prompt methods
+checks that both produce the same prompt, and reports the mean time per render in
+microseconds. No model is invoked, so no AWS credentials are needed.
+
+Usage:
+
+    python test/benchmarks/prompt_rendering.py [--repeat 2000] [--context-chars 12000]
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'lex', 'hotel-bot-handler'))
+
+AGENT_CLASSES = [
+    'bedrock_utils.conversational_agents.conversational_agent.ConversationalAgent',
+    'bedrock_utils.conversational_agents.amazon.AmazonTitanConversationalAgent',
+    'bedrock_utils.conversational_agents.anthropic.AnthropicClaude3ConversationalAgent',
+    'bedrock_utils.hotel_agents.conversational_agent.ConversationalAgent',
+    'bedrock_utils.hotel_agents.amazon.AmazonTitanConversationalAgent',
+    'bedrock_utils.hotel_agents.anthropic.AnthropicClaude3ConversationalAgent',
+]
+
+QUESTION = 'Do the Seaside Resorts have EV charging stations?'
+ANSWER = 'Yes, Example Corp Seaside Resorts offer EV charging stations at all locations.'
+
+def legacy_answer_prompt(agent, context: str, user_input: str) -> str:
+    template = agent.answer_prompt if agent.context else agent.no_context_answer_prompt
+    guardrails = agent.get_shared_default('guardrails_on') if agent.guardrails else agent.get_shared_default('guardrails_off')
+    today = datetime.datetime.now().strftime('%B %-d, %Y')
+    prompt = template.replace('{current_date}', today)
+    prompt = prompt.replace('{context}', context)
+    prompt = prompt.replace('{guardrails}', guardrails)
+    prompt = prompt.replace('{user_question}', user_input)
+    if type(agent).__name__.startswith('AnthropicClaude'):
+        prompt = prompt.replace('{randomized}', f'random{random.randint(10000,99999)}')
+    return prompt
+
+def legacy_evaluation_prompt(agent, question: str, answer: str, ground_truth: str) -> str:
+    today = datetime.datetime.now().strftime('%B %-d, %Y')
+    prompt = agent.evaluation_prompt.replace('{current_date}', today)
+    prompt = prompt.replace('{question}', question.replace('\n', ' ').strip())
+    prompt = prompt.replace('{ground_truth}', ground_truth.replace('\n', ' ').strip())
+    prompt = prompt.replace('{answer}', answer.replace('\n', ' ').strip())
+    return prompt
+
+def legacy_comparison_prompt(agent, question: str, document: str, response_1: str, response_2: str) -> str:
+    today = datetime.datetime.now().strftime('%B %-d, %Y')
+    prompt = agent.comparison_prompt.replace('{current_date}', today)
+    prompt = prompt.replace('{question}', question.strip())
+    prompt = prompt.replace('{document}', document)
+    prompt = prompt.replace('{answer_1}', response_1.strip())
+    prompt = prompt.replace('{answer_2}', response_2.strip())
+    return prompt
+
+def legacy_detection_prompt(agent, question: str, answer: str, document: str) -> str:
+    today = datetime.datetime.now().strftime('%B %-d, %Y')
+    prompt = agent.detection_prompt.replace('{current_date}', today)
+    prompt = prompt.replace('{question}', question.replace('\n', ' ').strip())
+    prompt = prompt.replace('{document}', document)
+    prompt = prompt.replace('{answer}', answer.replace('\n', ' ').strip())
+    return prompt
+
+def time_call(function, repeat: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return round((time.perf_counter() - start_time) / repeat * 1e6, 2)
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--context-chars', type=int, default=12000)
+    args = parser.parse_args()
+
+    sentence = 'Example Corp Seaside Resorts offer oceanfront villas, infinity pools and EV charging. '
+    context = (sentence * (args.context_chars // len(sentence) + 1))[:args.context_chars]
+
+    report = {}
+    for class_path in AGENT_CLASSES:
+        module_name, class_name = class_path.rsplit('.', 1)
+        agent = getattr(importlib.import_module(module_name), class_name)(None)
+
+        cases = {
+            'answer': (lambda: legacy_answer_prompt(agent, context, QUESTION),
+                       lambda: agent.build_prompt(context, QUESTION)),
+            'evaluation': (lambda: legacy_evaluation_prompt(agent, QUESTION, ANSWER, ANSWER),
+                           lambda: agent.build_evaluation_prompt(QUESTION, ANSWER, ANSWER)),
+            'comparison': (lambda: legacy_comparison_prompt(agent, QUESTION, context, ANSWER, ANSWER),
+                           lambda: agent.build_comparison_prompt(QUESTION, context, ANSWER, ANSWER)),
+            'detection': (lambda: legacy_detection_prompt(agent, QUESTION, ANSWER, context),
+                          lambda: agent.build_detection_prompt(QUESTION, ANSWER, context)),
+        }
+
+        results = {}
+        for name, (legacy, compiled) in cases.items():
+            random.seed(0)
+            legacy_prompt = legacy()
+            random.seed(0)
+            if compiled() != legacy_prompt:
+                raise RuntimeError(f'{class_path} {name} prompt differs from the legacy rendering')
+            legacy_us = time_call(legacy, args.repeat)
+            compiled_us = time_call(compiled, args.repeat)
+            results[name] = {'legacy_us': legacy_us, 'compiled_us': compiled_us,
+                             'speedup': round(legacy_us / compiled_us, 2) if compiled_us else None}
+        report[class_path.replace('bedrock_utils.', '')] = results
+
+    print(json.dumps(report, indent=4))
+
+if __name__ == '__main__':
+    main()
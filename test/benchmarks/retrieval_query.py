@@ -0,0 +1,204 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Retrieval query benchmark: rolling conversation tail vs QueryBuilder
+
+Replays the test-case spreadsheet as multi-turn conversations (consecutive test cases for
+the same brand, up to CONVERSATION_TURNS turns, with the ground truth answers standing in
+for the LLM answers), and retrieves each turn with:
+ - rolling: the last 500 characters of the rolling conversation, as TopicIntentHandler did
+ - builder: QueryBuilder (current question + entities resolved from earlier questions)
+
+Each question is replayed as written, and (after the first turn) as a follow-up with the
+brand name replaced by 'them', which only the conversation can resolve. For each strategy
+the report has:
+ - brand_hit_rate: the top-ranked chunk is from the expected brand's documents
+ - answer_hit_rate: the top-ranked chunk covers at least half of the ground truth answer's terms
+ - p50 / p95 retrieval latency, and the average query length
+
+By default the queries run against a LocalKnowledgeBase built from the sample content, so no
+AWS credentials are needed; pass --knowledge-base-id to run against a Bedrock knowledge base.
+
+Usage:
+
+    python test/benchmarks/retrieval_query.py [--test-cases test/test-runs/test-cases-claude-haiku-2024-09-02.xlsx]
+        [--index /tmp/local-kb] [--knowledge-base-id KB_ID]
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import sys
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src', 'lex', 'hotel-bot-handler'))
+
+from bedrock_utils.lexical import terms
+from bedrock_utils.local_knowledge_base import LocalKnowledgeBase, build_index
+from bedrock_utils.query_builder import QueryBuilder
+
+CONVERSATION_TURNS = 4
+ANSWER_COVERAGE = 0.5
+
+# brand folder (S3 prefix) -> brand name, as in TopicIntentHandler.BRAND_FILTERS
+BRANDS = {
+    'seaside-resorts': 'Example Corp Seaside Resorts',
+    'luxury-suites':   'Example Corp Luxury Suites',
+    'waypoint-inns':   'Example corp Waypoint Inns',
+    'family-getaways': 'Example Corp Family Getaways',
+    'party-times':     'Example Corp Party Times',
+}
+
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+def read_xlsx(path: str) -> list:
+    """Rows of the first worksheet as dicts keyed by the header row"""
+    with zipfile.ZipFile(path) as workbook:
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in workbook.namelist():
+            for item in ET.fromstring(workbook.read('xl/sharedStrings.xml')).findall(SHEET_NS + 'si'):
+                shared_strings.append(''.join(text.text or '' for text in item.iter(SHEET_NS + 't')))
+        sheet = ET.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+
+    rows = []
+    for row in sheet.iter(SHEET_NS + 'row'):
+        values = {}
+        for cell in row.findall(SHEET_NS + 'c'):
+            column = re.match(r'[A-Z]+', cell.get('r')).group()
+            value = cell.find(SHEET_NS + 'v')
+            if cell.get('t') == 's' and value is not None:
+                values[column] = shared_strings[int(value.text)]
+            elif cell.get('t') == 'inlineStr':
+                values[column] = ''.join(text.text or '' for text in cell.iter(SHEET_NS + 't'))
+            else:
+                values[column] = value.text if value is not None else None
+        rows.append(values)
+
+    header = rows[0]
+    return [{header[column]: value for column, value in row.items() if column in header} for row in rows[1:]]
+
+def load_conversations(path: str) -> list:
+    conversations = []
+    for row in read_xlsx(path):
+        attributes = dict(item.split('=', 1) for item in (row.get('Session Attributes') or '').split(',') if '=' in item)
+        brand = attributes.get('brand', '').strip('/') or None
+        turn = {'question': row['Utterance'], 'answer': row.get('Ground Truth Answer') or '', 'brand': brand}
+        if conversations and conversations[-1][0]['brand'] == brand and len(conversations[-1]) < CONVERSATION_TURNS:
+            conversations[-1].append(turn)
+        else:
+            conversations.append([turn])
+    return conversations
+
+def follow_up(question: str, brand: str) -> str:
+    """The question with the brand name replaced by a pronoun, or None if it does not name the brand"""
+    name = BRANDS[brand]
+    for alias in (name, name[len('Example Corp '):]):
+        pattern = re.compile(re.escape(alias), re.IGNORECASE)
+        if pattern.search(question):
+            return pattern.sub('them', question)
+    return None
+
+def rolling_query(question: str, history: list) -> str:
+    conversation = ''.join(f"Q: {turn['Q']}\nA: {turn['A']}\n" for turn in history)
+    rolling_conversation = f'CONVERSATION HISTORY:\n{conversation}\nQUESTION: {question}' if conversation else question
+    return rolling_conversation[-500:]
+
+def answer_covered(answer: str, results: list) -> bool:
+    answer_terms = set(terms(answer))
+    retrieved_terms = set()
+    for result in results:
+        retrieved_terms.update(terms(result.get('content', {}).get('text', '')))
+    return bool(answer_terms) and len(answer_terms & retrieved_terms) / len(answer_terms) >= ANSWER_COVERAGE
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--test-cases', default=os.path.join(
+        ROOT_DIR, 'test', 'test-runs', 'test-cases-claude-haiku-2024-09-02.xlsx'))
+    parser.add_argument('--content', default=os.path.join(ROOT_DIR, 'content', 'content-word'))
+    parser.add_argument('--index', default='/tmp/local-kb')
+    parser.add_argument('--knowledge-base-id')
+    parser.add_argument('--max-docs', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.knowledge_base_id:
+        import boto3
+        from bedrock_utils.knowledge_base import BedrockKnowledgeBase
+        kb = BedrockKnowledgeBase(boto3.client('bedrock-agent-runtime'), args.knowledge_base_id,
+                                  max_docs=args.max_docs, search_type='HYBRID')
+    else:
+        if not os.path.exists(args.index):
+            shutil.rmtree(args.index, ignore_errors=True)
+            build_index(args.content, args.index)
+        kb = LocalKnowledgeBase(args.index, max_docs=args.max_docs)
+
+    builder = QueryBuilder(brands=BRANDS.values())
+    strategies = {
+        'rolling': lambda question, history, brand: rolling_query(question, history),
+        'builder': lambda question, history, brand: builder.build(question, history, BRANDS.get(brand))['query']
+    }
+
+    conversations = load_conversations(args.test_cases)
+    report = {'conversations': len(conversations), 'turns': sum(len(turns) for turns in conversations)}
+    for variant in ('as_written', 'follow_up'):
+        report[variant] = {}
+        for name, build_query in strategies.items():
+            latencies = []
+            query_lengths = []
+            brand_hits = brand_turns = answer_hits = turns_run = 0
+            for conversation in conversations:
+                history = []
+                for turn in conversation:
+                    question = turn['question']
+                    if variant == 'follow_up':
+                        question = follow_up(question, turn['brand']) if history and turn['brand'] else None
+                    if question:
+                        query = build_query(question, history, turn['brand'])
+                        start_time = time.perf_counter()
+                        results, _ = kb.retrieve_results(query)
+                        latencies.append((time.perf_counter() - start_time) * 1000)
+                        query_lengths.append(len(query))
+                        turns_run += 1
+                        if turn['brand']:
+                            brand_turns += 1
+                            top_source = results[0]['metadata']['x-amz-bedrock-kb-source-uri'] if results else ''
+                            brand_hits += f"/{turn['brand']}/" in top_source
+                        answer_hits += answer_covered(turn['answer'], results[:1])
+                    history.append({'Q': turn['question'], 'A': turn['answer']})
+            if not turns_run:
+                continue
+            report[variant][name] = {
+                'turns': turns_run,
+                'brand_hit_rate': round(brand_hits / brand_turns, 3) if brand_turns else None,
+                'answer_hit_rate': round(answer_hits / turns_run, 3),
+                'p50_ms': round(statistics.median(latencies), 3),
+                'p95_ms': round(percentile(latencies, 0.95), 3),
+                'avg_query_length': round(statistics.mean(query_lengths), 1)
+            }
+
+    print(json.dumps(report, indent=4))
+
+if __name__ == '__main__':
+    main()